@@ -0,0 +1,348 @@
+"""
+Catalogue of built data cubes and the RO-Crate describing them.
+
+The cube metadata table of BMD-crate.ipynb (one row per cube) is kept as a
+Delta Lake table partitioned by n2k_site_code and cube_version, so that:
+
+- Writes are merges on cube_id. Rows whose content is unchanged are not
+  rewritten, and each changed row is stamped with updated_at.
+- Queries ("cubes for site X covering 2015-2020 with layer gbif") become
+  filter expressions on the table's pyarrow dataset. Site and version
+  filters prune whole partitions, and period and updated_at filters are
+  checked against per-file statistics before any data is read. Only the
+  requested columns are decoded.
+
+CrateWriter keeps an RO-Crate in sync with the catalogue incrementally.
+Each cube's entities (the cube Dataset, its layers and its DataDownload)
+are stored as a fragment file. A sync regenerates fragments only for
+cubes updated since the previous sync and drops those of removed cubes.
+It then streams ro-crate-metadata.json from the fragments, never holding
+the whole graph in memory.
+
+Requires the 'deltalake' and 'pyarrow' packages (imported on first use).
+"""
+
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+PARTITION_COLUMNS = ("n2k_site_code", "cube_version")
+REQUIRED_COLUMNS = ("cube_id", "n2k_site_code", "cube_version")
+# Text columns of BMD-crate.ipynb; layer_metadata is stored as JSON text
+TEXT_COLUMNS = (
+    "cube_id", "n2k_site_code", "cube_dir", "cube_version", "workflow_version", "spatial_method",
+    "bbox", "polygon_wkt", "start_year", "end_year", "layers", "layer_metadata", "output_file",
+    "provenance_remark",
+)
+RO_CRATE_CONTEXT = ["https://w3id.org/ro/crate/1.1/context", {"prov": "http://www.w3.org/ns/prov#"}]
+CRATE_FILE = "ro-crate-metadata.json"
+STATE_FILE = "catalogue-sync.json"
+SCAN_BATCH_ROWS = 4096
+
+def _require():
+    if any(importlib.util.find_spec(name) is None for name in ("deltalake", "pyarrow")):
+        raise RuntimeError("The cube catalogue requires the 'deltalake' and 'pyarrow' packages")
+
+def _schema():
+    import pyarrow as pa
+    return pa.schema([(name, pa.string()) for name in TEXT_COLUMNS]
+                     + [("entry_hash", pa.string()), ("updated_at", pa.timestamp("us", tz="UTC"))])
+
+def _period_end(value: str) -> str:
+    """Largest date string within a 'YYYY' or 'YYYY-MM' period, for string comparison."""
+    return value + {4: "-12-31", 7: "-31"}.get(len(value), "")
+
+def catalogue_row(cube: dict) -> dict:
+    """A cube entry (as in BMD-crate.ipynb) as a catalogue row, without updated_at."""
+    missing = [column for column in REQUIRED_COLUMNS if not cube.get(column)]
+    if missing:
+        raise ValueError(f"Cube entry lacks {', '.join(missing)}")
+    unknown = set(cube) - set(TEXT_COLUMNS) - {"entry_hash", "updated_at"}
+    if unknown:
+        raise ValueError(f"Unknown cube columns: {', '.join(sorted(unknown))}")
+    row = {}
+    for column in TEXT_COLUMNS:
+        value = cube.get(column)
+        if column == "layers" and isinstance(value, (list, tuple)):
+            value = ",".join(value)
+        elif column == "layer_metadata" and value is not None and not isinstance(value, str):
+            value = json.dumps(value, sort_keys=True, ensure_ascii=False)
+        row[column] = None if value is None else str(value)
+    for column in ("start_year", "end_year"):
+        if row[column] and not re.fullmatch(r"\d{4}(-\d{2})?", row[column]):
+            raise ValueError(f"{column} must be YYYY or YYYY-MM, got {row[column]!r}")
+    row["entry_hash"] = hashlib.sha256(
+        json.dumps(row, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return row
+
+def cube_from_row(row: dict) -> dict:
+    """A catalogue row back in the BMD-crate.ipynb shape (layer_metadata as a dict)."""
+    cube = dict(row)
+    if isinstance(cube.get("layer_metadata"), str):
+        cube["layer_metadata"] = json.loads(cube["layer_metadata"])
+    return cube
+
+def cube_filter(site_code: Optional[str] = None, cube_version: Optional[str] = None,
+                period: Optional[Tuple[str, str]] = None, layer: Optional[str] = None,
+                updated_since: Optional[datetime] = None):
+    """
+    pyarrow filter expression for a catalogue query (None for all rows).
+    period=(start, end) ('YYYY' or 'YYYY-MM') selects cubes overlapping it.
+    """
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    terms = []
+    if site_code is not None:
+        terms.append(ds.field("n2k_site_code") == site_code)
+    if cube_version is not None:
+        terms.append(ds.field("cube_version") == cube_version)
+    if period is not None:
+        start, end = period
+        terms.append(ds.field("start_year") <= _period_end(end))
+        # Stored periods are YYYY or YYYY-MM; compare against the end of the
+        # stored period, as a bare '2015' sorts before '2015-06'
+        end_year = ds.field("end_year")
+        suffix = pc.if_else(pc.equal(pc.utf8_length(end_year), 4), "-12-31", "-31")
+        terms.append(pc.binary_join_element_wise(end_year, suffix, "") >= start)
+    if layer is not None:
+        terms.append(pc.match_substring_regex(ds.field("layers"), f"(^|,)\\s*{re.escape(layer)}\\s*(,|$)"))
+    if updated_since is not None:
+        terms.append(ds.field("updated_at") > updated_since)
+    expression = None
+    for term in terms:
+        expression = term if expression is None else expression & term
+    return expression
+
+class CubeCatalogue:
+    """The cube metadata Delta table at path."""
+
+    def __init__(self, path: Path):
+        _require()
+        self.path = str(path)
+
+    def _table(self):
+        from deltalake import DeltaTable
+        return DeltaTable(self.path) if DeltaTable.is_deltatable(self.path) else None
+
+    def version(self) -> Optional[int]:
+        table = self._table()
+        return None if table is None else table.version()
+
+    def scan(self, columns: Optional[List[str]] = None, **filters) -> Iterator:
+        """pyarrow RecordBatches of the rows matching filters (see cube_filter)."""
+        table = self._table()
+        if table is None:
+            return
+        dataset = table.to_pyarrow_dataset()
+        yield from dataset.to_batches(columns=columns, filter=cube_filter(**filters),
+                                      batch_size=SCAN_BATCH_ROWS)
+
+    def query(self, columns: Optional[List[str]] = None, **filters) -> Iterator[dict]:
+        """Matching cubes as dicts in the BMD-crate.ipynb shape."""
+        for batch in self.scan(columns, **filters):
+            for row in batch.to_pylist():
+                yield cube_from_row(row)
+
+    def _hashes(self, rows: List[dict]) -> Dict[str, str]:
+        """Stored entry_hash per cube_id, reading only the incoming rows' sites."""
+        import pyarrow.dataset as ds
+        table = self._table()
+        if table is None:
+            return {}
+        ids = sorted({row["cube_id"] for row in rows})
+        sites = sorted({row["n2k_site_code"] for row in rows})
+        expression = ds.field("cube_id").isin(ids) & ds.field("n2k_site_code").isin(sites)
+        found = table.to_pyarrow_dataset().to_table(columns=["cube_id", "entry_hash"], filter=expression)
+        return dict(zip(found.column("cube_id").to_pylist(), found.column("entry_hash").to_pylist()))
+
+    def upsert(self, cubes: Iterable[dict]) -> int:
+        """
+        Insert or replace cubes by cube_id; returns how many rows changed.
+        Stored hashes are looked up under the incoming rows' sites only, so
+        a cube moved to another site is simply rewritten.
+        """
+        import pyarrow as pa
+        from deltalake import write_deltalake
+        rows = {}
+        for cube in cubes:
+            row = catalogue_row(cube)
+            rows[row["cube_id"]] = row
+        stored = self._hashes(list(rows.values()))
+        changed = [row for cube_id, row in rows.items() if stored.get(cube_id) != row["entry_hash"]]
+        if not changed:
+            return 0
+        now = datetime.now(timezone.utc)
+        for row in changed:
+            row["updated_at"] = now
+        source = pa.Table.from_pylist(changed, schema=_schema())
+
+        table = self._table()
+        if table is None:
+            write_deltalake(self.path, source, partition_by=list(PARTITION_COLUMNS), mode="append")
+        else:
+            (table.merge(source, predicate="t.cube_id = s.cube_id", source_alias="s", target_alias="t")
+                  .when_matched_update_all()
+                  .when_not_matched_insert_all()
+                  .execute())
+        return len(changed)
+
+    def remove(self, cube_ids: Iterable[str]) -> int:
+        """Delete cubes by cube_id; returns how many rows were deleted."""
+        table = self._table()
+        ids = sorted(set(cube_ids))
+        if table is None or not ids:
+            return 0
+        quoted = ", ".join("'" + cube_id.replace("'", "''") + "'" for cube_id in ids)
+        metrics = table.delete(f"cube_id IN ({quoted})")
+        return int(metrics.get("num_deleted_rows", 0))
+
+    def compact(self):
+        """Merge the small files left by many incremental upserts."""
+        table = self._table()
+        if table is not None:
+            table.optimize.compact()
+
+# --- RO-Crate ------------------------------------------------------------------
+
+def cube_entities(cube: dict) -> List[dict]:
+    """Flattened RO-Crate entities for one cube (the structure of BMD-crate.ipynb)."""
+    cube_id = cube["cube_id"]
+    layers = cube.get("layer_metadata") or {}
+    entities = [{
+        "@id": cube_id,
+        "@type": "Dataset",
+        "name": cube_id,
+        "version": cube["cube_version"],
+        "spatialCoverage": {"@id": f"site:{cube['n2k_site_code']}"},
+        "temporalCoverage": f"{cube.get('start_year') or '..'}/{cube.get('end_year') or '..'}",
+        "distribution": {"@id": f"dist:{cube_id}"},
+        "hasPart": [{"@id": f"layer:{cube_id}:{name}"} for name in layers],
+    }]
+    if cube.get("updated_at"):
+        entities[0]["dateModified"] = cube["updated_at"].isoformat()
+    if cube.get("provenance_remark"):
+        entities[0]["description"] = cube["provenance_remark"]
+    if cube.get("workflow_version"):
+        entities[0]["prov:wasGeneratedBy"] = {"@id": f"workflow:{cube['workflow_version']}"}
+    entities.append({
+        "@id": f"dist:{cube_id}",
+        "@type": "DataDownload",
+        "encodingFormat": "text/csv",
+        "contentUrl": f"{cube.get('cube_dir') or ''}{cube.get('output_file') or ''}",
+    })
+    for name, meta in layers.items():
+        entities.append({
+            "@id": f"layer:{cube_id}:{name}",
+            "@type": "Dataset",
+            "name": name,
+            "additionalProperty": [{"@type": "PropertyValue", "name": k, "value": str(v)}
+                                   for k, v in meta.items()],
+        })
+    return entities
+
+def _fragment_name(cube_id: str) -> str:
+    """Filesystem-safe, collision-free file name for a cube's fragment."""
+    safe = re.sub(r"[^A-Za-z0-9._-]", "_", cube_id)[:80]
+    return f"{safe}-{hashlib.sha1(cube_id.encode('utf-8')).hexdigest()[:10]}.json"
+
+class CrateWriter:
+    """
+    RO-Crate for a catalogue in directory: ro-crate-metadata.json, assembled
+    from per-cube fragments in directory/fragments, and the sync state.
+    """
+
+    def __init__(self, catalogue: CubeCatalogue, directory: Path, name: str = "BMD Data Cube Package"):
+        self.catalogue = catalogue
+        self.directory = Path(directory)
+        self.fragments = self.directory / "fragments"
+        self.name = name
+
+    def _read_state(self) -> dict:
+        try:
+            return json.loads((self.directory / STATE_FILE).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _write_atomic(self, path: Path, write):
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def sync(self, full: bool = False) -> Dict[str, int]:
+        """
+        Bring the crate up to date with the catalogue; returns counts of
+        regenerated ('changed') and dropped ('removed') cubes and the total.
+        full=True regenerates every fragment.
+        """
+        self.fragments.mkdir(parents=True, exist_ok=True)
+        state = {} if full else self._read_state()
+        since = state.get("updated_at")
+        watermark = datetime.fromisoformat(since) if since else None
+
+        changed = 0
+        for cube in self.catalogue.query(updated_since=watermark):
+            entities = cube_entities(cube)
+            self._write_atomic(self.fragments / _fragment_name(cube["cube_id"]),
+                               lambda f: json.dump(entities, f, ensure_ascii=False))
+            if watermark is None or cube["updated_at"] > watermark:
+                watermark = cube["updated_at"]
+            changed += 1
+
+        live = {}   # fragment name -> (cube_id, site code)
+        for batch in self.catalogue.scan(columns=["cube_id", "n2k_site_code"]):
+            for cube_id, site in zip(batch.column("cube_id").to_pylist(),
+                                     batch.column("n2k_site_code").to_pylist()):
+                live[_fragment_name(cube_id)] = (cube_id, site)
+        removed = 0
+        for path in self.fragments.glob("*.json"):
+            if path.name not in live:
+                path.unlink()
+                removed += 1
+
+        if changed or removed or full or not (self.directory / CRATE_FILE).exists():
+            self._write_atomic(self.directory / CRATE_FILE, lambda f: self._stream_crate(f, live))
+        state = {"updated_at": watermark.isoformat() if watermark else None,
+                 "table_version": self.catalogue.version()}
+        self._write_atomic(self.directory / STATE_FILE, lambda f: json.dump(state, f))
+        return {"changed": changed, "removed": removed, "cubes": len(live)}
+
+    def _stream_crate(self, f, live: Dict[str, Tuple[str, str]]):
+        """Write the crate graph one fragment at a time."""
+        fragment_names = sorted(live)
+        cube_ids = [live[name][0] for name in fragment_names]
+        sites = {site for _, site in live.values()}
+
+        f.write('{"@context": ' + json.dumps(RO_CRATE_CONTEXT) + ', "@graph": [\n')
+        f.write(json.dumps({"@id": CRATE_FILE, "@type": "CreativeWork", "about": {"@id": "./"},
+                            "conformsTo": {"@id": "https://w3id.org/ro/crate/1.1"}}))
+        f.write(",\n" + json.dumps({"@id": "./", "@type": "Dataset", "name": self.name,
+                                    "hasPart": [{"@id": cube_id} for cube_id in cube_ids]},
+                                   ensure_ascii=False))
+        for site in sorted(sites):
+            f.write(",\n" + json.dumps({"@id": f"site:{site}", "@type": "Place", "identifier": site,
+                                        "name": f"Natura2000 Site {site}"}, ensure_ascii=False))
+        workflows = set()
+        for name in fragment_names:
+            with open(self.fragments / name, encoding="utf-8") as fragment:
+                entities = json.load(fragment)
+            for entity in entities:
+                f.write(",\n" + json.dumps(entity, ensure_ascii=False))
+                generated_by = entity.get("prov:wasGeneratedBy")
+                if generated_by:
+                    workflows.add(generated_by["@id"])
+        for workflow in sorted(workflows):
+            f.write(",\n" + json.dumps({"@id": workflow, "@type": "SoftwareApplication",
+                                        "name": workflow.split(":", 1)[1]}, ensure_ascii=False))
+        f.write("\n]}\n")
@@ -0,0 +1,433 @@
+"""
+Chunked, lazily read storage for BMD data cubes.
+
+Cubes follow the datatree layout in datatree.md: dense 'static/chelsa_*'
+and 'dynamic/chelsa_month' groups on a lat/long grid, and the sparse
+'dynamic/gbif_occurences' group (COO 'coords'/'data' over specieskey, ...,
+eeacellcode, time). They are stored as Zarr v2 directory stores, written
+directly with NumPy and zlib, so the files open with zarr or
+xarray.open_zarr / open_datatree(engine="zarr") while neither is required
+here:
+
+- One store per site (e.g. 'AT1101112.zarr'), so chunks never mix sites.
+  Dense variables are chunked by time (CHUNKS['time'] steps, a year of
+  months) and by spatial tiles (CHUNKS['lat'] x CHUNKS['long']).
+- The GBIF entries are sorted by time, then cell, before being chunked
+  along nnz, and a 'time_offsets' array records where each time step
+  starts, so a time range maps to one contiguous run of chunks.
+- Consolidated metadata (.zmetadata) lets a store open with one read.
+
+Reading is lazy: LazyArray slices read and decompress only the chunks they
+overlap. subset() and subset_gbif() cut a group to a site polygon (WKT, as
+'polygon_wkt' in BMD-crate.ipynb) and a time range, touching only the
+chunks inside the polygon's bounding box and the time range.
+"""
+
+import itertools
+import json
+import os
+import re
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from eea_grid import cell_centres
+
+# Chunk length per dimension; dimensions not listed are stored unchunked
+CHUNKS = {"time": 12, "months": 12, "month": 12, "lat": 64, "long": 64, "nnz": 65536}
+COMPRESSION_LEVEL = 1
+GBIF_VARIABLES = {"coords", "data", "shape", "dims"}
+POINT_BLOCK = 1 << 22   # polygon edge x point comparisons per block
+
+# --- Site polygons -----------------------------------------------------------
+
+def parse_wkt(wkt: str) -> List[np.ndarray]:
+    """Rings ((n, 2) lon/lat arrays) of a WKT POLYGON or MULTIPOLYGON."""
+    match = re.match(r"^\s*(MULTIPOLYGON|POLYGON)\s*(\(.*\))\s*$", wkt, re.IGNORECASE | re.DOTALL)
+    if not match:
+        raise ValueError("Only POLYGON and MULTIPOLYGON WKT is supported")
+    rings = []
+    for ring in re.findall(r"\(([^()]+)\)", match.group(2)):
+        try:
+            points = np.array([[float(v) for v in point.split()[:2]] for point in ring.split(",")])
+        except ValueError:
+            raise ValueError(f"Invalid WKT coordinates: {ring.strip()[:40]}")
+        if len(points) < 4:
+            raise ValueError("WKT rings need at least four points")
+        rings.append(points)
+    if not rings:
+        raise ValueError("WKT polygon has no rings")
+    return rings
+
+def polygon_bounds(rings: Sequence[np.ndarray]) -> Tuple[float, float, float, float]:
+    """(min lon, min lat, max lon, max lat)."""
+    points = np.concatenate(rings)
+    return points[:, 0].min(), points[:, 1].min(), points[:, 0].max(), points[:, 1].max()
+
+def points_in_polygon(lon, lat, rings: Sequence[np.ndarray]) -> np.ndarray:
+    """Even-odd test of points against all rings (holes and multipolygons included)."""
+    lon, lat = np.broadcast_arrays(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+    x, y = lon.ravel(), lat.ravel()
+    inside = np.zeros(x.size, dtype=bool)
+    for ring in rings:
+        x1, y1 = ring[:-1, 0:1], ring[:-1, 1:2]
+        x2, y2 = ring[1:, 0:1], ring[1:, 1:2]
+        block = max(1, POINT_BLOCK // len(x1))
+        for start in range(0, x.size, block):
+            px, py = x[start:start + block], y[start:start + block]
+            crosses = (y1 > py) != (y2 > py)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                at_x = (x2 - x1) * (py - y1) / (y2 - y1) + x1
+            inside[start:start + block] ^= (np.count_nonzero(crosses & (px < at_x), axis=0) % 2).astype(bool)
+    return inside.reshape(lon.shape)
+
+# --- Writing -----------------------------------------------------------------
+
+def _fill_value(dtype: np.dtype):
+    if dtype.kind == "f":
+        return "NaN"
+    if dtype.kind in "iub":
+        return 0
+    return None
+
+def _write_json(path: Path, document: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+
+def _chunk_shape(dims: Sequence[str], shape: Sequence[int], chunks: Dict[str, int]) -> List[int]:
+    return [max(1, min(int(chunks.get(dim, length)), length)) if length else 1
+            for dim, length in zip(dims, shape)]
+
+def write_array(group_dir: Path, name: str, source, dims: Sequence[str],
+                chunks: Optional[Dict[str, int]] = None, attrs: Optional[dict] = None):
+    """Write an array chunk by chunk; source may be any sliceable array (NumPy, xarray, netCDF4)."""
+    chunks = {**CHUNKS, **(chunks or {})}
+    shape = tuple(int(n) for n in source.shape)
+    dtype = np.dtype(source.dtype)
+    chunk_shape = _chunk_shape(dims, shape, chunks)
+    array_dir = Path(group_dir) / name
+    _write_json(array_dir / ".zarray", {
+        "zarr_format": 2,
+        "shape": list(shape),
+        "chunks": chunk_shape,
+        "dtype": dtype.str,
+        "compressor": {"id": "zlib", "level": COMPRESSION_LEVEL},
+        "fill_value": _fill_value(dtype),
+        "order": "C",
+        "filters": None,
+        "dimension_separator": ".",
+    })
+    _write_json(array_dir / ".zattrs", {"_ARRAY_DIMENSIONS": list(dims), **(attrs or {})})
+
+    grid = [range(-(-n // c)) if n else range(1) for n, c in zip(shape, chunk_shape)]
+    for index in itertools.product(*grid):
+        slices = tuple(slice(i * c, min((i + 1) * c, n)) for i, c, n in zip(index, chunk_shape, shape))
+        block = np.asarray(source[slices] if shape else source, dtype=dtype)
+        if block.shape != tuple(chunk_shape[:len(shape)]):
+            padded = np.zeros(chunk_shape, dtype=dtype)
+            if dtype.kind == "f":
+                padded[...] = np.nan
+            padded[tuple(slice(0, n) for n in block.shape)] = block
+            block = padded
+        key = ".".join(str(i) for i in index) or "0"
+        with open(array_dir / key, "wb") as f:
+            f.write(zlib.compress(np.ascontiguousarray(block).tobytes(), COMPRESSION_LEVEL))
+
+def write_group(root: Path, group: str, coords: Dict[str, object], variables: Dict[str, tuple],
+                chunks: Optional[Dict[str, int]] = None, attrs: Optional[dict] = None):
+    """Write a dense group: coords {dim: 1-D values}, variables {name: (dims, array)}."""
+    group_dir = Path(root) / group
+    _write_json(group_dir / ".zgroup", {"zarr_format": 2})
+    _write_json(group_dir / ".zattrs", attrs or {})
+    for name, values in coords.items():
+        write_array(group_dir, name, np.asarray(values), [name], chunks={name: len(values)})
+    for name, (dims, source) in variables.items():
+        write_array(group_dir, name, source, dims, chunks)
+
+def write_gbif_group(root: Path, group: str, coords, data, shape, dims: Sequence[str],
+                     coord_values: Dict[str, object], chunks: Optional[Dict[str, int]] = None,
+                     attrs: Optional[dict] = None):
+    """Write the sparse occurrence group, sorted by (time, eeacellcode) with a time index."""
+    dims = [str(d) for d in dims]
+    coords, data = np.asarray(coords), np.asarray(data)
+    time_dim, cell_dim = dims.index("time"), dims.index("eeacellcode")
+    order = np.lexsort((coords[cell_dim], coords[time_dim]))
+    coords, data = coords[:, order], data[order]
+    n_time = int(np.asarray(shape)[time_dim])
+    time_offsets = np.searchsorted(coords[time_dim], np.arange(n_time + 1)).astype(np.int64)
+
+    group_dir = Path(root) / group
+    _write_json(group_dir / ".zgroup", {"zarr_format": 2})
+    _write_json(group_dir / ".zattrs", {"__orig_var_name__": "occurrences",
+                                       "bmd:sorted_by": ["time", "eeacellcode"], **(attrs or {})})
+    for name, values in coord_values.items():
+        write_array(group_dir, name, np.asarray(values), [name], chunks={name: len(values)})
+    write_array(group_dir, "coords", coords, ["ndim", "nnz"], chunks)
+    write_array(group_dir, "data", data, ["nnz"], chunks)
+    write_array(group_dir, "shape", np.asarray(shape, dtype=np.int64), ["ndim"])
+    write_array(group_dir, "dims", np.asarray(dims), ["ndim"])
+    write_array(group_dir, "time_offsets", time_offsets, ["time_offset"])
+
+def _dataset_parts(dataset) -> Tuple[Dict[str, object], Dict[str, tuple], dict]:
+    """(coords, variables, attrs) of an xarray Dataset or a {'coords', 'data_vars', 'attrs'} dict."""
+    if isinstance(dataset, dict):
+        return dataset.get("coords", {}), dataset.get("data_vars", {}), dataset.get("attrs", {})
+    coords = {name: dataset.coords[name].values for name in dataset.coords}
+    variables = {name: (list(var.dims), var.variable) for name, var in dataset.data_vars.items()}
+    return coords, variables, dict(dataset.attrs)
+
+def write_datatree(path: Path, tree, chunks: Optional[Dict[str, int]] = None,
+                   attrs: Optional[dict] = None) -> Path:
+    """Write a cube to a Zarr store at path.
+
+    tree is an xarray DataTree (as returned by open_datatree) or a dict
+    {'static/chelsa_clim_ref_period': dataset, ...} of xarray Datasets or
+    {'coords': {...}, 'data_vars': {name: (dims, array)}, 'attrs': {...}} dicts.
+    Dense variables are read from their source one chunk at a time.
+    """
+    root = Path(path)
+    if isinstance(tree, dict):
+        groups = tree
+    else:
+        groups = {node.path.strip("/"): node.ds for node in tree.subtree if node.ds.variables}
+    _write_json(root / ".zgroup", {"zarr_format": 2})
+    _write_json(root / ".zattrs", attrs or {})
+    for group, dataset in groups.items():
+        coords, variables, group_attrs = _dataset_parts(dataset)
+        parents = group.split("/")[:-1]
+        for depth in range(1, len(parents) + 1):
+            parent = root.joinpath(*parents[:depth])
+            if not (parent / ".zgroup").exists():
+                _write_json(parent / ".zgroup", {"zarr_format": 2})
+        if GBIF_VARIABLES <= set(variables):
+            write_gbif_group(root, group, *(np.asarray(variables[name][1]) for name in ("coords", "data", "shape")),
+                             np.asarray(variables["dims"][1]), coords, chunks, group_attrs)
+        else:
+            write_group(root, group, coords, variables, chunks, group_attrs)
+    consolidate(root)
+    return root
+
+def consolidate(root: Path):
+    """Collect all metadata into root/.zmetadata (zarr's consolidated format)."""
+    root = Path(root)
+    metadata = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename in (".zgroup", ".zarray", ".zattrs"):
+                path = Path(dirpath) / filename
+                with open(path, encoding="utf-8") as f:
+                    metadata[path.relative_to(root).as_posix()] = json.load(f)
+    _write_json(root / ".zmetadata", {"zarr_consolidated_format": 1, "metadata": metadata})
+
+# --- Reading -----------------------------------------------------------------
+
+class LazyArray:
+    """A stored array; indexing with slices or integers reads only the chunks it overlaps."""
+
+    def __init__(self, path: Path, meta: dict, attrs: dict):
+        compressor = meta.get("compressor")
+        if compressor is not None and compressor.get("id") != "zlib":
+            raise ValueError(f"Unsupported compressor in {path}: {compressor['id']}")
+        if meta.get("filters"):
+            raise ValueError(f"Unsupported filters in {path}")
+        self.path = Path(path)
+        self.shape = tuple(meta["shape"])
+        self.chunks = tuple(meta["chunks"])
+        self.dtype = np.dtype(meta["dtype"])
+        self.compressed = compressor is not None
+        self.separator = meta.get("dimension_separator", ".")
+        self.fill_value = np.nan if meta.get("fill_value") == "NaN" else meta.get("fill_value")
+        self.dims = tuple(attrs.get("_ARRAY_DIMENSIONS", ()))
+        self.attrs = {k: v for k, v in attrs.items() if k != "_ARRAY_DIMENSIONS"}
+        self.chunk_reads = 0
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def _chunk(self, index: Tuple[int, ...]) -> np.ndarray:
+        key = self.separator.join(str(i) for i in index) or "0"
+        try:
+            with open(self.path / key, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            # Unwritten chunk: fill_value, else NaN for floats and zeros for other types
+            if self.fill_value is not None:
+                return np.full(self.chunks, self.fill_value, dtype=self.dtype)
+            if self.dtype.kind in "fc":
+                return np.full(self.chunks, np.nan, dtype=self.dtype)
+            return np.zeros(self.chunks, dtype=self.dtype)
+        self.chunk_reads += 1
+        if self.compressed:
+            raw = zlib.decompress(raw)
+        return np.frombuffer(raw, dtype=self.dtype).reshape(self.chunks)
+
+    def _normalise(self, key) -> Tuple[List[slice], List[bool]]:
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            at = key.index(Ellipsis)
+            key = key[:at] + (slice(None),) * (len(self.shape) - len(key) + 1) + key[at + 1:]
+        key = key + (slice(None),) * (len(self.shape) - len(key))
+        if len(key) > len(self.shape):
+            raise IndexError("Too many indices")
+        slices, dropped = [], []
+        for k, n in zip(key, self.shape):
+            if isinstance(k, (int, np.integer)):
+                k = int(k) + n if k < 0 else int(k)
+                if not 0 <= k < n:
+                    raise IndexError(f"Index {k} out of range for length {n}")
+                slices.append(slice(k, k + 1))
+                dropped.append(True)
+            elif isinstance(k, slice) and k.step in (None, 1):
+                start, stop, _ = k.indices(n)
+                slices.append(slice(start, max(start, stop)))
+                dropped.append(False)
+            else:
+                raise IndexError("Only integers and contiguous slices are supported")
+        return slices, dropped
+
+    def __getitem__(self, key) -> np.ndarray:
+        slices, dropped = self._normalise(key)
+        out = np.empty([s.stop - s.start for s in slices], dtype=self.dtype)
+        ranges = [range(s.start // c, -(-s.stop // c)) for s, c in zip(slices, self.chunks)]
+        for index in itertools.product(*ranges):
+            block = self._chunk(index)
+            source, target = [], []
+            for i, s, c in zip(index, slices, self.chunks):
+                lo, hi = max(s.start, i * c), min(s.stop, (i + 1) * c)
+                source.append(slice(lo - i * c, hi - i * c))
+                target.append(slice(lo - s.start, hi - s.start))
+            out[tuple(target)] = block[tuple(source)]
+        return out.reshape([n for n, d in zip(out.shape, dropped) if not d])
+
+    @property
+    def values(self) -> np.ndarray:
+        return self[...]
+
+class CubeGroup:
+    """A group of a cube store: 1-D coordinates (read eagerly) and lazy variables."""
+
+    def __init__(self, path: Path, arrays: Dict[str, LazyArray], attrs: dict):
+        self.path = path
+        self.attrs = attrs
+        self.coords = {name: array.values for name, array in arrays.items() if array.dims == (name,)}
+        self.variables = {name: array for name, array in arrays.items() if name not in self.coords}
+
+    def __getitem__(self, name: str) -> LazyArray:
+        return self.variables[name]
+
+    @property
+    def chunk_reads(self) -> int:
+        return sum(array.chunk_reads for array in self.variables.values())
+
+class CubeStore:
+    """Read side of a Zarr cube store written by write_datatree."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        consolidated = self.path / ".zmetadata"
+        if consolidated.exists():
+            with open(consolidated, encoding="utf-8") as f:
+                self.metadata = json.load(f)["metadata"]
+        else:
+            self.metadata = {}
+            for path in self.path.rglob(".z*"):
+                with open(path, encoding="utf-8") as f:
+                    self.metadata[path.relative_to(self.path).as_posix()] = json.load(f)
+
+    @property
+    def attrs(self) -> dict:
+        return self.metadata.get(".zattrs", {})
+
+    def groups(self) -> List[str]:
+        """Paths of the groups holding arrays, e.g. 'static/chelsa_clim_ref_period'."""
+        parents = {key.rsplit("/", 2)[0] for key in self.metadata if key.endswith("/.zarray") and key.count("/") >= 2}
+        return sorted(parents)
+
+    def group(self, group: str) -> CubeGroup:
+        group = group.strip("/")
+        prefix = f"{group}/"
+        arrays = {}
+        for key, meta in self.metadata.items():
+            if key.startswith(prefix) and key.endswith("/.zarray"):
+                name = key[len(prefix):-len("/.zarray")]
+                if "/" not in name:
+                    attrs = self.metadata.get(f"{prefix}{name}/.zattrs", {})
+                    arrays[name] = LazyArray(self.path / group / name, meta, attrs)
+        if not arrays:
+            raise KeyError(f"No group '{group}' in {self.path}")
+        return CubeGroup(group, arrays, self.metadata.get(f"{prefix}.zattrs", {}))
+
+# --- Subsetting --------------------------------------------------------------
+
+def _time_window(times: np.ndarray, time_range: Tuple[str, str]) -> slice:
+    """Indices of times within [start, end]; end is inclusive at its own precision ('2025-09')."""
+    start, end = (np.datetime64(t) for t in time_range)
+    end = end + np.timedelta64(1, np.datetime_data(end.dtype)[0])
+    first = int(np.searchsorted(times, start, side="left"))
+    last = int(np.searchsorted(times, end, side="left"))
+    return slice(first, max(first, last))
+
+def _axis_window(centres: np.ndarray, low: float, high: float) -> slice:
+    inside = np.flatnonzero((centres >= low) & (centres <= high))
+    if inside.size == 0:
+        return slice(0, 0)
+    return slice(int(inside.min()), int(inside.max()) + 1)
+
+def subset(group: CubeGroup, polygon_wkt: Optional[str] = None, time_range: Optional[Tuple[str, str]] = None,
+           variables: Optional[Iterable[str]] = None) -> dict:
+    """Cut a dense group to a polygon's bounding window and a time range.
+
+    Returns {'coords': {dim: values}, 'variables': {name: (dims, array)},
+    'mask': (lat, long) bool array of grid cells whose centres fall inside
+    the polygon, or None}. Only the chunks overlapping the window are read.
+    """
+    window: Dict[str, slice] = {}
+    mask = None
+    if time_range is not None and "time" in group.coords:
+        window["time"] = _time_window(group.coords["time"], time_range)
+    if polygon_wkt is not None:
+        if "lat" not in group.coords or "long" not in group.coords:
+            raise ValueError(f"Group {group.path} has no lat/long grid")
+        rings = parse_wkt(polygon_wkt)
+        min_lon, min_lat, max_lon, max_lat = polygon_bounds(rings)
+        window["lat"] = _axis_window(group.coords["lat"], min_lat, max_lat)
+        window["long"] = _axis_window(group.coords["long"], min_lon, max_lon)
+        lon_grid, lat_grid = np.meshgrid(group.coords["long"][window["long"]], group.coords["lat"][window["lat"]])
+        mask = points_in_polygon(lon_grid, lat_grid, rings)
+
+    names = list(variables) if variables is not None else list(group.variables)
+    selected = {}
+    for name in names:
+        array = group.variables[name]
+        selected[name] = (array.dims, array[tuple(window.get(dim, slice(None)) for dim in array.dims)])
+    coords = {dim: values[window[dim]] if dim in window else values for dim, values in group.coords.items()}
+    return {"coords": coords, "variables": selected, "mask": mask}
+
+def subset_gbif(group: CubeGroup, polygon_wkt: Optional[str] = None,
+                time_range: Optional[Tuple[str, str]] = None) -> dict:
+    """Sparse occurrences within a polygon (by EEA cell centre) and a time range.
+
+    Returns {'coords': (ndim, n) indices into the full coordinates, 'data': (n,),
+    'dims', 'shape', 'coord_values'}. The time range is resolved through
+    'time_offsets', so only the chunks of that range are read.
+    """
+    dims = [str(d) for d in group["dims"].values]
+    offsets = group["time_offsets"].values
+    if time_range is not None:
+        times = _time_window(group.coords["time"], time_range)
+        start, stop = int(offsets[times.start]), int(offsets[times.stop])
+    else:
+        start, stop = 0, int(offsets[-1])
+    coords = group["coords"][:, start:stop]
+    data = group["data"][start:stop]
+    if polygon_wkt is not None:
+        lon, lat = cell_centres(group.coords["eeacellcode"])
+        inside_cells = points_in_polygon(lon, lat, parse_wkt(polygon_wkt))
+        keep = inside_cells[coords[dims.index("eeacellcode")].astype(np.intp)]
+        coords, data = coords[:, keep], data[keep]
+    return {"coords": coords, "data": data, "dims": dims,
+            "shape": group["shape"].values, "coord_values": group.coords}
@@ -0,0 +1,378 @@
+"""
+Local job engine behind the draft data cube API (API/bmd-datacube-engine-api.yaml).
+
+POST /sites/{siteCode}/datacubes submits a DataCubeRequest; builds run as
+jobs that clients poll at /datacubes/{jobId} and collect from
+/datacubes/{jobId}/result as a STAC Item.
+
+- Idempotency: a request is keyed by a hash of its site code and canonical
+  JSON (callbackUrl excluded). Identical requests share one job while it is
+  queued, running or succeeded; a failed job is retried by the next POST.
+  The callbackUrls of requests joining a pending job are all notified.
+- Fast path: cubes are kept in a CubeStore on disk under the same key, so a
+  request for an already built cube is answered with 200 and a succeeded
+  job, without queueing, even after a restart.
+- Builds run on a process pool. Builders report progress through a queue
+  shared with the workers; the engine applies it to the job documents.
+  The number of concurrent builds and the queue depth are configurable, and
+  a full queue raises EngineBusy instead of growing without bound.
+
+Builders are module-level functions registered in BUILDERS (they must be
+importable by the worker processes). 'stub' writes a placeholder cube after
+a configurable delay, for tests and load tests.
+"""
+
+import asyncio
+import hashlib
+import ipaddress
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from bmd_common import profiling
+
+DEFAULT_CUBE_DIR = Path.home() / ".bmd_datacubes"
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_DEPTH = 100
+MAX_JOBS = 10000   # jobs kept in memory for polling (finished ones are dropped first)
+STUB_STEPS = 10
+
+# Builder signature: (site_code, request, output_dir, progress, **options) -> STAC Item
+Builder = Callable[..., dict]
+
+class EngineBusy(RuntimeError):
+    """The job queue is full."""
+
+def validate_callback_url(url: str) -> str:
+    """Reject callback URLs that would make the service call itself or its network."""
+    parts = urllib.parse.urlsplit(url)
+    host = (parts.hostname or "").rstrip(".").lower()
+    if parts.scheme not in ("http", "https") or not host:
+        raise ValueError("'callbackUrl' must be an absolute http(s) URL")
+    if host == "localhost" or host.endswith(".localhost"):
+        raise ValueError("'callbackUrl' must not point to localhost")
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return url
+    if not address.is_global:
+        raise ValueError("'callbackUrl' must not point to a private or reserved address")
+    return url
+
+def validate_request(request) -> dict:
+    """Check a DataCubeRequest body; returns it normalised, raises ValueError."""
+    if not isinstance(request, dict):
+        raise ValueError("DataCubeRequest must be a JSON object")
+    variables = request.get("variables")
+    if (not isinstance(variables, list) or not variables
+            or not all(isinstance(v, str) and v for v in variables)):
+        raise ValueError("'variables' must be a non-empty list of strings")
+    temporal = request.get("temporalRange")
+    if not isinstance(temporal, dict):
+        raise ValueError("'temporalRange' must be an object with 'start' and 'end'")
+    try:
+        start = date.fromisoformat(temporal.get("start"))
+        end = date.fromisoformat(temporal.get("end"))
+    except (TypeError, ValueError):
+        raise ValueError("'temporalRange' start and end must be dates (YYYY-MM-DD)")
+    if end < start:
+        raise ValueError("'temporalRange' end is before start")
+    normalised = {
+        "variables": sorted(set(variables)),
+        "temporalRange": {"start": start.isoformat(), "end": end.isoformat()},
+    }
+    for name in ("spatialResolution", "callbackUrl"):
+        value = request.get(name)
+        if value is not None:
+            if not isinstance(value, str):
+                raise ValueError(f"'{name}' must be a string")
+            normalised[name] = value
+    if "callbackUrl" in normalised:
+        validate_callback_url(normalised["callbackUrl"])
+    return normalised
+
+def request_key(site_code: str, request: dict) -> str:
+    """Content hash identifying the cube a (validated) request describes."""
+    content = {k: v for k, v in request.items() if k != "callbackUrl"}
+    canonical = json.dumps([site_code, content], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+
+@dataclass
+class Job:
+    job_id: str
+    site_code: str
+    key: str
+    request: dict
+    status: str = "queued"
+    progress: float = 0.0
+    created_at: str = field(default_factory=_utc_now)
+    error: Optional[str] = None
+    submitted: float = field(default_factory=time.perf_counter)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    callbacks: List[str] = field(default_factory=list)
+
+    def document(self) -> dict:
+        """DataCubeJob representation."""
+        return {
+            "jobId": self.job_id,
+            "siteCode": self.site_code,
+            "status": self.status,
+            "progress": round(self.progress, 3),
+            "createdAt": self.created_at,
+            "resultUrl": f"/datacubes/{self.job_id}/result",
+            "error": self.error,
+        }
+
+class CubeStore:
+    """Built cubes on disk: <directory>/<key>/ holds the cube files and item.json."""
+
+    def __init__(self, directory: Path = DEFAULT_CUBE_DIR):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, key: str) -> Path:
+        return self.directory / key
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            with open(self.path(key) / "item.json", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, item: dict):
+        path = self.path(key)
+        path.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path, prefix="item.json", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(item, f, ensure_ascii=False)
+            os.replace(tmp_path, path / "item.json")
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+def stub_builder(site_code: str, request: dict, output_dir: Path, progress: Callable[[float], None],
+                 seconds: float = 1.0) -> dict:
+    """Placeholder cube: sleeps for seconds in STUB_STEPS steps and writes a JSON manifest."""
+    for step in range(1, STUB_STEPS + 1):
+        time.sleep(seconds / STUB_STEPS)
+        progress(step / STUB_STEPS)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    data_path = output_dir / "cube.json"
+    with open(data_path, "w", encoding="utf-8") as f:
+        json.dump({"site_code": site_code, "request": request, "dims": ["time", "lat", "long"]}, f)
+    temporal = request["temporalRange"]
+    return {
+        "type": "Feature",
+        "stac_version": "1.0.0",
+        "id": f"{site_code}-{'-'.join(request['variables'])}-{temporal['start'][:4]}",
+        "collection": "bmd-datacubes",
+        "geometry": None,
+        "properties": {
+            "datetime": None,
+            "start_datetime": f"{temporal['start']}T00:00:00Z",
+            "end_datetime": f"{temporal['end']}T23:59:59Z",
+            "bmd:variables": request["variables"],
+            "bmd:spatial_resolution": request.get("spatialResolution"),
+        },
+        "assets": {"data": {"href": data_path.as_uri(), "type": "application/json", "roles": ["data"]}},
+        "links": [],
+    }
+
+BUILDERS: Dict[str, Builder] = {
+    "stub": stub_builder,
+}
+
+# Worker-process side: progress messages go back to the engine over this queue
+_progress_queue = None
+
+def _init_worker(queue):
+    global _progress_queue
+    _progress_queue = queue
+
+def _run_build(builder: str, job_id: str, site_code: str, request: dict, output_dir: str,
+               options: dict) -> dict:
+    def progress(fraction: float):
+        _progress_queue.put((job_id, min(max(float(fraction), 0.0), 1.0)))
+    return BUILDERS[builder](site_code, request, Path(output_dir), progress, **options)
+
+class DataCubeEngine:
+    """Async job queue in front of a process pool of cube builders.
+
+    Use as 'async with DataCubeEngine(...) as engine', or call start() and
+    close(). on_complete, if given, is awaited with each finished job (e.g. to
+    notify its callbackUrl).
+    """
+
+    def __init__(self, store: Optional[CubeStore] = None, builder: str = "stub",
+                 builder_options: Optional[dict] = None, workers: int = DEFAULT_WORKERS,
+                 queue_depth: int = DEFAULT_QUEUE_DEPTH,
+                 on_complete: Optional[Callable[[Job], Awaitable[None]]] = None):
+        if builder not in BUILDERS:
+            raise ValueError(f"Unknown cube builder '{builder}' (use one of: {', '.join(BUILDERS)})")
+        if workers < 1 or queue_depth < 1:
+            raise ValueError("workers and queue_depth must be at least 1")
+        self.store = store or CubeStore()
+        self.builder = builder
+        self.builder_options = builder_options or {}
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.on_complete = on_complete
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._by_key: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._progress = None
+        self._progress_thread: Optional[threading.Thread] = None
+        self._dispatchers = []
+        self._running = 0
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        context = multiprocessing.get_context("spawn")
+        self._progress = context.Queue()
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=context,
+                                         initializer=_init_worker, initargs=(self._progress,))
+        self._progress_thread = threading.Thread(target=self._read_progress, args=(loop,), daemon=True)
+        self._progress_thread.start()
+        self._queue = asyncio.Queue(self.queue_depth)
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self._dispatchers:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        if self._pool is not None:
+            await asyncio.to_thread(self._pool.shutdown, True, cancel_futures=True)
+        if self._progress is not None:
+            self._progress.put(None)
+            self._progress_thread.join()
+            self._progress.close()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _read_progress(self, loop: asyncio.AbstractEventLoop):
+        while True:
+            message = self._progress.get()
+            if message is None:
+                return
+            loop.call_soon_threadsafe(self._set_progress, *message)
+
+    def _set_progress(self, job_id: str, fraction: float):
+        job = self.jobs.get(job_id)
+        if job is not None and job.status == "running":
+            job.progress = max(job.progress, fraction)
+
+    def _remember(self, job: Job):
+        """Track a job, forgetting the oldest finished jobs once there are too many."""
+        self.jobs[job.job_id] = job
+        if len(self.jobs) <= MAX_JOBS:
+            return
+        excess = len(self.jobs) - MAX_JOBS * 9 // 10   # prune in batches, not on every submit
+        finished = [j for j in self.jobs.values() if j.status in ("succeeded", "failed")]
+        for old in finished[:excess]:
+            del self.jobs[old.job_id]
+            if self._by_key.get(old.key) is old:
+                del self._by_key[old.key]
+
+    def submit(self, site_code: str, request) -> Tuple[Job, bool]:
+        """Job for a DataCubeRequest and whether its cube is already built.
+
+        Raises ValueError for an invalid request, EngineBusy when the queue
+        is full and RuntimeError before start().
+        """
+        if self._queue is None:
+            raise RuntimeError("DataCubeEngine.submit() called before start()")
+        request = validate_request(request)
+        key = request_key(site_code, request)
+        callback = request.get("callbackUrl")
+        job = self._by_key.get(key)
+        if job is not None:
+            profiling.count("datacube_requests_total", outcome="deduplicated")
+            if callback and job.status in ("queued", "running") and callback not in job.callbacks:
+                job.callbacks.append(callback)
+            return job, job.status == "succeeded"
+
+        job = Job(uuid.uuid4().hex, site_code, key, request, callbacks=[callback] if callback else [])
+        if self.store.get(key) is not None:
+            job.status, job.progress, job.finished = "succeeded", 1.0, time.perf_counter()
+            profiling.count("datacube_requests_total", outcome="prebuilt")
+        else:
+            try:
+                self._queue.put_nowait(job)
+            except asyncio.QueueFull:
+                profiling.count("datacube_requests_total", outcome="rejected")
+                raise EngineBusy(f"Data cube queue is full ({self.queue_depth} jobs)")
+            profiling.count("datacube_requests_total", outcome="queued")
+        self._by_key[key] = job
+        self._remember(job)
+        return job, job.status == "succeeded"
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def result(self, job: Job) -> Optional[dict]:
+        """STAC Item of a succeeded job."""
+        return self.store.get(job.key) if job.status == "succeeded" else None
+
+    def stats(self) -> dict:
+        statuses = {}
+        for job in self.jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {"workers": self.workers, "queue_depth": self.queue_depth,
+                "queued": self._queue.qsize() if self._queue else 0,
+                "running": self._running, "jobs": statuses}
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            job.status, job.started = "running", time.perf_counter()
+            self._running += 1
+            profiling.observe("datacube_queue_seconds", job.started - job.submitted)
+            try:
+                item = await loop.run_in_executor(
+                    self._pool, _run_build, self.builder, job.job_id, job.site_code, job.request,
+                    str(self.store.path(job.key)), self.builder_options)
+                self.store.put(job.key, item)
+                job.status, job.progress = "succeeded", 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+                if self._by_key.get(job.key) is job:
+                    del self._by_key[job.key]
+                print(f"Data cube job {job.job_id} failed: {job.error}", file=sys.stderr)
+            finally:
+                self._running -= 1
+                job.finished = time.perf_counter()
+                self._queue.task_done()
+            profiling.observe("datacube_build_seconds", job.finished - job.started, status=job.status)
+            profiling.count("datacube_jobs_total", status=job.status)
+            if self.on_complete is not None:
+                try:
+                    await self.on_complete(job)
+                except Exception as e:
+                    print(f"Data cube job {job.job_id} notification failed: {e}", file=sys.stderr)
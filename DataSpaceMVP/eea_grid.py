@@ -0,0 +1,227 @@
+"""
+Vectorised EEA reference grid helpers for the GBIF cube layers.
+
+The GBIF occurrence cubes (see datatree.md, 'dynamic/gbif_occurences') are
+indexed by EEA reference grid cell codes such as '1kmE4012N3101': the cell
+size followed by the easting and northing of the cell's lower-left corner
+in ETRS89-LAEA (EPSG:3035), in units of the cell size. The climate layers
+('static/chelsa_*', 'dynamic/chelsa_month') use a regular lat/long grid.
+
+Everything here works on whole NumPy arrays, so a country-scale cube is
+decoded, projected and aggregated without Python-level loops:
+
+- decode_cellcodes / encode_cellcodes convert between codes and LAEA metres
+  at 100 m, 1 km and 10 km resolution; coarsen_cellcodes re-grids codes to
+  a coarser resolution.
+- laea_to_lonlat / lonlat_to_laea implement EPSG:3035 (GRS80 ellipsoid)
+  following IOGP Guidance Note 7-2, so pyproj is not needed.
+- aggregate_occurrences sums the sparse 'coords'/'data' occurrence arrays
+  onto the lat/long grid, optionally keeping dimensions such as time.
+"""
+
+from typing import Sequence, Tuple
+
+import numpy as np
+
+# Cell size prefix -> cell size in metres
+RESOLUTIONS = {"100m": 100, "1km": 1000, "10km": 10000}
+RESOLUTION_PREFIXES = {metres: prefix for prefix, metres in RESOLUTIONS.items()}
+
+# EPSG:3035 (ETRS89-LAEA Europe) on the GRS80 ellipsoid
+SEMI_MAJOR_AXIS = 6378137.0
+FLATTENING = 1 / 298.257222101
+LAT_ORIGIN = np.radians(52.0)
+LON_ORIGIN = np.radians(10.0)
+FALSE_EASTING = 4321000.0
+FALSE_NORTHING = 3210000.0
+
+_E2 = FLATTENING * (2 - FLATTENING)
+_E = np.sqrt(_E2)
+
+def _q(sin_lat):
+    return (1 - _E2) * (sin_lat / (1 - _E2 * sin_lat ** 2)
+                        - np.log((1 - _E * sin_lat) / (1 + _E * sin_lat)) / (2 * _E))
+
+_QP = _q(1.0)
+_RQ = SEMI_MAJOR_AXIS * np.sqrt(_QP / 2)
+_BETA0 = np.arcsin(_q(np.sin(LAT_ORIGIN)) / _QP)
+_D = (SEMI_MAJOR_AXIS * np.cos(LAT_ORIGIN) / np.sqrt(1 - _E2 * np.sin(LAT_ORIGIN) ** 2)
+      / (_RQ * np.cos(_BETA0)))
+
+def _resolution_metres(resolution) -> int:
+    metres = RESOLUTIONS.get(resolution, resolution)
+    if metres not in RESOLUTION_PREFIXES:
+        raise ValueError(f"Unsupported grid resolution {resolution!r} (use one of: {', '.join(RESOLUTIONS)})")
+    return metres
+
+def _char_columns(codes: np.ndarray) -> np.ndarray:
+    """(characters x codes) matrix of character codes, one contiguous row per position."""
+    if codes.dtype.kind not in "SU":
+        codes = codes.astype("U")
+    unit = np.uint32 if codes.dtype.kind == "U" else np.uint8
+    flat = np.ascontiguousarray(codes.ravel())
+    width = flat.dtype.itemsize // np.dtype(unit).itemsize
+    if width == 0 or flat.size == 0:
+        return np.zeros((1, flat.size), dtype=unit)
+    matrix = flat.view(unit).reshape(flat.size, width)
+    used = np.flatnonzero((matrix != 0).any(0))
+    width = used[-1] + 1 if used.size else 1   # drop padding columns before transposing
+    return np.ascontiguousarray(matrix[:, :width].T)
+
+def decode_cellcodes(codes) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Lower-left easting, northing and cell size (all metres, int64) of each code.
+
+    Accepts any array-like of str or bytes codes; the results have its shape.
+    Codes are parsed as a character matrix, so the only loop is over
+    character positions. Raises ValueError naming the first malformed code.
+    """
+    codes = np.asarray(codes)
+    chars = _char_columns(codes)
+    n = chars.shape[1]
+    rows = np.arange(n)
+
+    # '<size><m|km>E<easting>N<northing>'
+    e_pos = (chars == ord("E")).argmax(0)
+    n_pos = (chars == ord("N")).argmax(0)
+    end = (chars != 0).sum(0)
+    km = chars[np.maximum(e_pos - 2, 0), rows] == ord("k")
+    unit_start = e_pos - 1 - km
+
+    numbers = np.zeros((3, n), dtype=np.int64)
+    lengths = np.zeros((3, n), dtype=np.int64)
+    valid = (chars[e_pos, rows] == ord("E")) & (chars[n_pos, rows] == ord("N"))
+    valid &= (e_pos >= 1) & (chars[e_pos - 1, rows] == ord("m"))
+    for column, char in enumerate(chars):
+        digit = char.astype(np.int64) - ord("0")
+        is_digit = (digit >= 0) & (digit <= 9)
+        fields = (column < unit_start,
+                  (column > e_pos) & (column < n_pos),
+                  (column > n_pos) & (column < end))
+        for number, length, mask in zip(numbers, lengths, fields):
+            np.copyto(number, number * 10 + digit, where=mask)
+            length += mask
+            valid &= is_digit | ~mask
+
+    size = numbers[0] * np.where(km, 1000, 1)
+    valid &= (lengths > 0).all(0) & np.isin(size, list(RESOLUTION_PREFIXES))
+    if not valid.all():
+        bad = codes.ravel()[np.argmin(valid)]
+        raise ValueError(f"Invalid EEA cell code: {str(bad)!r}")
+    shape = codes.shape
+    return (numbers[1] * size).reshape(shape), (numbers[2] * size).reshape(shape), size.reshape(shape)
+
+def _as_text(values: np.ndarray) -> np.ndarray:
+    """Integers as a str array no wider than its longest value (astype(str) pads to 21)."""
+    if values.size == 0:
+        return values.astype(str)
+    width = max(len(str(values.min())), len(str(values.max())))
+    return values.astype(f"U{width}")
+
+def encode_cellcodes(easting, northing, resolution="1km") -> np.ndarray:
+    """Codes of the cells at resolution ('1km' or metres) containing the LAEA points."""
+    metres = _resolution_metres(resolution)
+    east = np.floor_divide(np.asarray(easting), metres).astype(np.int64)
+    north = np.floor_divide(np.asarray(northing), metres).astype(np.int64)
+    codes = np.char.add(RESOLUTION_PREFIXES[metres] + "E", _as_text(east))
+    return np.char.add(np.char.add(codes, "N"), _as_text(north))
+
+def coarsen_cellcodes(codes, resolution) -> np.ndarray:
+    """Re-grid cell codes to an equal or coarser resolution."""
+    metres = _resolution_metres(resolution)
+    easting, northing, size = decode_cellcodes(codes)
+    if np.any(metres % size):
+        raise ValueError(f"Cannot coarsen cells to a finer resolution ({resolution})")
+    return encode_cellcodes(easting, northing, metres)
+
+def cell_centres(codes) -> Tuple[np.ndarray, np.ndarray]:
+    """Longitude and latitude (degrees) of the centre of each cell."""
+    easting, northing, size = decode_cellcodes(codes)
+    return laea_to_lonlat(easting + size / 2, northing + size / 2)
+
+def lonlat_to_laea(lon, lat) -> Tuple[np.ndarray, np.ndarray]:
+    """EPSG:3035 easting and northing (metres) of WGS84/ETRS89 lon/lat degrees."""
+    lam = np.radians(np.asarray(lon, dtype=float)) - LON_ORIGIN
+    beta = np.arcsin(_q(np.sin(np.radians(np.asarray(lat, dtype=float)))) / _QP)
+    b = _RQ * np.sqrt(2 / (1 + np.sin(_BETA0) * np.sin(beta)
+                           + np.cos(_BETA0) * np.cos(beta) * np.cos(lam)))
+    easting = FALSE_EASTING + b * _D * np.cos(beta) * np.sin(lam)
+    northing = FALSE_NORTHING + (b / _D) * (np.cos(_BETA0) * np.sin(beta)
+                                            - np.sin(_BETA0) * np.cos(beta) * np.cos(lam))
+    return easting, northing
+
+def laea_to_lonlat(easting, northing) -> Tuple[np.ndarray, np.ndarray]:
+    """WGS84/ETRS89 lon/lat degrees of EPSG:3035 easting and northing (metres)."""
+    x = np.asarray(easting, dtype=float) - FALSE_EASTING
+    y = np.asarray(northing, dtype=float) - FALSE_NORTHING
+    rho = np.hypot(x / _D, _D * y)
+    c = 2 * np.arcsin(rho / (2 * _RQ))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        beta = np.where(rho > 0, np.arcsin(np.cos(c) * np.sin(_BETA0)
+                                           + _D * y * np.sin(c) * np.cos(_BETA0) / rho), _BETA0)
+    lam = LON_ORIGIN + np.arctan2(x * np.sin(c), _D * rho * np.cos(_BETA0) * np.cos(c)
+                                  - _D ** 2 * y * np.sin(_BETA0) * np.sin(c))
+    lat = (beta
+           + (_E2 / 3 + 31 * _E2 ** 2 / 180 + 517 * _E2 ** 3 / 5040) * np.sin(2 * beta)
+           + (23 * _E2 ** 2 / 360 + 251 * _E2 ** 3 / 3780) * np.sin(4 * beta)
+           + (761 * _E2 ** 3 / 45360) * np.sin(6 * beta))
+    return np.degrees(lam), np.degrees(lat)
+
+def _axis_index(values: np.ndarray, centres: np.ndarray) -> np.ndarray:
+    """Index of the grid cell (given by its centres, either order) holding each value; -1 outside."""
+    centres = np.asarray(centres, dtype=float)
+    descending = centres.size > 1 and centres[0] > centres[-1]
+    ascending = centres[::-1] if descending else centres
+    if ascending.size > 1:
+        half = np.diff(ascending) / 2
+        edges = np.concatenate(([ascending[0] - half[0]], ascending[:-1] + half, [ascending[-1] + half[-1]]))
+    else:
+        edges = np.array([-np.inf, np.inf])
+    index = np.searchsorted(edges, values, side="right") - 1
+    index = np.where((index < 0) | (index >= ascending.size), -1, index)
+    if descending:
+        index = np.where(index >= 0, ascending.size - 1 - index, -1)
+    return index
+
+def grid_index(codes, lat, long) -> Tuple[np.ndarray, np.ndarray]:
+    """Row (lat) and column (long) of the grid cell holding each cell's centre; -1 outside."""
+    lon, lat_ = cell_centres(codes)
+    return _axis_index(lat_, lat), _axis_index(lon, long)
+
+def cell_totals(coords, data, dims: Sequence[str], n_cells: int) -> np.ndarray:
+    """Occurrences per eeacellcode, summed over every other dimension."""
+    cells = np.asarray(coords)[list(dims).index("eeacellcode")].astype(np.intp)
+    return np.bincount(cells, weights=np.asarray(data), minlength=n_cells)
+
+def aggregate_occurrences(coords, data, shape, dims: Sequence[str], cellcodes, lat, long,
+                          keep: Sequence[str] = ()) -> np.ndarray:
+    """Sum sparse occurrences onto the lat/long grid.
+
+    coords (ndim x nnz), data (nnz), shape and dims are the variables of the
+    'dynamic/gbif_occurences' group; cellcodes is its eeacellcode coordinate
+    and lat/long are the coordinates of a chelsa group. Each EEA cell is
+    assigned to the grid cell holding its centre; cells outside the grid are
+    dropped. The result has shape [shape of each keep dim] + [len(lat), len(long)].
+    """
+    dims = [str(d) for d in dims]
+    coords = np.asarray(coords).astype(np.intp)
+    shape = [int(s) for s in np.asarray(shape)]
+    rows, columns = grid_index(cellcodes, lat, long)
+    n_lat, n_long = len(lat), len(long)
+
+    cell_to_grid = np.where((rows >= 0) & (columns >= 0), rows * n_long + columns, -1)
+    grid = cell_to_grid[coords[dims.index("eeacellcode")]]
+    inside = grid >= 0
+
+    kept = [coords[dims.index(d)][inside] for d in keep]
+    out_shape = [shape[dims.index(d)] for d in keep] + [n_lat * n_long]
+    flat = np.ravel_multi_index(kept + [grid[inside]], out_shape)
+    totals = np.bincount(flat, weights=np.asarray(data)[inside], minlength=int(np.prod(out_shape)))
+    return totals.reshape(out_shape[:-1] + [n_lat, n_long])
+
+def aggregate_dataset(gbif, grid, keep: Sequence[str] = ()) -> np.ndarray:
+    """aggregate_occurrences for datatree nodes, e.g.
+    aggregate_dataset(dt['dynamic/gbif_occurences'].ds, dt['static/chelsa_clim_ref_period'].ds, keep=['time'])
+    """
+    return aggregate_occurrences(gbif["coords"].values, gbif["data"].values, gbif["shape"].values,
+                                 gbif["dims"].values, gbif["eeacellcode"].values,
+                                 grid["lat"].values, grid["long"].values, keep)
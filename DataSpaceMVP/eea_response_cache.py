@@ -0,0 +1,166 @@
+"""
+Persistent response cache for EEA DiscoData queries.
+
+Responses are stored in a SQLite file keyed on the normalized SQL text, with
+a TTL, size-bounded LRU eviction and the validators (ETag / Last-Modified)
+needed for conditional revalidation once an entry expires. Long-running
+processes can keep recently used entries in memory as well (memory_items).
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_CACHE_FILE = Path.home() / ".bmd_natura2000_cache.sqlite"
+DEFAULT_TTL = 7 * 24 * 3600          # Natura2000 "latest" tables change a few times a year
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace so formatting differences share a cache entry."""
+    return " ".join(sql.split())
+
+def cache_key(sql: str) -> str:
+    """Stable cache key for a SQL query."""
+    return hashlib.sha256(normalize_sql(sql).encode("utf-8")).hexdigest()
+
+class CacheEntry:
+    """A cached response and its revalidation metadata."""
+
+    def __init__(self, data, etag: Optional[str], last_modified: Optional[str],
+                 fetched_at: float, ttl: float):
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.ttl = ttl
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() - self.fetched_at < self.ttl
+
+    def validators(self) -> dict:
+        """Conditional request headers for revalidating this entry."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+class ResponseCache:
+    """SQLite-backed TTL + LRU cache of query results.
+
+    The size bound is checked every EVICT_EVERY puts, as summing the entry
+    sizes scans the whole table, so the file may briefly exceed max_bytes
+    by up to that many entries.
+    """
+
+    EVICT_EVERY = 100   # puts between size checks
+
+    def __init__(self, path: Path = DEFAULT_CACHE_FILE, ttl: float = DEFAULT_TTL,
+                 max_bytes: int = DEFAULT_MAX_BYTES, memory_items: int = 0):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._memory: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._puts = 0
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                sql TEXT NOT NULL,
+                body TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at);
+        """)
+
+    def get(self, sql: str) -> Optional[CacheEntry]:
+        """Return the cached entry for a query (fresh or stale), or None."""
+        key = cache_key(sql)
+        entry = self._memory.get(key)
+        if entry is not None:
+            # Memory hits skip the accessed_at update; the entry was loaded or
+            # written recently, so its on-disk LRU position is close enough
+            self._memory.move_to_end(key)
+            return entry
+        row = self.db.execute(
+            "SELECT body, etag, last_modified, fetched_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        with self.db:
+            self.db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        body, etag, last_modified, fetched_at = row
+        entry = CacheEntry(json.loads(body), etag, last_modified, fetched_at, self.ttl)
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key: str, entry: CacheEntry):
+        if not self.memory_items:
+            return
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def put(self, sql: str, data, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """Store a response, evicting least recently used entries over the size bound."""
+        body = json.dumps(data, ensure_ascii=False)
+        now = time.time()
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (cache_key(sql), normalize_sql(sql), body, len(body), etag, last_modified, now, now),
+            )
+        self._remember(cache_key(sql), CacheEntry(data, etag, last_modified, now, self.ttl))
+        self._puts += 1
+        if self._puts % self.EVICT_EVERY == 0:
+            self._evict()
+
+    def touch(self, sql: str):
+        """Mark an entry as revalidated (e.g. after a 304 Not Modified)."""
+        now = time.time()
+        key = cache_key(sql)
+        with self.db:
+            self.db.execute(
+                "UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE key = ?",
+                (now, now, key),
+            )
+        if key in self._memory:
+            self._memory[key].fetched_at = now
+
+    def _evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        victims, freed = [], 0
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        with self.db:
+            self.db.executemany("DELETE FROM responses WHERE key = ?", victims)
+        for (key,) in victims:
+            self._memory.pop(key, None)
+
+    def clear(self):
+        with self.db:
+            self.db.execute("DELETE FROM responses")
+        self._memory.clear()
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,474 @@
+"""
+Bulk FAIR export of Natura2000 site documents (see 'natura_2000_query.py export').
+
+Each site becomes one JSON-LD document in the shape of AT1101112_FAIR.jsonld
+(a dcat:Dataset with its habitats as subjects and the BMD API endpoints as
+distributions), carrying the site itself as in bmd-site-example.json: a
+Natura2000 Place containing its Annex I habitats and hosting its species
+with population estimates. The N-Quads output holds the same triples, one
+named graph per site, so the whole export loads into a triple store as the
+site knowledge graph.
+
+Pipeline:
+
+- Site codes are grouped into shards by a stable hash of the code, so a
+  site always lands in the same shard file.
+- Shards are processed concurrently. Each fetches its sites' info,
+  habitats and species rows in batches (get_sites_bundle: batched IN-list
+  queries, or the local mirror with --local), so only a few batches of rows
+  are in memory at any time.
+- Batches are hashed and serialised in a process pool. A site whose input
+  hash matches the shard's state file is not serialised again.
+- A shard with changes is rewritten once: its unchanged records are copied
+  and the new ones appended, into a temporary file that replaces the shard,
+  after which the shard's state file is replaced. An interrupted run
+  therefore resumes with the shards it had not finished.
+
+When every site is exported and the source tables' fingerprints match the
+previous complete run, nothing is fetched at all.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bmd_common import profiling
+
+# Bump when site_document changes so every site is regenerated
+EXPORT_VERSION = 1
+FORMATS = {"jsonld": ".ndjson", "nquads": ".nq"}
+DEFAULT_SHARDS = 64
+DEFAULT_BATCH_SIZE = 200       # sites per fetch and per process pool task
+DEFAULT_CONCURRENCY = 4        # shards in flight
+MANIFEST_FILE = "export.json"
+SOURCE_TABLES = ("Site_Information", "Site_Habitats_List", "Site_Species_List_Details")
+
+HABITAT_ID_BASE = "https://biodiversity.europa.eu/habitats/ANNEX1_"
+EUNIS_SPECIES_BASE = "http://eunis.eea.europa.eu/species/"
+API_BASE = "https://bmd.dataspace/api/"
+
+PREFIXES = {
+    "dct": "http://purl.org/dc/terms/",
+    "dcat": "http://www.w3.org/ns/dcat#",
+    "schema": "https://schema.org/",
+    "dwc": "http://rs.tdwg.org/dwc/terms/",
+    "natura": "https://www.eea.europa.eu/ds_resolveuid/7KFIG4CXM1#",
+    "qudt": "http://qudt.org/schema/qudt/",
+    "unit": "http://qudt.org/vocab/unit/",
+    "xsd": "http://www.w3.org/2001/XMLSchema#",
+}
+CONTEXT = {"@version": 1.1, **PREFIXES}
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+
+# Code lists from the Natura2000 dataset definitions (see Natura2000-site-species-habitat-FAIR.md)
+POPULATION_TYPES = {"p": "Permanent", "r": "Reproducing", "c": "Concentration", "w": "Wintering"}
+COUNTING_UNITS = {"i": "unit:Individual", "p": "natura:Pair"}
+ABUNDANCE_CATEGORIES = {"C": "Common", "R": "Rare", "V": "Very rare", "P": "Present"}
+
+# --- Site documents ----------------------------------------------------------
+
+def _get(row: dict, column: str):
+    """Column value, accepting DiscoData's occasional upper-case column names."""
+    value = row.get(column, row.get(column.upper()))
+    return None if value == "" else value
+
+def _prune(node: dict) -> dict:
+    """Drop properties without a value."""
+    return {key: value for key, value in node.items() if value is not None and value != []}
+
+def _distribution(path: str, description: str) -> dict:
+    return {
+        "@type": "dcat:Distribution",
+        "dct:format": "application/json",
+        "dcat:accessService": {
+            "@id": API_BASE + path,
+            "@type": "dcat:DataService",
+            "dcat:endpointURL": {"@id": API_BASE + path},
+            "dcat:endpointDescription": description,
+        },
+    }
+
+def _habitat(site_iri: str, row: dict) -> dict:
+    code = _get(row, "habitat_code") or _get(row, "code_2000")
+    return _prune({
+        "@id": f"{site_iri}/habitats/{code}",
+        "@type": "natura:AnnexIHabitat",
+        "dct:isPartOf": {"@id": HABITAT_ID_BASE + str(code)},
+        "natura:habitatCode": code,
+        "schema:name": _get(row, "habitat_name"),
+        "natura:coverHa": _get(row, "cover_ha"),
+        "natura:representativity": _get(row, "representativity"),
+        "natura:conservation": _get(row, "conservation"),
+        "natura:globalAssessment": _get(row, "global_assessment"),
+    })
+
+def _organism(site_iri: str, row: dict, index: int) -> dict:
+    code = _get(row, "species_code") or _get(row, "code_2000")
+    population_type = _get(row, "population_type")
+    unit = _get(row, "counting_unit")
+    lower, upper = _get(row, "lower_bound"), _get(row, "upper_bound")
+    eunis = _get(row, "id_eunis")
+    statuses = [
+        _prune({"@type": "dwc:ConservationStatus", "schema:statusCode": _get(row, f"{system}_threat_code"),
+                "schema:status": _get(row, f"{system}_threat_name"), "schema:system": f"{system} Threat Status"})
+        for system in ("E27", "EU", "WO") if _get(row, f"{system}_threat_code")
+    ]
+    population = None
+    if lower is not None or upper is not None:
+        population = _prune({
+            "@type": "dwc:MeasurementOrFact",
+            "dwc:measurementType": {"@id": "natura:populationEstimate"},
+            "dwc:measurementValue": _prune({"@type": "qudt:QuantityRange",
+                                            "qudt:lowerBound": lower, "qudt:upperBound": upper}),
+            "dwc:measurementUnit": {"@id": COUNTING_UNITS[unit]} if unit in COUNTING_UNITS else unit,
+        })
+    return _prune({
+        # Several rows per species are possible (e.g. breeding and wintering populations)
+        "@id": f"{site_iri}/species/{code}/{index}",
+        "@type": "dwc:Organism",
+        "dwc:taxon": _prune({
+            "@type": "dwc:Taxon",
+            "dwc:scientificName": _get(row, "scientific_name") or _get(row, "species_name"),
+            "natura:code2000": code,
+            "natura:speciesGroup": _get(row, "species_group_name"),
+            "schema:sameAs": {"@id": f"{EUNIS_SPECIES_BASE}{eunis}"} if eunis is not None else None,
+        }),
+        "natura:populationType": ({"@id": f"natura:populationType/{POPULATION_TYPES[population_type]}"}
+                                  if population_type in POPULATION_TYPES else population_type),
+        "natura:abundanceCategory": ABUNDANCE_CATEGORIES.get(_get(row, "abundance_category"),
+                                                             _get(row, "abundance_category")),
+        "dwc:measurementOrFact": population,
+        "schema:conservationStatus": statuses,
+    })
+
+def site_document(bundle: dict) -> dict:
+    """The FAIR JSON-LD document of a site from its get_sites_bundle() document."""
+    site_iri = bundle["@id"]
+    site_code = site_iri.rsplit("/", 1)[1]
+    info = (bundle.get("info") or [{}])[0]
+    habitats = [_habitat(site_iri, row) for row in bundle.get("habitats") or []]
+    latitude, longitude = _get(info, "latitude"), _get(info, "longitude")
+    return _prune({
+        "@id": site_iri,
+        "@context": CONTEXT,
+        "@type": "dcat:Dataset",
+        "dct:identifier": site_code,
+        "dct:title": _get(info, "site_name"),
+        "dct:spatial": _get(info, "country_code"),
+        "dct:temporal": _get(info, "date_compilation"),
+        "dct:modified": _get(info, "date_update"),
+        "dct:source": {"@id": bundle.get("source", "https://discodata.eea.europa.eu")},
+        "dct:subject": [{"@id": habitat["dct:isPartOf"]["@id"]} for habitat in habitats],
+        "dcat:distribution": [
+            _distribution(f"site/info/{site_code}", "API endpoint returning general site metadata"),
+            _distribution(f"site/habitats/{site_code}", "API endpoint returning habitat list"),
+            _distribution(f"site/species/{site_code}", "API endpoint returning species list"),
+        ],
+        "schema:about": _prune({
+            "@id": f"{site_iri}/place",
+            "@type": ["schema:Place", "natura:Natura2000Site"],
+            "schema:name": _get(info, "site_name"),
+            "natura:siteType": _get(info, "site_type"),
+            "natura:areaHa": _get(info, "area_ha"),
+            "natura:biogeographicRegion": _get(info, "biogeographic_region"),
+            "schema:geo": (_prune({"@type": "schema:GeoCoordinates", "schema:latitude": latitude,
+                                   "schema:longitude": longitude})
+                           if latitude is not None and longitude is not None else None),
+            "schema:containsPlace": habitats,
+            "natura:hostsSpecies": [_organism(site_iri, row, i)
+                                    for i, row in enumerate(bundle.get("species") or [])],
+        }),
+    })
+
+# --- N-Quads -----------------------------------------------------------------
+
+def _iri(term: str) -> str:
+    prefix, sep, local = term.partition(":")
+    if sep and prefix in PREFIXES:
+        return PREFIXES[prefix] + local
+    return term
+
+def _literal(value) -> str:
+    if isinstance(value, bool):
+        return f'"{str(value).lower()}"^^<{PREFIXES["xsd"]}boolean>'
+    if isinstance(value, int):
+        return f'"{value}"^^<{PREFIXES["xsd"]}integer>'
+    if isinstance(value, float):
+        return f'"{value!r}"^^<{PREFIXES["xsd"]}double>'
+    text = (str(value).replace("\\", "\\\\").replace('"', '\\"')
+            .replace("\n", "\\n").replace("\r", "\\r"))
+    return f'"{text}"'
+
+def to_nquads(document: dict) -> str:
+    """
+    N-Quads of a site_document(), in the site's named graph. Handles the
+    subset of JSON-LD site_document produces: prefixed names, @id/@type,
+    nested nodes (blank nodes unless they have an @id), lists and plain
+    values.
+    """
+    graph = f"<{document['@id']}>"
+    # Blank node labels are scoped to the whole file, so they carry the site code
+    label = "_:" + document["@id"].rsplit("/", 1)[1] + "b"
+    lines: List[str] = []
+    blank = [0]
+
+    def node(value: dict) -> str:
+        if "@id" in value and len(value) == 1:
+            return f"<{_iri(value['@id'])}>"
+        if "@id" in value:
+            subject = f"<{_iri(value['@id'])}>"
+        else:
+            blank[0] += 1
+            subject = f"{label}{blank[0]}"
+        types = value.get("@type", [])
+        for rdf_type in [types] if isinstance(types, str) else types:
+            lines.append(f"{subject} <{RDF_TYPE}> <{_iri(rdf_type)}> {graph} .")
+        for key, values in value.items():
+            if key.startswith("@"):
+                continue
+            predicate = f"<{_iri(key)}>"
+            for item in values if isinstance(values, list) else [values]:
+                obj = node(item) if isinstance(item, dict) else _literal(item)
+                lines.append(f"{subject} {predicate} {obj} {graph} .")
+        return subject
+
+    node(document)
+    return "\n".join(lines) + "\n"
+
+# --- Serialisation (runs in the process pool) --------------------------------
+
+def input_hash(bundle: dict) -> str:
+    """Hash of a site's source rows and the document version."""
+    rows = {part: sorted(json.dumps(row, sort_keys=True, default=str) for row in bundle.get(part) or [])
+            for part in ("info", "habitats", "species")}
+    return hashlib.sha256(json.dumps([EXPORT_VERSION, rows]).encode("utf-8")).hexdigest()
+
+def serialise_batch(bundles: List[dict], known: Dict[str, str], fmt: str
+                    ) -> List[Tuple[str, str, Optional[str]]]:
+    """(site code, input hash, record) per bundle; record is None if the hash is in known."""
+    out = []
+    for bundle in bundles:
+        code = bundle["@id"].rsplit("/", 1)[1]
+        digest = input_hash(bundle)
+        if known.get(code) == digest:
+            out.append((code, digest, None))
+            continue
+        document = site_document(bundle)
+        if fmt == "nquads":
+            record = to_nquads(document)
+        else:
+            record = json.dumps(document, ensure_ascii=False, separators=(",", ":")) + "\n"
+        out.append((code, digest, record))
+    return out
+
+def record_site(line: str, fmt: str) -> Optional[str]:
+    """Site code of a shard line: the graph name of a quad, or the leading @id of a document."""
+    if fmt == "nquads":
+        graph = line.rstrip().rsplit("<", 1)
+        return graph[1].split(">", 1)[0].rsplit("/", 1)[1] if len(graph) == 2 else None
+    if line.startswith('{"@id":"'):
+        return line[8:line.index('"', 8)].rsplit("/", 1)[1]
+    return None
+
+# --- Exporter ----------------------------------------------------------------
+
+def shard_of(site_code: str, shards: int) -> int:
+    return zlib.crc32(site_code.encode("ascii")) % shards
+
+def _write_json(path: Path, data):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, sort_keys=True)
+    os.replace(tmp, path)
+
+class SiteExporter:
+    """
+    Writes site documents for many sites into sharded files under directory.
+    natura is the natura_2000_query module (its configured client, cache
+    and mirror serve the lookups); processes=0 serialises in this process.
+    """
+
+    def __init__(self, natura, directory: Path, fmt: str = "jsonld", shards: int = DEFAULT_SHARDS,
+                 batch_size: int = DEFAULT_BATCH_SIZE, concurrency: int = DEFAULT_CONCURRENCY,
+                 processes: Optional[int] = None):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format '{fmt}' (use one of: {', '.join(FORMATS)})")
+        if shards < 1 or batch_size < 1 or concurrency < 1:
+            raise ValueError("shards, batch size and concurrency must be positive")
+        self.natura = natura
+        self.directory = Path(directory)
+        self.fmt = fmt
+        self.shards = shards
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.processes = os.cpu_count() if processes is None else processes
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def shard_path(self, shard: int) -> Path:
+        return self.directory / f"sites-{shard:04d}{FORMATS[self.fmt]}"
+
+    def _state_path(self, shard: int) -> Path:
+        return self.directory / f"sites-{shard:04d}.state.json"
+
+    def _load_manifest(self, force: bool) -> dict:
+        path = self.directory / MANIFEST_FILE
+        manifest = json.loads(path.read_text(encoding="utf-8")) if path.exists() else None
+        layout = {"version": EXPORT_VERSION, "format": self.fmt, "shards": self.shards}
+        if manifest and {key: manifest.get(key) for key in layout} != layout:
+            if not force:
+                raise ValueError(f"{self.directory} holds an export with a different format, shard count "
+                                 "or version; use --force to rewrite it")
+            manifest = None
+        if manifest is None or force:
+            for stale in list(self.directory.glob("sites-*")):
+                stale.unlink()
+            manifest = {**layout, "complete": False, "fingerprints": None}
+        manifest.setdefault("done", [])
+        return manifest
+
+    async def _serialise(self, bundles: List[dict], known: Dict[str, str]):
+        if self._pool is None:
+            return serialise_batch(bundles, known, self.fmt)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._pool, serialise_batch, bundles, known, self.fmt)
+
+    async def _export_shard(self, shard: int, codes: List[str], prune: bool, stats: dict) -> bool:
+        """Export one shard; returns False if some of its sites could not be fetched."""
+        state_path = self._state_path(shard)
+        state: Dict[str, str] = json.loads(state_path.read_text(encoding="utf-8")) if state_path.exists() else {}
+        new_state = dict(state)
+        replaced = set()
+        failed = 0
+        pending = self.shard_path(shard).with_suffix(".pending")
+        with profiling.span(f"shard {shard}", "export", sites=len(codes)), \
+                open(pending, "w", encoding="utf-8") as out:
+            for start in range(0, len(codes), self.batch_size):
+                bundles = await self.natura.get_sites_bundle(codes[start:start + self.batch_size])
+                complete = []
+                for bundle in bundles:
+                    code = bundle["@id"].rsplit("/", 1)[1]
+                    if bundle["info"] is None or bundle["habitats"] is None or bundle["species"] is None:
+                        failed += 1                # keep the previous record, if any
+                    elif not bundle["info"]:
+                        new_state.pop(code, None)  # no longer in Site_Information
+                        replaced.add(code)
+                        if code in state:
+                            stats["removed"] += 1
+                    else:
+                        complete.append(bundle)
+                known = {bundle["@id"].rsplit("/", 1)[1]: None for bundle in complete}
+                known = {code: state[code] for code in known if code in state}
+                for code, digest, record in await self._serialise(complete, known):
+                    new_state[code] = digest
+                    if record is None:
+                        stats["unchanged"] += 1
+                    else:
+                        out.write(record)
+                        replaced.add(code)
+                        stats["written"] += 1
+            if prune:
+                stale = set(state) - set(codes)
+                for code in stale:
+                    new_state.pop(code)
+                replaced |= stale
+                stats["removed"] += len(stale)
+
+        stats["failed"] += failed
+        if not replaced:
+            pending.unlink()
+            return not failed
+        target = self.shard_path(shard)
+        tmp = target.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as out:
+            if target.exists():
+                with open(target, "r", encoding="utf-8") as old:
+                    for line in old:
+                        if record_site(line, self.fmt) not in replaced:
+                            out.write(line)
+            with open(pending, "r", encoding="utf-8") as new:
+                for line in new:
+                    out.write(line)
+        os.replace(tmp, target)
+        pending.unlink()
+        _write_json(state_path, new_state)
+        stats["shards_rewritten"] += 1
+        return not failed
+
+    async def export(self, site_codes: Optional[Iterable[str]] = None, force: bool = False) -> dict:
+        """
+        Export the given sites, or every site if site_codes is None (then
+        sites that disappeared are also removed). force regenerates every
+        site. Returns counts of written, unchanged, removed and failed sites.
+        """
+        started = time.perf_counter()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        manifest = self._load_manifest(force)
+        stats = {"directory": str(self.directory), "format": self.fmt, "sites": 0, "written": 0,
+                 "unchanged": 0, "removed": 0, "failed": 0, "resumed": 0, "shards_rewritten": 0}
+
+        everything = site_codes is None
+        fingerprints = None
+        if everything:
+            fingerprints = [await self.natura.source_fingerprint(table) for table in SOURCE_TABLES]
+            if (not force and manifest["complete"] and None not in fingerprints
+                    and manifest["fingerprints"] == fingerprints):
+                stats.update(status="unchanged", elapsed_s=round(time.perf_counter() - started, 3))
+                return stats
+            site_codes = await self.natura.get_all_site_codes()
+        codes = sorted({self.natura.validate_site_code(code) for code in site_codes})
+        stats["sites"] = len(codes)
+        by_shard: Dict[int, List[str]] = {}
+        for code in codes:
+            by_shard.setdefault(shard_of(code, self.shards), []).append(code)
+        # A full run also visits empty shards so their removed sites are dropped
+        shards = range(self.shards) if everything else sorted(by_shard)
+
+        # A full run interrupted with the same source fingerprints resumes
+        # after the shards it finished
+        resuming = (everything and not force and None not in fingerprints
+                    and manifest.get("run_fingerprints") == fingerprints)
+        done = set(manifest["done"]) if resuming else set()
+        manifest.update(complete=False, run_fingerprints=fingerprints if everything else None,
+                        done=sorted(done))
+        _write_json(self.directory / MANIFEST_FILE, manifest)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(shard: int):
+            if shard in done:
+                stats["resumed"] += len(by_shard.get(shard, []))
+                return
+            async with semaphore:
+                complete = await self._export_shard(shard, by_shard.get(shard, []), everything, stats)
+            # Shards with failed sites are revisited when the run is resumed
+            if everything and complete:
+                done.add(shard)
+                manifest["done"] = sorted(done)
+                _write_json(self.directory / MANIFEST_FILE, manifest)
+
+        if self.processes:
+            self._pool = ProcessPoolExecutor(max_workers=self.processes)
+        try:
+            await asyncio.gather(*(run(shard) for shard in shards))
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+        if everything and not stats["failed"]:
+            manifest.update(complete=True, fingerprints=fingerprints, run_fingerprints=None, done=[])
+        _write_json(self.directory / MANIFEST_FILE, manifest)
+        profiling.count("export_sites_total", stats["written"], status="written")
+        profiling.count("export_sites_total", stats["unchanged"], status="unchanged")
+        if stats["failed"]:
+            print(f"Warning: {stats['failed']} sites could not be fetched; their previous records "
+                  "were kept", file=sys.stderr)
+        stats.update(status="partial" if stats["failed"] else "completed",
+                     elapsed_s=round(time.perf_counter() - started, 3))
+        return stats
@@ -0,0 +1,177 @@
+"""
+Minimal asyncio HTTP/1.1 server for exposing the BMD lookups as a
+long-running JSON service (see 'natura_2000_query.py serve').
+
+Only what the service needs is implemented: GET/HEAD and JSON POST
+requests, path parameters, keep-alive and JSON responses. Handlers are
+coroutines taking the path parameters and query string (POST handlers
+also get the parsed JSON body) and returning a JSON-serialisable body, or
+a JSONResponse to set the status and headers; raising HTTPError sets an
+error status.
+"""
+
+import asyncio
+import json
+import re
+import sys
+import urllib.parse
+from http import HTTPStatus
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+KEEPALIVE_TIMEOUT = 30.0   # seconds an idle connection is kept open
+
+Handler = Callable[..., Awaitable[object]]   # (params, query) or (params, query, body)
+
+class HTTPError(Exception):
+    """Raised by handlers to answer with an error status."""
+
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+class JSONResponse:
+    """JSON body with a status other than 200 and/or extra headers (e.g. Location)."""
+
+    def __init__(self, body, status: int = 200, headers: Optional[Dict[str, str]] = None):
+        self.body = body
+        self.status = status
+        self.headers = headers or {}
+
+class TextResponse:
+    """Non-JSON response body (e.g. Prometheus metrics)."""
+
+    def __init__(self, text: str, content_type: str = "text/plain; version=0.0.4"):
+        self.text = text
+        self.content_type = content_type
+
+class Router:
+    """Maps ('GET', '/sites/{siteCode}/info')-style method and path templates to handlers."""
+
+    def __init__(self):
+        self.routes: List[Tuple[re.Pattern, str, Handler]] = []
+
+    def add(self, template: str, handler: Handler, method: str = "GET"):
+        pattern = re.sub(r"\\{(\w+)\\}", r"(?P<\1>[^/]+)", re.escape(template))
+        self.routes.append((re.compile(f"^{pattern}$"), method, handler))
+
+    def resolve(self, method: str, path: str) -> Tuple[Handler, Dict[str, str]]:
+        method = "GET" if method == "HEAD" else method
+        allowed = []
+        for pattern, route_method, handler in self.routes:
+            match = pattern.match(path)
+            if match:
+                if route_method == method:
+                    return handler, {k: urllib.parse.unquote(v) for k, v in match.groupdict().items()}
+                allowed.append(route_method)
+        if allowed:
+            raise HTTPError(405, f"Method {method} not allowed", {"Allow": ", ".join(allowed)})
+        raise HTTPError(404, f"No resource at {path}")
+
+def _encode(status: int, body, keep_alive: bool, head: bool = False,
+            headers: Optional[Dict[str, str]] = None) -> bytes:
+    if isinstance(body, JSONResponse):
+        status, headers, body = body.status, {**(headers or {}), **body.headers}, body.body
+    if isinstance(body, TextResponse):
+        payload, content_type = body.text.encode("utf-8"), body.content_type
+    else:
+        payload = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+        content_type = "application/json"
+    lines = [
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {len(payload)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (b"" if head else payload)
+
+async def _read_head(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, str, Dict[str, str]]]:
+    """Read a request line and headers; None when the client closed the connection."""
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT)
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(431, "Request headers too large")
+    request_line, *header_lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = request_line.split(" ")
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    for line in header_lines:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return method, target, version, headers
+
+async def _handle_connection(router: Router, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            try:
+                request = await _read_head(reader)
+            except HTTPError as e:
+                writer.write(_encode(e.status, {"error": e.message}, keep_alive=False))
+                break
+            if request is None:
+                break
+            method, target, version, headers = request
+            keep_alive = (headers.get("connection", "").lower() != "close"
+                          and version == "HTTP/1.1")
+            try:
+                length = int(headers.get("content-length") or 0)
+                if length < 0:
+                    raise ValueError(length)
+            except ValueError:
+                writer.write(_encode(400, {"error": "Invalid Content-Length"}, keep_alive=False))
+                break
+            if length > MAX_BODY_BYTES:
+                writer.write(_encode(413, {"error": "Request body too large"}, keep_alive=False))
+                break
+            try:
+                payload = await reader.readexactly(length) if length else b""
+            except asyncio.IncompleteReadError:
+                break   # client closed the connection mid-body
+
+            status, body, extra_headers = 200, None, None
+            url = urllib.parse.urlsplit(target)
+            try:
+                handler, params = router.resolve(method, url.path)
+                query = urllib.parse.parse_qs(url.query)
+                if method == "POST":
+                    try:
+                        data = json.loads(payload) if payload else None
+                    except ValueError:
+                        raise HTTPError(400, "Request body is not valid JSON")
+                    body = await handler(params, query, data)
+                else:
+                    body = await handler(params, query)
+            except HTTPError as e:
+                status, body, extra_headers = e.status, {"error": e.message}, e.headers
+            except ValueError as e:
+                status, body = 400, {"error": str(e)}
+            except Exception as e:
+                print(f"Error handling {method} {target}: {e!r}", file=sys.stderr)
+                status, body = 500, {"error": "Internal server error"}
+            writer.write(_encode(status, body, keep_alive, method == "HEAD", extra_headers))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def serve(router: Router, host: str = "127.0.0.1", port: int = 8000):
+    """Serve the router until cancelled."""
+    server = await asyncio.start_server(
+        lambda r, w: _handle_connection(router, r, w), host, port, limit=MAX_HEADER_BYTES
+    )
+    addresses = ", ".join(f"http://{s.getsockname()[0]}:{s.getsockname()[1]}" for s in server.sockets)
+    print(f"Serving on {addresses}", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,166 @@
+"""
+Local mirror of the BISE Natura2000 tables used by natura_2000_query.py.
+
+Rows are stored verbatim as JSON in a SQLite file, indexed on the key column
+of each table (site_code or code_2000), so lookups return exactly the JSON
+DiscoData would have returned. Each table is replaced atomically inside one
+transaction, and a sync_meta table records when and from what each table
+was last synced. key_meta keeps a checksum per key (per site or habitat
+code), so a later sync can replace just the keys whose rows changed.
+"""
+
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional
+
+DEFAULT_MIRROR_FILE = Path.home() / ".bmd_natura2000_mirror.sqlite"
+
+# Mirrored tables and the column each is looked up by
+MIRROR_TABLES = {
+    "Site_Information": "site_code",
+    "Site_Habitats_List": "site_code",
+    "Site_Species_List_Details": "site_code",
+    "Habitat_Information": "code_2000",
+}
+
+BATCH_ROWS = 5000  # rows per executemany during a sync
+
+class MirrorError(RuntimeError):
+    """Raised when the mirror cannot answer a query."""
+
+def row_key(row: dict, column: str) -> str:
+    """Key value of a DiscoData row, tolerant of column name casing."""
+    return str(row.get(column) or row.get(column.upper()) or "").upper()
+
+class Natura2000Mirror:
+    """SQLite-backed mirror of the Natura2000 BISE tables."""
+
+    def __init__(self, path: Path = DEFAULT_MIRROR_FILE):
+        self.path = Path(path)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS rows (
+                tbl TEXT NOT NULL,
+                key TEXT NOT NULL,
+                body TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_rows_tbl_key ON rows (tbl, key);
+            CREATE TABLE IF NOT EXISTS sync_meta (
+                tbl TEXT PRIMARY KEY,
+                synced_at REAL NOT NULL,
+                row_count INTEGER NOT NULL,
+                fingerprint TEXT
+            );
+            CREATE TABLE IF NOT EXISTS key_meta (
+                tbl TEXT NOT NULL,
+                key TEXT NOT NULL,
+                checksum TEXT NOT NULL,
+                PRIMARY KEY (tbl, key)
+            );
+        """)
+
+    def sync_info(self, table: str) -> Optional[dict]:
+        """Metadata of the last sync of a table, or None if never synced."""
+        row = self.db.execute(
+            "SELECT synced_at, row_count, fingerprint FROM sync_meta WHERE tbl = ?", (table,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"table": table, "synced_at": row[0], "row_count": row[1], "fingerprint": row[2]}
+
+    def key_checksums(self, table: str) -> Dict[str, str]:
+        """Per-key checksums recorded by the last sync of a table."""
+        return dict(self.db.execute("SELECT key, checksum FROM key_meta WHERE tbl = ?", (table,)))
+
+    async def replace_table(self, table: str, records: AsyncIterator[dict],
+                            fingerprint: Optional[str] = None,
+                            checksums: Optional[Dict[str, str]] = None) -> int:
+        """Replace a table's rows with a stream of records in one transaction.
+
+        If the stream fails, the transaction is rolled back and the previous
+        copy stays in place; readers see the old rows until commit.
+        """
+        return await self._replace(table, None, records, fingerprint, checksums or {})
+
+    async def replace_keys(self, table: str, keys: List[str], records: AsyncIterator[dict],
+                           fingerprint: Optional[str], checksums: Dict[str, str]) -> int:
+        """Replace the rows of some keys in one transaction; returns the rows written.
+
+        keys lists every key to drop (changed and removed ones); records
+        are the new rows of the changed keys, and checksums their new
+        per-key checksums.
+        """
+        return await self._replace(table, keys, records, fingerprint, checksums)
+
+    async def _replace(self, table: str, keys: Optional[List[str]], records: AsyncIterator[dict],
+                       fingerprint: Optional[str], checksums: Dict[str, str]) -> int:
+        column = MIRROR_TABLES[table]
+        count = 0
+        batch = []
+        try:
+            self.db.execute("BEGIN")
+            if keys is None:
+                self.db.execute("DELETE FROM rows WHERE tbl = ?", (table,))
+                self.db.execute("DELETE FROM key_meta WHERE tbl = ?", (table,))
+            else:
+                self.db.executemany("DELETE FROM rows WHERE tbl = ? AND key = ?", [(table, k) for k in keys])
+                self.db.executemany("DELETE FROM key_meta WHERE tbl = ? AND key = ?", [(table, k) for k in keys])
+            async for record in records:
+                batch.append((table, row_key(record, column), json.dumps(record, ensure_ascii=False)))
+                if len(batch) >= BATCH_ROWS:
+                    self.db.executemany("INSERT INTO rows VALUES (?, ?, ?)", batch)
+                    count += len(batch)
+                    batch = []
+            self.db.executemany("INSERT INTO rows VALUES (?, ?, ?)", batch)
+            count += len(batch)
+            self.db.executemany("INSERT OR REPLACE INTO key_meta VALUES (?, ?, ?)",
+                                [(table, key, checksum) for key, checksum in checksums.items()])
+            total = count if keys is None else self.db.execute(
+                "SELECT COUNT(*) FROM rows WHERE tbl = ?", (table,)).fetchone()[0]
+            self.db.execute(
+                "INSERT OR REPLACE INTO sync_meta VALUES (?, ?, ?, ?)",
+                (table, time.time(), total, fingerprint),
+            )
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return count
+
+    def touch(self, table: str):
+        """Record that a table was checked and found unchanged."""
+        with self.db:
+            self.db.execute("UPDATE sync_meta SET synced_at = ? WHERE tbl = ?", (time.time(), table))
+
+    def _require(self, table: str):
+        if self.sync_info(table) is None:
+            raise MirrorError(f"Table {table} is not in the local mirror; run 'sync' first")
+
+    def rows(self, table: str, key: str) -> List[dict]:
+        """Rows of a table for one key, in source order."""
+        self._require(table)
+        return [
+            json.loads(body) for (body,) in self.db.execute(
+                "SELECT body FROM rows WHERE tbl = ? AND key = ? ORDER BY rowid", (table, key.upper())
+            )
+        ]
+
+    def rows_many(self, table: str, keys: List[str]) -> Dict[str, List[dict]]:
+        """Rows for many keys, grouped per key."""
+        return {key: self.rows(table, key) for key in keys}
+
+    def keys_with_prefix(self, table: str, prefix: str) -> List[str]:
+        """Distinct keys starting with a prefix (e.g. the site codes of a country)."""
+        self._require(table)
+        return [
+            key for (key,) in self.db.execute(
+                "SELECT DISTINCT key FROM rows WHERE tbl = ? AND key >= ? AND key < ? ORDER BY key",
+                (table, prefix, prefix + "￿"),
+            )
+        ]
+
+    def close(self):
+        self.db.close()
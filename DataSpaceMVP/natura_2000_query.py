@@ -5,34 +5,482 @@ Command-line interface for querying EEA DiscoData Natura2000 database
 """
 
 import urllib.parse
-import httpx
 import json
 import asyncio
+import importlib.util
+import re
 import sys
-from typing import Optional
+from dataclasses import asdict
+from pathlib import Path
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Iterable, List, Optional
+
+# Modules shared with the species resolver live in the bmd_common package
+# at the repository root
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from bmd_common.single_flight import AsyncSingleFlight  # noqa: E402
+from bmd_common import profiling  # noqa: E402
+
+# httpx is imported when the first request is made, so help, --offline and
+# --local runs do not pay for it. Likewise the response cache, mirror,
+# traffic controller, sinks and HTTP service are imported by the commands
+# that use them.
+if TYPE_CHECKING:
+    import httpx
+    from eea_response_cache import ResponseCache
+    from http_service import Router
+    from n2k_mirror import Natura2000Mirror
 
 EEA_BASE = "https://discodata.eea.europa.eu/sql?query="
 
+SITE_ID_BASE = "https://biodiversity.europa.eu/sites/natura2000/"
+HABITAT_ID_BASE = "https://biodiversity.europa.eu/habitats/ANNEX1_"
+
+# DiscoData takes raw SQL in the query string, so codes are validated
+# against these patterns before they are placed in a WHERE clause
+SITE_CODE_PATTERN = re.compile(r"^[A-Z]{2}[A-Z0-9]{7}$")      # e.g. AT1101112
+HABITAT_CODE_PATTERN = re.compile(r"^[0-9]{2}[0-9A-Z]{2}$")   # e.g. 6230, 91E0
+COUNTRY_CODE_PATTERN = re.compile(r"^[A-Z]{2}$")
+TABLE_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_]+$")
+
+# Keep batched GET URLs under the common 2048-character server limit
+MAX_URL_LENGTH = 2000
+
+# Records per page when streaming with DiscoData's p/nrOfHits paging
+PAGE_SIZE = 5000
+
+# A sync downloads only the changed keys of a table while at most this
+# share of its keys changed; beyond that one full stream is cheaper
+PARTIAL_SYNC_FRACTION = 0.5
+
+# Service mode: defaults, and the species resolver exposed next to the lookups
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8000
+SERVE_MEMORY_ITEMS = 10000   # cached responses kept in memory while serving
+DATACUBE_RETRY_AFTER = 5     # seconds clients are asked to wait when the cube queue is full
+RESOLVER_DIR = ROOT_DIR / "species_id_entity_resolution"
+
+# BISE table and key column behind each lookup command
+COMMAND_TABLES = {
+    "site-info": ("Site_Information", "site_code"),
+    "site-habitats": ("Site_Habitats_List", "site_code"),
+    "site-species": ("Site_Species_List_Details", "site_code"),
+    "habitat-info": ("Habitat_Information", "code_2000"),
+}
+
+# Settings for the shared HTTP client (see configure_client)
+CLIENT_SETTINGS = {
+    "timeout": 20.0,
+    "max_connections": 20,
+    "max_keepalive_connections": 10,
+    "keepalive_expiry": 30.0,
+    "http2": False,
+}
+
+# Settings for the persistent response cache (see configure_cache)
+CACHE_SETTINGS = {
+    "enabled": True,
+    "path": None,       # None: eea_response_cache.DEFAULT_CACHE_FILE
+    "ttl": None,        # None: eea_response_cache.DEFAULT_TTL
+    "max_bytes": None,  # None: eea_response_cache.DEFAULT_MAX_BYTES
+    "offline": False,   # answer only from the cache, never touch the network
+    "refresh": False,   # revalidate every cached entry regardless of TTL
+    "memory_items": 0,  # entries also kept in memory (used by 'serve')
+}
+
+# Settings for the local Natura2000 mirror (see configure_mirror)
+MIRROR_SETTINGS = {
+    "local": False,     # answer lookups from the mirror instead of DiscoData
+    "path": None,       # None: n2k_mirror.DEFAULT_MIRROR_FILE
+}
+
+_client: Optional["httpx.AsyncClient"] = None
+_cache: Optional["ResponseCache"] = None
+_mirror: Optional["Natura2000Mirror"] = None
+_identity_cache = None   # species_identifier_resolverv2.IdentityCache, see get_identity_cache
+
+# Identical queries in flight at the same time share one upstream request
+_eea_flight = AsyncSingleFlight("eea")
+
+def configure_client(**settings):
+    """Override shared client settings. Must be called before the first query."""
+    unknown = set(settings) - set(CLIENT_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown client settings: {', '.join(sorted(unknown))}")
+    if _client is not None:
+        raise RuntimeError("HTTP client already created; configure it before querying")
+    CLIENT_SETTINGS.update(settings)
+
+def get_client() -> "httpx.AsyncClient":
+    """Return the process-wide pooled client, creating it on first use."""
+    global _client
+    if _client is None:
+        import httpx
+        limits = httpx.Limits(
+            max_connections=CLIENT_SETTINGS["max_connections"],
+            max_keepalive_connections=CLIENT_SETTINGS["max_keepalive_connections"],
+            keepalive_expiry=CLIENT_SETTINGS["keepalive_expiry"],
+        )
+        http2 = CLIENT_SETTINGS["http2"]
+        if http2 and importlib.util.find_spec("h2") is None:
+            print("Warning: HTTP/2 requested but 'h2' is not installed; using HTTP/1.1",
+                  file=sys.stderr)
+            http2 = False
+        _client = httpx.AsyncClient(timeout=CLIENT_SETTINGS["timeout"], limits=limits, http2=http2)
+    return _client
+
+async def close_client():
+    """Close the shared client and release pooled connections."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def configure_cache(**settings):
+    """Override response cache settings. Must be called before the first query."""
+    unknown = set(settings) - set(CACHE_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown cache settings: {', '.join(sorted(unknown))}")
+    if _cache is not None:
+        raise RuntimeError("Response cache already opened; configure it before querying")
+    CACHE_SETTINGS.update(settings)
+
+def get_cache() -> Optional["ResponseCache"]:
+    """Return the process-wide response cache, or None if caching is disabled."""
+    global _cache
+    if _cache is None and CACHE_SETTINGS["enabled"]:
+        from eea_response_cache import DEFAULT_CACHE_FILE, DEFAULT_MAX_BYTES, DEFAULT_TTL, ResponseCache
+        settings = {key: CACHE_SETTINGS[key] for key in ("path", "ttl", "max_bytes")}
+        defaults = {"path": DEFAULT_CACHE_FILE, "ttl": DEFAULT_TTL, "max_bytes": DEFAULT_MAX_BYTES}
+        settings = {key: defaults[key] if value is None else value for key, value in settings.items()}
+        try:
+            _cache = ResponseCache(settings["path"], settings["ttl"],
+                                   settings["max_bytes"], CACHE_SETTINGS["memory_items"])
+        except Exception as e:
+            print(f"Warning: response cache unavailable: {e}", file=sys.stderr)
+            CACHE_SETTINGS["enabled"] = False
+    return _cache
+
+def close_cache():
+    """Close the response cache."""
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+
+def configure_mirror(**settings):
+    """Override local mirror settings. Must be called before the first query."""
+    unknown = set(settings) - set(MIRROR_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown mirror settings: {', '.join(sorted(unknown))}")
+    if _mirror is not None:
+        raise RuntimeError("Mirror already opened; configure it before querying")
+    MIRROR_SETTINGS.update(settings)
+
+def get_mirror() -> "Natura2000Mirror":
+    """Return the process-wide local mirror, opening it on first use."""
+    global _mirror
+    if _mirror is None:
+        from n2k_mirror import DEFAULT_MIRROR_FILE, Natura2000Mirror
+        _mirror = Natura2000Mirror(MIRROR_SETTINGS["path"] or DEFAULT_MIRROR_FILE)
+    return _mirror
+
+def close_mirror():
+    """Close the local mirror."""
+    global _mirror
+    if _mirror is not None:
+        _mirror.close()
+        _mirror = None
+
+async def query_table(table: str, column: str, code: str, sql: str) -> Optional[list]:
+    """Rows for one code, from the local mirror when enabled, else via query_eea."""
+    if not MIRROR_SETTINGS["local"]:
+        return await query_eea(sql)
+    from n2k_mirror import MirrorError
+    try:
+        return get_mirror().rows(table, code)
+    except MirrorError as e:
+        print(f"Error querying local mirror: {e}", file=sys.stderr)
+        return None
+
 async def query_eea(sql: str) -> Optional[dict]:
-    """Forward SQL to EEA endpoint and return cleaned JSON."""
+    """Forward SQL to EEA endpoint and return cleaned JSON.
+
+    Responses are served from the persistent cache while fresh, revalidated
+    with ETag/Last-Modified once stale, and used as a fallback when the
+    endpoint is unreachable. Concurrent calls for the same (normalized) SQL
+    share one request and one result.
+    """
+    from eea_response_cache import normalize_sql
+    return await _eea_flight.do(normalize_sql(sql), lambda: _query_eea(sql))
+
+async def _query_eea(sql: str) -> Optional[dict]:
+    from bmd_common.traffic_control import controlled_request_async
+    cache = get_cache()
+    entry = cache.get(sql) if cache else None
+
+    if entry and entry.fresh and not CACHE_SETTINGS["refresh"]:
+        profiling.cache_lookup("eea_response", True)
+        return entry.data
+    if CACHE_SETTINGS["offline"]:
+        profiling.cache_lookup("eea_response", entry is not None)
+        if entry:
+            return entry.data
+        print("Error querying EEA: not in cache (offline mode)", file=sys.stderr)
+        return None
+
+    if cache:
+        profiling.cache_lookup("eea_response", False)
     url = EEA_BASE + urllib.parse.quote(sql)
     try:
-        async with httpx.AsyncClient(timeout=20) as client:
-            r = await client.get(url)
-            r.raise_for_status()
-            data = r.json()
-            return data.get("records", data)
+        r = await controlled_request_async(
+            get_client(), "GET", url, headers=entry.validators() if entry else None
+        )
+        if r.status_code == 304 and entry:
+            profiling.count("cache_revalidated_total", cache="eea_response")
+            cache.touch(sql)
+            return entry.data
+        r.raise_for_status()
+        data = profiling.parse_json(r, "eea")
+        results = data.get("records", data)
+        if cache:
+            cache.put(sql, results, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+        return results
     except Exception as e:
+        if entry:
+            print(f"Warning: EEA query failed ({e}); serving cached response", file=sys.stderr)
+            return entry.data
         print(f"Error querying EEA: {e}", file=sys.stderr)
         return None
 
+async def _fetch_page(sql: str, page: int, page_size: int) -> list:
+    from bmd_common.traffic_control import controlled_request_async
+    url = f"{EEA_BASE}{urllib.parse.quote(sql)}&p={page}&nrOfHits={page_size}"
+    r = await controlled_request_async(get_client(), "GET", url)
+    r.raise_for_status()
+    data = profiling.parse_json(r, "eea")
+    return data.get("records", []) if isinstance(data, dict) else data
+
+async def stream_eea(sql: str, page_size: int = PAGE_SIZE) -> AsyncIterator[dict]:
+    """Yield the records of a query page by page.
+
+    The next page is fetched while the current one is consumed, so at most two
+    pages are held in memory. Streaming bypasses the response cache, and
+    errors are raised rather than turned into an empty result.
+    """
+    page = 1
+    next_page = asyncio.ensure_future(_fetch_page(sql, page, page_size))
+    try:
+        while True:
+            records = await next_page
+            if len(records) < page_size:
+                next_page = None
+            else:
+                page += 1
+                next_page = asyncio.ensure_future(_fetch_page(sql, page, page_size))
+            for record in records:
+                yield record
+            if next_page is None:
+                return
+    finally:
+        if next_page is not None and not next_page.done():
+            next_page.cancel()
+
+def validate_code(code: str, pattern: re.Pattern, kind: str) -> str:
+    """Normalize a code and check it is safe to embed in SQL."""
+    normalized = code.strip().upper()
+    if not pattern.match(normalized):
+        raise ValueError(f"Invalid {kind}: {code!r}")
+    return normalized
+
+def validate_site_code(site_code: str) -> str:
+    return validate_code(site_code, SITE_CODE_PATTERN, "site code")
+
+def validate_habitat_code(code_2000: str) -> str:
+    return validate_code(code_2000, HABITAT_CODE_PATTERN, "habitat code")
+
+def in_list_chunks(codes: List[str], sql_prefix: str) -> List[List[str]]:
+    """Split codes into IN-lists whose encoded query URL stays under MAX_URL_LENGTH."""
+    base_length = len(EEA_BASE + urllib.parse.quote(sql_prefix + "()"))
+    chunks, chunk, length = [], [], base_length
+    for code in codes:
+        item_length = len(urllib.parse.quote(f"'{code}', "))
+        if chunk and length + item_length > MAX_URL_LENGTH:
+            chunks.append(chunk)
+            chunk, length = [], base_length
+        chunk.append(code)
+        length += item_length
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+async def query_eea_many(table: str, column: str, codes: List[str]) -> Dict[str, Optional[list]]:
+    """Fetch rows for many codes with chunked IN-list queries and split them per code.
+
+    Codes must already be validated. Codes whose chunk failed map to None.
+    """
+    if MIRROR_SETTINGS["local"]:
+        from n2k_mirror import MirrorError
+        try:
+            return get_mirror().rows_many(table, codes)
+        except MirrorError as e:
+            print(f"Error querying local mirror: {e}", file=sys.stderr)
+            return {code: None for code in codes}
+
+    sql_prefix = f"SELECT * FROM [BISE].[latest].[{table}] WHERE {column} IN "
+    chunks = in_list_chunks(codes, sql_prefix)
+    responses = await asyncio.gather(*(
+        query_eea(sql_prefix + "(" + ", ".join(f"'{code}'" for code in chunk) + ")")
+        for chunk in chunks
+    ))
+    per_code: Dict[str, Optional[list]] = {}
+    for chunk, rows in zip(chunks, responses):
+        for code in chunk:
+            per_code[code] = None if rows is None else []
+        for row in rows or []:
+            key = str(row.get(column) or row.get(column.upper()) or "").upper()
+            if key in per_code:
+                per_code[key].append(row)
+    return per_code
+
+async def stream_command_rows(command: str, codes: List[str],
+                              page_size: int = PAGE_SIZE) -> AsyncIterator[dict]:
+    """Stream raw rows for a lookup command over many codes, chunk by chunk."""
+    table, column = COMMAND_TABLES[command]
+    validate = validate_habitat_code if column == "code_2000" else validate_site_code
+    codes = list(dict.fromkeys(validate(code) for code in codes))
+    sql_prefix = f"SELECT * FROM [BISE].[latest].[{table}] WHERE {column} IN "
+    for chunk in in_list_chunks(codes, sql_prefix):
+        sql = sql_prefix + "(" + ", ".join(f"'{code}'" for code in chunk) + ")"
+        async for record in stream_eea(sql, page_size):
+            yield record
+
+async def stream_table(table: str, page_size: int = PAGE_SIZE) -> AsyncIterator[dict]:
+    """Stream every row of a BISE table."""
+    if not TABLE_NAME_PATTERN.match(table):
+        raise ValueError(f"Invalid table name: {table!r}")
+    async for record in stream_eea(f"SELECT * FROM [BISE].[latest].[{table}]", page_size):
+        yield record
+
+async def table_fingerprint(table: str) -> Optional[str]:
+    """Cheap change detector for a table: row count plus SQL Server CHECKSUM_AGG."""
+    sql = (f"SELECT COUNT(*) AS row_count, CHECKSUM_AGG(BINARY_CHECKSUM(*)) AS checksum "
+           f"FROM [BISE].[latest].[{table}]")
+    try:
+        rows = await _fetch_page(sql, 1, 1)
+        return json.dumps(rows[0], sort_keys=True) if rows else None
+    except Exception as e:
+        print(f"Warning: could not fingerprint {table} ({e}); doing a full sync", file=sys.stderr)
+        return None
+
+async def key_checksums(table: str, page_size: int = PAGE_SIZE) -> Optional[Dict[str, str]]:
+    """Row count and CHECKSUM_AGG per key (site or habitat code) of a table, or None on failure."""
+    from n2k_mirror import MIRROR_TABLES
+    column = MIRROR_TABLES[table]
+    sql = (f"SELECT {column} AS mirror_key, COUNT(*) AS row_count, "
+           f"CHECKSUM_AGG(BINARY_CHECKSUM(*)) AS checksum FROM [BISE].[latest].[{table}] "
+           f"GROUP BY {column} ORDER BY {column}")
+    try:
+        return {str(row["mirror_key"]).upper(): f"{row['row_count']}:{row['checksum']}"
+                async for row in stream_eea(sql, page_size)}
+    except Exception as e:
+        print(f"Warning: could not checksum {table} per key ({e})", file=sys.stderr)
+        return None
+
+async def stream_keys(table: str, keys: List[str], page_size: int = PAGE_SIZE) -> AsyncIterator[dict]:
+    """Stream the rows of a table for the given (validated) keys."""
+    from n2k_mirror import MIRROR_TABLES
+    sql_prefix = f"SELECT * FROM [BISE].[latest].[{table}] WHERE {MIRROR_TABLES[table]} IN "
+    for chunk in in_list_chunks(keys, sql_prefix):
+        async for record in stream_eea(sql_prefix + "(" + ", ".join(f"'{key}'" for key in chunk) + ")",
+                                       page_size):
+            yield record
+
+async def sync_mirror(tables: Optional[List[str]] = None, force: bool = False,
+                      page_size: int = PAGE_SIZE) -> List[dict]:
+    """Download BISE tables into the local mirror.
+
+    Tables whose fingerprint matches the last sync are skipped unless force
+    is set. For a changed table, per-key checksums (one per site or habitat
+    code) are compared with the last sync and only the rows of changed keys
+    are downloaded; tables without earlier checksums, or where most keys
+    changed, are streamed whole. Either way the update is one transaction.
+    """
+    from n2k_mirror import MIRROR_TABLES
+    mirror = get_mirror()
+    report = []
+    for table in tables or list(MIRROR_TABLES):
+        if table not in MIRROR_TABLES:
+            raise ValueError(f"Unknown mirror table '{table}' (use one of: {', '.join(MIRROR_TABLES)})")
+        fingerprint = await table_fingerprint(table)
+        info = mirror.sync_info(table)
+        if not force and fingerprint and info and info["fingerprint"] == fingerprint:
+            mirror.touch(table)
+            report.append({"table": table, "status": "unchanged", "row_count": info["row_count"]})
+            continue
+        checksums = await key_checksums(table, page_size)
+        previous = mirror.key_checksums(table) if info and not force else {}
+        if checksums is not None and previous:
+            changed = [key for key, checksum in checksums.items() if previous.get(key) != checksum]
+            removed = [key for key in previous if key not in checksums]
+            validate = validate_habitat_code if MIRROR_TABLES[table] == "code_2000" else validate_site_code
+            try:
+                changed = [validate(key) for key in changed]
+            except ValueError:
+                changed = None   # a key that cannot go into an IN-list; sync the whole table
+            if changed is not None and len(changed) <= len(checksums) * PARTIAL_SYNC_FRACTION:
+                print(f"Syncing {len(changed)} changed and {len(removed)} removed keys of {table}...",
+                      file=sys.stderr)
+                await mirror.replace_keys(table, changed + removed, stream_keys(table, changed, page_size),
+                                          fingerprint, {key: checksums[key] for key in changed})
+                report.append({"table": table, "status": "updated", "changed_keys": len(changed),
+                               "removed_keys": len(removed), "row_count": mirror.sync_info(table)["row_count"]})
+                continue
+        print(f"Syncing {table}...", file=sys.stderr)
+        count = await mirror.replace_table(table, stream_table(table, page_size), fingerprint, checksums)
+        report.append({"table": table, "status": "synced", "row_count": count})
+    return report
+
+async def get_country_site_codes(country_code: str) -> List[str]:
+    """List the site codes of a country (site codes start with the country code)."""
+    country_code = validate_code(country_code, COUNTRY_CODE_PATTERN, "country code")
+    if MIRROR_SETTINGS["local"]:
+        return get_mirror().keys_with_prefix("Site_Information", country_code)
+    sql = f"""
+    SELECT site_code FROM [BISE].[latest].[Site_Information]
+    WHERE site_code LIKE '{country_code}%'
+    """
+    rows = await query_eea(sql)
+    if rows is None:
+        raise RuntimeError(f"Could not list sites for country {country_code}")
+    return sorted({str(row.get("site_code") or row.get("SITE_CODE")).upper() for row in rows})
+
+async def get_all_site_codes() -> List[str]:
+    """List the codes of all Natura2000 sites."""
+    if MIRROR_SETTINGS["local"]:
+        return get_mirror().keys_with_prefix("Site_Information", "")
+    rows = await query_eea("SELECT site_code FROM [BISE].[latest].[Site_Information]")
+    if rows is None:
+        raise RuntimeError("Could not list Natura2000 sites")
+    return sorted({str(row.get("site_code") or row.get("SITE_CODE")).upper() for row in rows})
+
+async def source_fingerprint(table: str) -> Optional[str]:
+    """Fingerprint of a table as lookups currently see it: the mirror's last sync with --local."""
+    if MIRROR_SETTINGS["local"]:
+        info = get_mirror().sync_info(table)
+        return info["fingerprint"] if info else None
+    return await table_fingerprint(table)
+
 async def get_site_info(site_code: str):
     """Get site information for a Natura2000 site."""
+    site_code = validate_site_code(site_code)
     sql = f"""
     SELECT * FROM [BISE].[latest].[Site_Information]
     WHERE site_code='{site_code}'
     """
-    results = await query_eea(sql)
+    results = await query_table("Site_Information", "site_code", site_code, sql)
     return {
         "@id": f"https://biodiversity.europa.eu/sites/natura2000/{site_code}",
         "source": "https://discodata.eea.europa.eu",
@@ -41,11 +489,12 @@ async def get_site_info(site_code: str):
 
 async def get_site_habitats(site_code: str):
     """Get habitat list for a Natura2000 site."""
+    site_code = validate_site_code(site_code)
     sql = f"""
     SELECT * FROM [BISE].[latest].[Site_Habitats_List]
     WHERE site_code='{site_code}'
     """
-    results = await query_eea(sql)
+    results = await query_table("Site_Habitats_List", "site_code", site_code, sql)
     return {
         "@id": f"https://biodiversity.europa.eu/sites/natura2000/{site_code}",
         "source": "https://discodata.eea.europa.eu",
@@ -54,11 +503,12 @@ async def get_site_habitats(site_code: str):
 
 async def get_site_species(site_code: str):
     """Get species list for a Natura2000 site."""
+    site_code = validate_site_code(site_code)
     sql = f"""
     SELECT * FROM [BISE].[latest].[Site_Species_List_Details]
     WHERE site_code='{site_code}'
     """
-    results = await query_eea(sql)
+    results = await query_table("Site_Species_List_Details", "site_code", site_code, sql)
     return {
         "@id": f"https://biodiversity.europa.eu/sites/natura2000/{site_code}",
         "source": "https://discodata.eea.europa.eu",
@@ -67,81 +517,643 @@ async def get_site_species(site_code: str):
 
 async def get_habitat_info(code_2000: str):
     """Get information about a specific habitat type."""
+    code_2000 = validate_habitat_code(code_2000)
     sql = f"""
     SELECT * FROM [BISE].[latest].[Habitat_Information]
     WHERE code_2000='{code_2000}'
     """
-    results = await query_eea(sql)
+    results = await query_table("Habitat_Information", "code_2000", code_2000, sql)
     return {
         "@id": f"https://biodiversity.europa.eu/habitats/ANNEX1_{code_2000}",
         "source": "https://discodata.eea.europa.eu",
         "results": results
     }
 
+async def _get_many(table: str, column: str, id_base: str, codes: List[str]) -> List[dict]:
+    """Per-code documents, in input order, shaped like the single-code functions."""
+    per_code = await query_eea_many(table, column, codes)
+    return [
+        {"@id": f"{id_base}{code}", "source": "https://discodata.eea.europa.eu", "results": per_code[code]}
+        for code in codes
+    ]
+
+def _unique_site_codes(site_codes: Iterable[str]) -> List[str]:
+    return list(dict.fromkeys(validate_site_code(code) for code in site_codes))
+
+async def get_sites_info(site_codes: Iterable[str]) -> List[dict]:
+    """Get site information for many sites with batched queries."""
+    return await _get_many("Site_Information", "site_code", SITE_ID_BASE, _unique_site_codes(site_codes))
+
+async def get_sites_habitats(site_codes: Iterable[str]) -> List[dict]:
+    """Get habitat lists for many sites with batched queries."""
+    return await _get_many("Site_Habitats_List", "site_code", SITE_ID_BASE, _unique_site_codes(site_codes))
+
+async def get_sites_species(site_codes: Iterable[str]) -> List[dict]:
+    """Get species lists for many sites with batched queries."""
+    return await _get_many("Site_Species_List_Details", "site_code", SITE_ID_BASE, _unique_site_codes(site_codes))
+
+async def get_habitats_info(codes_2000: Iterable[str]) -> List[dict]:
+    """Get information about many habitat types with batched queries."""
+    codes = list(dict.fromkeys(validate_habitat_code(code) for code in codes_2000))
+    return await _get_many("Habitat_Information", "code_2000", HABITAT_ID_BASE, codes)
+
+async def get_sites_bundle(site_codes: Iterable[str]) -> List[dict]:
+    """Get info, habitats and species for many sites as one document per site."""
+    site_codes = _unique_site_codes(site_codes)
+    info, habitats, species = await asyncio.gather(
+        get_sites_info(site_codes),
+        get_sites_habitats(site_codes),
+        get_sites_species(site_codes),
+    )
+    return [
+        {
+            "@id": i["@id"],
+            "source": "https://discodata.eea.europa.eu",
+            "info": i["results"],
+            "habitats": h["results"],
+            "species": s["results"],
+        }
+        for i, h, s in zip(info, habitats, species)
+    ]
+
+async def get_site_bundle(site_code: str):
+    """Get site information, habitats and species concurrently as one document."""
+    site_code = validate_site_code(site_code)
+    info, habitats, species = await asyncio.gather(
+        get_site_info(site_code),
+        get_site_habitats(site_code),
+        get_site_species(site_code),
+    )
+    return {
+        "@id": f"https://biodiversity.europa.eu/sites/natura2000/{site_code}",
+        "source": "https://discodata.eea.europa.eu",
+        "info": info["results"],
+        "habitats": habitats["results"],
+        "species": species["results"],
+    }
+
 def print_json(data):
     """Pretty print JSON data."""
-    print(json.dumps(data, indent=2, ensure_ascii=False))
+    with profiling.span("serialize", "output"):
+        print(json.dumps(data, indent=2, ensure_ascii=False))
 
 def print_help():
     """Print usage information."""
     help_text = """
 BMD Natura2000 CLI Tool
-Usage: python natura2000_cli.py <command> <code>
+Usage: python natura2000_cli.py <command> <code> [<code> ...] [options]
 
 Commands:
   site-info <site_code>       Get site information
   site-habitats <site_code>   Get habitats at a site
   site-species <site_code>    Get species at a site
+  site-bundle <site_code>     Get site info, habitats and species in one document
   habitat-info <code_2000>    Get habitat information
+  site-species-resolved <site_code>
+                              Stream site species rows with GBIF, CoL and EUNIS
+                              identifiers (see Species resolution options)
+  table <table_name>          Stream a whole BISE table (e.g. Site_Species_List_Details)
+  export [<site_code> ...]    Write FAIR JSON-LD or N-Quads documents for all (or the
+                              given) sites into --out-dir (see Export options)
+  query <file>                Run a BMD query document ('-' for stdin; see Query options)
+  sync [<table_name> ...]     Download the Natura2000 tables into the local mirror;
+                              later syncs fetch only the sites whose rows changed
+  serve                       Run as an HTTP service (see Service options)
   help                        Show this help message
 
+Several codes, --from-file or --country return a JSON list with one document
+per code, fetched with batched IN-list queries.
+
+Multi-code options:
+  --from-file <path>          Read codes from a file, one per line ('-' for stdin)
+  --country <cc>              All sites of a country (site-* commands only)
+
+Streaming options:
+  --output <path>             Stream raw rows to a file instead of printing documents;
+                              format from the extension (.ndjson, .csv, .parquet),
+                              '-' writes NDJSON to stdout
+  --format <fmt>              Override the output format (ndjson, csv, parquet)
+  --page-size <n>             Rows per DiscoData page (default: 5000)
+
+Species resolution options (site-species-resolved):
+  Rows are written to --output (default: NDJSON on stdout). Species codes are
+  resolved through the local policy-code table and each unique taxon is
+  resolved once, however many sites list it.
+  --batch-size <n>            Names per Global Names Verifier request (default: 250)
+  --workers <n>               Concurrent GBIF/ChecklistBank lookups (default: 8)
+
+Local mirror options:
+  --local                     Answer lookups from the local mirror (see 'sync')
+  --mirror <path>             Mirror location (default: ~/.bmd_natura2000_mirror.sqlite)
+  --force                     With 'sync': re-download whole tables even if unchanged
+
+Export options:
+  Sites are written to sharded files and only sites whose source rows changed
+  are regenerated; an interrupted export resumes where it stopped. Use
+  --refresh to bypass cached DiscoData responses, or --local after 'sync'.
+  --out-dir <dir>             Output directory (required)
+  --format <fmt>              jsonld (one document per line, default) or nquads
+  --shards <n>                Output files (default: 64)
+  --batch-size <n>            Sites per fetch and serialisation task (default: 200)
+  --workers <n>               Shards processed concurrently (default: 4)
+  --processes <n>             Serialisation processes (default: CPU count; 0: none)
+  --force                     Regenerate every site
+
+Query options:
+  Taxon resolution, site lookup and each provider (GBIF, EEA) run as concurrent
+  steps; the response reports each step's status and timings. Step results are
+  cached by content hash (disabled by --no-cache).
+  --index <dir>               Also report sites and STAC items in the query area
+                              from a spatial index
+  --node-cache <path>         Step result cache (default: ~/.bmd_query_nodes.sqlite)
+
+Service options:
+  --host <address>            Address to listen on (default: 127.0.0.1)
+  --port <n>                  Port to listen on (default: 8000)
+  Endpoints: GET /sites/{siteCode}, /sites/{siteCode}/info, /sites/{siteCode}/habitats,
+  /sites/{siteCode}/species, /habitats/{code2000}, /species/{nameOrPolicyCode},
+  /health and /metrics (Prometheus); data cube jobs: POST /sites/{siteCode}/datacubes,
+  GET /datacubes/{jobId} and /datacubes/{jobId}/result
+  --cube-workers <n>          Concurrent data cube builds (default: 2)
+  --cube-queue <n>            Queued builds before POSTs get 503 (default: 100)
+  --cube-dir <path>           Built cube store (default: ~/.bmd_datacubes)
+  --cube-builder <name>       Cube builder (default: stub)
+
+Diagnostics:
+  --profile <prefix>          Write <prefix>.json (summary), <prefix>.trace.json
+                              (Chrome trace) and <prefix>.prom (Prometheus metrics)
+
+HTTP client options:
+  --timeout <seconds>         Request timeout (default: 20)
+  --max-connections <n>       Connection pool size (default: 20)
+  --keepalive <n>             Idle keep-alive connections to retain (default: 10)
+  --http2                     Use HTTP/2 (requires the 'h2' package)
+
+Cache options:
+  --offline                   Answer only from the local response cache
+  --refresh                   Revalidate cached responses regardless of age
+  --no-cache                  Do not read or write the response cache
+  --cache-ttl <seconds>       Response freshness lifetime (default: 7 days)
+  --cache-file <path>         Cache location (default: ~/.bmd_natura2000_cache.sqlite)
+
 Examples:
   python natura2000_cli.py site-info NL9801015
   python natura2000_cli.py site-habitats NL9801015
   python natura2000_cli.py site-species NL9801015
+  python natura2000_cli.py site-bundle NL9801015
   python natura2000_cli.py habitat-info 6230
+  python natura2000_cli.py site-species --from-file codes.txt
+  python natura2000_cli.py site-species --country AT
+  python natura2000_cli.py site-species --country AT --output at_species.csv
+  python natura2000_cli.py site-species-resolved --country AT --output at_taxa.parquet
+  python natura2000_cli.py table Site_Species_List_Details --output species.parquet
+  python natura2000_cli.py sync
+  python natura2000_cli.py site-species NL9801015 --local
+  python natura2000_cli.py export --local --out-dir fair/
+  python natura2000_cli.py export --country AT --format nquads --out-dir fair-at/
+  python natura2000_cli.py query bmd-query-example.json
+  python natura2000_cli.py serve --port 8000
 """
     print(help_text)
 
+# Options that are switches; every other --option takes a value
+FLAG_OPTIONS = {"http2", "offline", "refresh", "no-cache", "local", "force"}
+
+def parse_args(argv):
+    """Split argv into positional arguments and a dict of --options."""
+    positional, options = [], {}
+    args = iter(argv)
+    for arg in args:
+        if arg.startswith("--") and arg != "--help":
+            key, sep, value = arg[2:].partition("=")
+            if sep:
+                options[key] = value
+            elif key in FLAG_OPTIONS:
+                options[key] = True
+            else:
+                options[key] = next(args, None)
+                if options[key] is None:
+                    print(f"Error: Option '--{key}' requires a value", file=sys.stderr)
+                    sys.exit(1)
+        else:
+            positional.append(arg)
+    return positional, options
+
+def read_codes(path: str) -> List[str]:
+    """Read codes from a file ('-' for stdin), one per line, skipping '#' comments."""
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        return [line.strip() for line in stream if line.strip() and not line.lstrip().startswith("#")]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def apply_client_options(options):
+    """Configure the shared HTTP client from CLI options."""
+    settings = {}
+    try:
+        if "timeout" in options:
+            settings["timeout"] = float(options["timeout"])
+        if "max-connections" in options:
+            settings["max_connections"] = int(options["max-connections"])
+        if "keepalive" in options:
+            settings["max_keepalive_connections"] = int(options["keepalive"])
+    except ValueError as e:
+        print(f"Error: Invalid option value: {e}", file=sys.stderr)
+        sys.exit(1)
+    if options.get("http2"):
+        settings["http2"] = True
+    configure_client(**settings)
+
+def apply_cache_options(options):
+    """Configure the response cache from CLI options."""
+    settings = {
+        "enabled": not options.get("no-cache", False),
+        "offline": bool(options.get("offline")),
+        "refresh": bool(options.get("refresh")),
+    }
+    if settings["offline"] and not settings["enabled"]:
+        print("Error: --offline cannot be combined with --no-cache", file=sys.stderr)
+        sys.exit(1)
+    try:
+        if "cache-ttl" in options:
+            settings["ttl"] = float(options["cache-ttl"])
+    except ValueError as e:
+        print(f"Error: Invalid option value: {e}", file=sys.stderr)
+        sys.exit(1)
+    if "cache-file" in options:
+        settings["path"] = options["cache-file"]
+    configure_cache(**settings)
+
+SINGLE_COMMANDS = {
+    "site-info": get_site_info,
+    "site-habitats": get_site_habitats,
+    "site-species": get_site_species,
+    "site-bundle": get_site_bundle,
+    "habitat-info": get_habitat_info,
+}
+
+BATCH_COMMANDS = {
+    "site-info": get_sites_info,
+    "site-habitats": get_sites_habitats,
+    "site-species": get_sites_species,
+    "site-bundle": get_sites_bundle,
+    "habitat-info": get_habitats_info,
+}
+
+def apply_mirror_options(options):
+    """Configure the local mirror from CLI options."""
+    settings = {"local": bool(options.get("local"))}
+    if "mirror" in options:
+        settings["path"] = options["mirror"]
+    configure_mirror(**settings)
+
+async def collect_codes(command: str, codes: List[str], options: dict) -> List[str]:
+    """Combine positional codes with --country and --from-file codes."""
+    if "country" in options:
+        if command == "habitat-info":
+            raise ValueError("--country only applies to site commands")
+        codes = codes + await get_country_site_codes(options["country"])
+    if "from-file" in options:
+        codes = codes + read_codes(options["from-file"])
+    return codes
+
+async def run_command(command: str, codes: List[str], options: dict):
+    """Dispatch a command to the single-code or batched implementation."""
+    codes = await collect_codes(command, codes, options)
+    if len(codes) == 1 and "country" not in options and "from-file" not in options:
+        return await SINGLE_COMMANDS[command](codes[0])
+    return await BATCH_COMMANDS[command](codes)
+
+async def run_streaming(command: str, args: List[str], options: dict) -> int:
+    """Stream rows for a command into the --output sink; returns the row count."""
+    try:
+        page_size = int(options.get("page-size", PAGE_SIZE))
+    except ValueError as e:
+        raise ValueError(f"Invalid option value: {e}")
+    if command == "table":
+        rows = stream_table(args[0], page_size)
+    elif command in COMMAND_TABLES:
+        rows = stream_command_rows(command, await collect_codes(command, args, options), page_size)
+    else:
+        raise ValueError(f"Command '{command}' does not support --output")
+
+    from record_sinks import open_sink
+    count = 0
+    with open_sink(options.get("output", "-"), options.get("format")) as sink:
+        async for record in rows:
+            sink.write(record)
+            count += 1
+    return count
+
+async def run_species_pipeline(args: List[str], options: dict) -> dict:
+    """Stream site species rows joined with resolved taxon identities into --output."""
+    try:
+        import site_species_pipeline as pipeline
+        import species_identifier_resolverv2 as species
+        if importlib.util.find_spec("requests") is None:   # SpeciesResolver's client
+            raise ImportError("No module named 'requests'")
+    except ImportError as e:
+        raise RuntimeError(f"Species resolution is not available ({e})")
+    try:
+        page_size = int(options.get("page-size", PAGE_SIZE))
+        batch_size = int(options.get("batch-size", species.GNV_BATCH_SIZE))
+        workers = int(options.get("workers", species.MAX_WORKERS))
+    except ValueError as e:
+        raise ValueError(f"Invalid option value: {e}")
+
+    codes = await collect_codes("site-species", args, options)
+    policy_cache = species.PolicyCodeCache(verbose=False)
+    policy_cache.load()
+    resolver = species.SpeciesResolver(policy_cache, verbose=False, identity_cache=get_identity_cache(species))
+    rows = stream_command_rows("site-species", codes, page_size)
+    from record_sinks import open_sink
+    with open_sink(options.get("output", "-"), options.get("format")) as sink:
+        return await pipeline.resolve_site_species(rows, resolver, sink, batch_size, workers)
+
+def get_identity_cache(species):
+    """Return the process-wide cache of GBIF/ChecklistBank/GNV responses, opening it on first use."""
+    global _identity_cache
+    if _identity_cache is None:
+        _identity_cache = species.IdentityCache()
+    return _identity_cache
+
+def close_identity_cache():
+    """Close the species resolvers' response cache."""
+    global _identity_cache
+    if _identity_cache is not None:
+        _identity_cache.close()
+        _identity_cache = None
+
+def load_species_resolver():
+    """Async species resolver with its policy-code table loaded, or None if unavailable."""
+    if str(RESOLVER_DIR) not in sys.path:
+        sys.path.insert(0, str(RESOLVER_DIR))
+    try:
+        import species_identifier_resolverv2 as species
+        if importlib.util.find_spec("httpx") is None:   # AsyncSpeciesResolver's client
+            raise ImportError("No module named 'httpx'")
+    except ImportError as e:
+        print(f"Warning: species resolution disabled ({e})", file=sys.stderr)
+        return None
+    policy_cache = species.PolicyCodeCache(verbose=False)
+    policy_cache.load()
+    return species.AsyncSpeciesResolver(policy_cache, verbose=False,
+                                        identity_cache=get_identity_cache(species))
+
+async def run_export(args: List[str], options: dict) -> dict:
+    """Write FAIR site documents for the given sites (default: all) into --out-dir."""
+    import fair_export
+    if "out-dir" not in options:
+        raise ValueError("Command 'export' requires --out-dir <dir>")
+    try:
+        exporter = fair_export.SiteExporter(
+            sys.modules[__name__], Path(options["out-dir"]), options.get("format", "jsonld"),
+            shards=int(options.get("shards", fair_export.DEFAULT_SHARDS)),
+            batch_size=int(options.get("batch-size", fair_export.DEFAULT_BATCH_SIZE)),
+            concurrency=int(options.get("workers", fair_export.DEFAULT_CONCURRENCY)),
+            processes=int(options["processes"]) if "processes" in options else None,
+        )
+    except ValueError as e:
+        raise ValueError(f"Invalid option value: {e}")
+    codes = None
+    if args or "country" in options or "from-file" in options:
+        codes = await collect_codes("site-bundle", args, options)
+    return await exporter.export(codes, bool(options.get("force")))
+
+async def run_query(path: str, options: dict) -> dict:
+    """Execute a BMD query document (see bmd-query-example.json)."""
+    import query_executor
+    from eea_response_cache import ResponseCache
+    document = query_executor.load_query(path)
+    index = None
+    if "index" in options:
+        from spatial_index import SpatialIndex
+        index = SpatialIndex(Path(options["index"]))
+    node_cache = None
+    if not options.get("no-cache"):
+        node_cache = ResponseCache(Path(options.get("node-cache", query_executor.DEFAULT_NODE_CACHE_FILE)),
+                                   query_executor.NODE_CACHE_TTL)
+    executor = query_executor.QueryExecutor(sys.modules[__name__], None, index, node_cache)
+    try:
+        if "taxon" in executor.plan(document):
+            executor.resolver = load_species_resolver()
+        return await executor.execute(document)
+    finally:
+        if executor.resolver is not None:
+            await executor.resolver.aclose()
+        if node_cache is not None:
+            node_cache.close()
+        if index is not None:
+            index.close()
+
+def _lookup_endpoint(lookup, param: str, fields=("results",)):
+    """Wrap a lookup as a handler; a failed upstream query becomes a 502."""
+    from http_service import HTTPError
+
+    async def handler(params, query):
+        document = await lookup(params[param])
+        if any(document[field] is None for field in fields):
+            raise HTTPError(502, "Upstream query failed")
+        return document
+    return handler
+
+def add_datacube_routes(router: "Router", engine):
+    """Routes of API/bmd-datacube-engine-api.yaml, backed by a DataCubeEngine."""
+    from datacube_engine import EngineBusy
+    from http_service import HTTPError, JSONResponse
+
+    async def trigger(params, query, body):
+        site_code = validate_site_code(params["siteCode"])
+        try:
+            job, built = engine.submit(site_code, body)
+        except EngineBusy as e:
+            raise HTTPError(503, str(e), {"Retry-After": str(DATACUBE_RETRY_AFTER)})
+        return JSONResponse(job.document(), 200 if built else 202,
+                            {"Location": f"/datacubes/{job.job_id}"})
+
+    def find_job(job_id: str):
+        job = engine.get(job_id)
+        if job is None:
+            raise HTTPError(404, f"No data cube job {job_id}")
+        return job
+
+    async def job_status(params, query):
+        return find_job(params["jobId"]).document()
+
+    async def job_result(params, query):
+        job = find_job(params["jobId"])
+        if job.status != "succeeded":
+            raise HTTPError(409, f"Job is {job.status}")
+        item = engine.result(job)
+        if item is None:
+            raise HTTPError(404, "The built cube is no longer available")
+        return item
+
+    router.add("/sites/{siteCode}/datacubes", trigger, "POST")
+    router.add("/datacubes/{jobId}", job_status)
+    router.add("/datacubes/{jobId}/result", job_result)
+
+async def notify_callback(job):
+    """POST a finished job's DataCubeJob document to each callbackUrl it was requested with."""
+    from bmd_common.traffic_control import controlled_request_async
+    for url in job.callbacks:
+        try:
+            response = await controlled_request_async(get_client(), "POST", url, json=job.document())
+            response.raise_for_status()
+        except Exception as e:
+            print(f"Data cube job {job.job_id} callback to {url} failed: {e}", file=sys.stderr)
+
+def build_router(resolver=None, engine=None) -> "Router":
+    """Service routes, following the /sites/{siteCode}/... resource pattern."""
+    from http_service import HTTPError, Router, TextResponse
+    from bmd_common.traffic_control import controller_stats
+    router = Router()
+    router.add("/sites/{siteCode}/info", _lookup_endpoint(get_site_info, "siteCode"))
+    router.add("/sites/{siteCode}/habitats", _lookup_endpoint(get_site_habitats, "siteCode"))
+    router.add("/sites/{siteCode}/species", _lookup_endpoint(get_site_species, "siteCode"))
+    router.add("/sites/{siteCode}", _lookup_endpoint(get_site_bundle, "siteCode",
+                                                     ("info", "habitats", "species")))
+    router.add("/habitats/{code2000}", _lookup_endpoint(get_habitat_info, "code2000"))
+
+    async def resolve_species(params, query):
+        if resolver is None:
+            raise HTTPError(503, "Species resolution is not available in this service")
+        with profiling.span("resolve", "app"):
+            return asdict(await resolver.resolve(params["query"]))
+
+    async def health(params, query):
+        return {"status": "ok", "species_resolver": resolver is not None, "hosts": controller_stats(),
+                "datacubes": engine.stats() if engine is not None else None}
+
+    async def metrics(params, query):
+        return TextResponse(profiling.prometheus_text())
+
+    router.add("/species/{query}", resolve_species)
+    router.add("/health", health)
+    router.add("/metrics", metrics)
+    if engine is not None:
+        add_datacube_routes(router, engine)
+    return router
+
+async def run_service(options: dict):
+    """Serve the lookups over HTTP until interrupted, keeping pools and caches warm."""
+    import datacube_engine
+    from http_service import serve
+    try:
+        host = options.get("host", SERVE_HOST)
+        port = int(options.get("port", SERVE_PORT))
+        workers = int(options.get("cube-workers", datacube_engine.DEFAULT_WORKERS))
+        queue_depth = int(options.get("cube-queue", datacube_engine.DEFAULT_QUEUE_DEPTH))
+    except ValueError as e:
+        raise ValueError(f"Invalid option value: {e}")
+    profiling.enable(trace=False)
+    store = datacube_engine.CubeStore(Path(options.get("cube-dir", datacube_engine.DEFAULT_CUBE_DIR)))
+    engine = datacube_engine.DataCubeEngine(store, options.get("cube-builder", "stub"), workers=workers,
+                                            queue_depth=queue_depth, on_complete=notify_callback)
+    resolver = load_species_resolver()
+    try:
+        async with engine:
+            await serve(build_router(resolver, engine), host, port)
+    finally:
+        if resolver is not None:
+            await resolver.aclose()
+
+def is_reportable_error(error: Exception) -> bool:
+    """Errors main() reports as a message: bad input, failed upstreams and HTTP errors.
+
+    httpx is only consulted if something already imported it, so runs that
+    never made a request (--local, --offline, help) do not need it.
+    """
+    if isinstance(error, (ValueError, RuntimeError)):
+        return True
+    httpx = sys.modules.get("httpx")
+    return httpx is not None and isinstance(error, httpx.HTTPError)
+
 async def main():
     """Main CLI entry point."""
-    if len(sys.argv) < 2:
+    args, options = parse_args(sys.argv[1:])
+
+    if len(args) < 1:
         print("Error: No command provided", file=sys.stderr)
         print_help()
         sys.exit(1)
     
-    command = sys.argv[1].lower()
+    command = args[0].lower()
     
     if command == "help" or command == "-h" or command == "--help":
         print_help()
         sys.exit(0)
     
-    if len(sys.argv) < 3:
+    if command not in SINGLE_COMMANDS and command not in ("table", "sync", "serve", "site-species-resolved", "query", "export"):
+        print(f"Error: Unknown command '{command}'", file=sys.stderr)
+        print_help()
+        sys.exit(1)
+    
+    if command == "query" and len(args) < 2:
+        print("Error: Command 'query' requires a query document", file=sys.stderr)
+        print_help()
+        sys.exit(1)
+    if len(args) < 2 and command not in ("sync", "serve", "export") and "from-file" not in options and "country" not in options:
         print(f"Error: Command '{command}' requires a code argument", file=sys.stderr)
         print_help()
         sys.exit(1)
     
-    code = sys.argv[2]
+    apply_client_options(options)
+    apply_cache_options(options)
+    apply_mirror_options(options)
+    if command == "serve":
+        configure_cache(memory_items=SERVE_MEMORY_ITEMS)
+    if "profile" in options:
+        profiling.enable()
     
     result = None
+    streamed = False
     
-    if command == "site-info":
-        result = await get_site_info(code)
-    elif command == "site-habitats":
-        result = await get_site_habitats(code)
-    elif command == "site-species":
-        result = await get_site_species(code)
-    elif command == "habitat-info":
-        result = await get_habitat_info(code)
-    else:
-        print(f"Error: Unknown command '{command}'", file=sys.stderr)
-        print_help()
+    try:
+        if command == "serve":
+            await run_service(options)
+            return
+        if command == "sync":
+            page_size = int(options.get("page-size", PAGE_SIZE))
+            result = await sync_mirror(args[1:], bool(options.get("force")), page_size)
+        elif command == "export":
+            result = await run_export(args[1:], options)
+        elif command == "query":
+            result = await run_query(args[1], options)
+        elif command == "site-species-resolved":
+            stats = await run_species_pipeline(args[1:], options)
+            print(f"Wrote {stats['rows']} rows for {stats['taxa']} unique taxa "
+                  f"({stats['gbif_matched']} matched in GBIF)", file=sys.stderr)
+            streamed = True
+        elif command == "table" or "output" in options:
+            count = await run_streaming(command, args[1:], options)
+            print(f"Wrote {count} records", file=sys.stderr)
+            streamed = True
+        else:
+            result = await run_command(command, args[1:], options)
+    except Exception as e:
+        if not is_reportable_error(e):
+            raise
+        print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
+    finally:
+        await close_client()
+        close_cache()
+        close_mirror()
+        close_identity_cache()
     
     if result:
         print_json(result)
-    else:
+    if "profile" in options:
+        from bmd_common.traffic_control import controller_stats
+        profiling.write_profile(options["profile"], {"command": command, "hosts": controller_stats()})
+        print(f"Profile written to {options['profile']}.{{json,trace.json,prom}}", file=sys.stderr)
+    if not result and not streamed:
         sys.exit(1)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        sys.exit(130)
@@ -0,0 +1,343 @@
+"""
+Executor for BMD structured query documents (see bmd-query-example.json).
+
+A query is planned as a DAG of nodes, and each node awaits only the nodes
+it depends on:
+
+    taxon ─┬──────────────┬─> provider:<GBIF>   (occurrence counts per year)
+           │              └─> provider:<EEA>    (Natura2000 records in the country)
+           └─> site_taxon <─ site               (site bundle: info, habitats, species)
+    area                                         (sites/items in the spatial index)
+
+- taxon: filter.taxon resolved with AsyncSpeciesResolver (policy code, GBIF
+  usage key, ...), or taken from the document if resolution is unavailable.
+- site: get_site_bundle() for filter.site.codeSite.
+- site_taxon: the site's Site_Species_List_Details rows for the taxon.
+- area: sites and STAC items intersecting filter.spatial.geometry (or the
+  site) and filter.temporal, when a SpatialIndex is configured.
+- provider:<participantID>: one node per supported filter.providers entry.
+
+Independent nodes run concurrently. Nodes of the same kind draw from
+concurrency limits (LIMITS) that are shared by every query run on an
+executor. Node results are cached by content hash: a hash of the node
+kind, its inputs and the hashes of its dependencies' results. So a
+changed upstream answer invalidates the nodes below it, and an identical
+one reuses them. The response document reports each node's status, queue
+wait and run time, and the critical path through the DAG.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import sys
+import time
+from dataclasses import asdict, dataclass, is_dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from eea_response_cache import ResponseCache
+from bmd_common.traffic_control import controlled_request_async
+from bmd_common import profiling
+
+GBIF_OCCURRENCE_URL = "https://api.gbif.org/v1/occurrence/search"
+GBIF_PARTICIPANT = "urn:bmd:participant:GBIF"
+EEA_PARTICIPANT = "urn:bmd:participant:EEA"
+
+SPECIES_CODE_PATTERN = re.compile(r"^[A-Z0-9]{4}$")           # e.g. A338, 1354
+
+# Concurrent node runs per group, shared by all queries on one executor
+LIMITS = {"resolver": 4, "eea": 4, "gbif": 4, "local": 8}
+DEFAULT_NODE_CACHE_FILE = Path.home() / ".bmd_query_nodes.sqlite"
+NODE_CACHE_TTL = 24 * 3600
+
+NodeRun = Callable[[Dict[str, object]], Awaitable[object]]
+
+@dataclass
+class Node:
+    """A unit of work; run receives the results of depends_on (None for failed ones)."""
+    name: str
+    group: str
+    run: NodeRun
+    inputs: dict
+    depends_on: Tuple[str, ...] = ()
+    cacheable: bool = True
+
+def content_hash(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+                          .encode("utf-8")).hexdigest()
+
+def polygon_wkt(geometry: dict) -> str:
+    """WKT of a GeoJSON Polygon's outer ring, counter-clockwise as the GBIF API expects."""
+    if geometry.get("type") != "Polygon":
+        raise ValueError("filter.spatial.geometry must be a GeoJSON Polygon")
+    ring = [tuple(point[:2]) for point in geometry["coordinates"][0]]
+    area = sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]))
+    if area < 0:
+        ring.reverse()
+    return "POLYGON((" + ", ".join(f"{x} {y}" for x, y in ring) + "))"
+
+def year_range(temporal: dict) -> Optional[str]:
+    """GBIF year filter ('1995,2025') from filter.temporal."""
+    start, end = (temporal.get("from") or "")[:4], (temporal.get("to") or "")[:4]
+    if not start and not end:
+        return None
+    return f"{start or '*'},{end or '*'}"
+
+def _as_dict(value):
+    return asdict(value) if is_dataclass(value) else value
+
+# --- Node implementations ----------------------------------------------------
+
+async def gbif_occurrence_trend(natura, taxon: Optional[dict], query_filter: dict) -> dict:
+    """Occurrence counts per year for the taxon within the query area and period."""
+    params = {"limit": 0, "facet": "year", "facetLimit": 1000}
+    if taxon and taxon.get("gbif_usage_key"):
+        params["taxonKey"] = taxon["gbif_usage_key"]
+    else:
+        name = (taxon or {}).get("scientific_name") or query_filter.get("taxon", {}).get("scientificName")
+        if not name:
+            raise ValueError("No taxon to query GBIF for")
+        params["scientificName"] = name
+    spatial = query_filter.get("spatial") or {}
+    if spatial.get("geometry"):
+        params["geometry"] = polygon_wkt(spatial["geometry"])
+    elif spatial.get("countryCode"):
+        params["country"] = spatial["countryCode"]
+    years = year_range(query_filter.get("temporal") or {})
+    if years:
+        params["year"] = years
+
+    response = await controlled_request_async(natura.get_client(), "GET", GBIF_OCCURRENCE_URL, params=params)
+    response.raise_for_status()
+    data = profiling.parse_json(response, "gbif")
+    counts = next((facet.get("counts", []) for facet in data.get("facets", [])
+                   if facet.get("field") == "YEAR"), [])
+    return {
+        "source": GBIF_OCCURRENCE_URL,
+        "parameters": params,
+        "total": data.get("count"),
+        "per_year": {c["name"]: c["count"] for c in sorted(counts, key=lambda c: int(c["name"]))},
+    }
+
+async def eea_country_records(natura, taxon: Optional[dict], query_filter: dict) -> dict:
+    """Natura2000 site records (population bounds etc.) of the taxon in the query's country."""
+    code = (taxon or {}).get("policy_code") or query_filter.get("taxon", {}).get("code2000")
+    if not code:
+        raise ValueError("The taxon has no Natura2000 species code")
+    country = (query_filter.get("spatial") or {}).get("countryCode")
+    code = natura.validate_code(code, SPECIES_CODE_PATTERN, "species code")
+    where = f"species_code='{code}'"
+    if country:
+        where += f" AND site_code LIKE '{natura.validate_code(country, natura.COUNTRY_CODE_PATTERN, 'country code')}%'"
+    rows = await natura.query_eea(f"SELECT * FROM [BISE].[latest].[Site_Species_List_Details] WHERE {where}")
+    if rows is None:
+        raise RuntimeError("EEA query failed")
+    return {"source": "https://discodata.eea.europa.eu", "species_code": code, "country": country,
+            "sites": len({row.get("site_code") for row in rows}), "records": rows}
+
+def site_taxon_rows(site: Optional[dict], taxon: Optional[dict]) -> Optional[list]:
+    """The site's species rows for the taxon, matched on species code or name."""
+    if site is None or taxon is None or site.get("species") is None:
+        return None
+    code = taxon.get("policy_code")
+    names = {(taxon.get(key) or "").lower() for key in ("canonical_name", "scientific_name")} - {""}
+    return [row for row in site["species"]
+            if (code and row.get("species_code") == code)
+            or (row.get("species_name") or "").lower() in names]
+
+PROVIDERS = {
+    GBIF_PARTICIPANT: ("gbif", gbif_occurrence_trend),
+    EEA_PARTICIPANT: ("eea", eea_country_records),
+}
+
+# --- Executor ----------------------------------------------------------------
+
+class QueryExecutor:
+    """
+    Plans and runs BMD query documents. natura is the natura_2000_query
+    module, whose configured client, cache and mirror serve the upstream
+    calls. resolver is an AsyncSpeciesResolver (load_species_resolver()),
+    index a SpatialIndex; both optional. cache is a ResponseCache for node
+    results (None disables it).
+    """
+
+    def __init__(self, natura, resolver=None, index=None, cache: Optional[ResponseCache] = None,
+                 limits: Optional[Dict[str, int]] = None):
+        self.natura = natura
+        self.resolver = resolver
+        self.index = index
+        self.cache = cache
+        self.limits = {**LIMITS, **(limits or {})}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _semaphore(self, group: str) -> asyncio.Semaphore:
+        if group not in self._semaphores:
+            self._semaphores[group] = asyncio.Semaphore(self.limits.get(group, LIMITS["local"]))
+        return self._semaphores[group]
+
+    def plan(self, document: dict) -> Dict[str, Node]:
+        """The node DAG for a query document."""
+        query_filter = document.get("filter")
+        if not isinstance(query_filter, dict):
+            raise ValueError("Query document has no filter")
+        taxon = query_filter.get("taxon") or {}
+        site = query_filter.get("site") or {}
+        spatial = query_filter.get("spatial") or {}
+        nodes: Dict[str, Node] = {}
+
+        if taxon:
+            query = taxon.get("code2000") or taxon.get("scientificName")
+            if not query:
+                raise ValueError("filter.taxon needs code2000 or scientificName")
+
+            async def resolve_taxon(_):
+                if self.resolver is None:
+                    return {"query": query, "scientific_name": taxon.get("scientificName"),
+                            "policy_code": taxon.get("code2000"), "source": "query document"}
+                return _as_dict(await self.resolver.resolve(query))
+            nodes["taxon"] = Node("taxon", "resolver", resolve_taxon, {"query": query})
+
+        if site.get("codeSite"):
+            site_code = self.natura.validate_site_code(site["codeSite"])
+
+            async def site_bundle(_):
+                bundle = await self.natura.get_site_bundle(site_code)
+                failed = [part for part, value in bundle.items() if value is None]
+                if failed:
+                    raise RuntimeError(f"EEA query failed for the {', '.join(failed)} of site {site_code}")
+                return bundle
+            nodes["site"] = Node("site", "eea", site_bundle, {"site_code": site_code})
+            if "taxon" in nodes:
+                async def match_site_taxon(results):
+                    return site_taxon_rows(results["site"], results["taxon"])
+                nodes["site_taxon"] = Node("site_taxon", "local", match_site_taxon, {},
+                                           ("site", "taxon"), cacheable=False)
+
+        if self.index is not None and (spatial.get("geometry") or site.get("codeSite")):
+            async def area(_):
+                return self.index.query(document)
+            nodes["area"] = Node("area", "local", area, {}, cacheable=False)
+
+        for provider in query_filter.get("providers") or []:
+            participant = provider.get("participantID")
+            if participant not in PROVIDERS or "taxon" not in nodes:
+                continue
+            group, fetch = PROVIDERS[participant]
+
+            async def run_provider(results, fetch=fetch):
+                return await fetch(self.natura, results["taxon"], query_filter)
+            inputs = {"participant": participant,
+                      "filter": {key: query_filter.get(key) for key in ("spatial", "temporal")}}
+            nodes[f"provider:{participant}"] = Node(f"provider:{participant}", group, run_provider,
+                                                     inputs, ("taxon",))
+        return nodes
+
+    async def _run_node(self, node: Node, done: Dict[str, asyncio.Future], report: dict, origin: float):
+        results, hashes = {}, {}
+        for dependency in node.depends_on:
+            results[dependency], hashes[dependency] = await done[dependency]
+        entry = {"dependsOn": list(node.depends_on), "status": "ok"}
+        report[node.name] = entry
+        key = content_hash({"node": node.name, "inputs": node.inputs, "deps": hashes})
+        cached = self.cache.get(key) if self.cache is not None and node.cacheable else None
+        if cached is not None and cached.fresh:
+            entry.update(status="cached", startMs=round((time.perf_counter() - origin) * 1000, 3),
+                         waitMs=0.0, ms=0.0)
+            entry["endMs"] = entry["startMs"]
+            profiling.cache_lookup("query_node", True)
+            return cached.data, content_hash(cached.data)
+
+        queued = time.perf_counter()
+        async with self._semaphore(node.group):
+            started = time.perf_counter()
+            try:
+                with profiling.span(node.name, "query_node", group=node.group):
+                    result = _as_dict(await node.run(results))
+            except Exception as e:
+                result = None
+                entry.update(status="failed", error=f"{type(e).__name__}: {e}")
+            finished = time.perf_counter()
+        entry.update(startMs=round((started - origin) * 1000, 3), waitMs=round((started - queued) * 1000, 3),
+                     ms=round((finished - started) * 1000, 3), endMs=round((finished - origin) * 1000, 3))
+        profiling.observe("query_node_seconds", finished - started, node=node.name.split(":")[0])
+        # An identity built without a failed or timed-out source is served, not cached
+        if (result is not None and self.cache is not None and node.cacheable
+                and not (isinstance(result, dict) and result.get("unavailable_sources"))):
+            profiling.cache_lookup("query_node", False)
+            self.cache.put(key, result)
+        return result, (content_hash(result) if result is not None else None)
+
+    async def execute(self, document: dict) -> dict:
+        """Run a query document; returns the response document."""
+        nodes = self.plan(document)
+        origin = time.perf_counter()
+        report: Dict[str, dict] = {}
+        done: Dict[str, asyncio.Future] = {}
+        tasks = {}
+        for name in nodes:
+            done[name] = asyncio.get_running_loop().create_future()
+
+        async def run(node: Node):
+            try:
+                outcome = await self._run_node(node, done, report, origin)
+            except BaseException:
+                done[node.name].set_result((None, None))
+                raise
+            done[node.name].set_result(outcome)
+
+        for name, node in nodes.items():
+            tasks[name] = asyncio.ensure_future(run(node))
+        await asyncio.gather(*tasks.values())
+        elapsed = time.perf_counter() - origin
+        results = {name: done[name].result()[0] for name in nodes}
+
+        query_filter = document["filter"]
+        providers = {}
+        for provider in query_filter.get("providers") or []:
+            participant = provider.get("participantID")
+            name = f"provider:{participant}"
+            if name in nodes:
+                providers[participant] = {"organisation": provider.get("organisation"),
+                                          "status": report[name]["status"], "result": results[name]}
+            else:
+                providers[participant] = {"organisation": provider.get("organisation"), "status": "unsupported"}
+        failed = [name for name, entry in report.items() if entry["status"] == "failed"]
+        return {
+            "queryId": document.get("queryId"),
+            "queryType": document.get("queryType"),
+            "status": "partial" if failed else "completed",
+            "taxon": results.get("taxon"),
+            "site": results.get("site"),
+            "siteTaxon": results.get("site_taxon"),
+            "area": results.get("area"),
+            "providers": providers,
+            "execution": {
+                "elapsedMs": round(elapsed * 1000, 3),
+                "nodes": report,
+                "criticalPath": critical_path(report),
+            },
+        }
+
+def critical_path(report: Dict[str, dict]) -> List[str]:
+    """Nodes on the longest chain: from the last node to finish back through its latest dependency."""
+    if not report:
+        return []
+    name = max(report, key=lambda n: report[n]["endMs"])
+    path = [name]
+    while report[name]["dependsOn"]:
+        name = max(report[name]["dependsOn"], key=lambda n: report[n]["endMs"])
+        path.append(name)
+    return path[::-1]
+
+def load_query(path: str) -> dict:
+    """A query document from a JSON file ('-' for stdin)."""
+    try:
+        if path == "-":
+            return json.load(sys.stdin)
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except OSError as e:
+        raise ValueError(f"Cannot read query document: {e}")
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Query document is not valid JSON: {e}")
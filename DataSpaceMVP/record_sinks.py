@@ -0,0 +1,170 @@
+"""
+Incremental record writers for streamed DiscoData results.
+
+Each sink accepts one record (a flat dict) at a time, so peak memory is
+bounded by what the sink buffers, not by the size of the result set.
+"""
+
+import csv
+import importlib.util
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+HEADER_ROWS = 1000   # records buffered to collect the CSV header
+
+def _columns(records: List[dict]) -> Dict[str, None]:
+    """Keys of records in order of first appearance."""
+    columns = {}
+    for record in records:
+        for key in record:
+            columns.setdefault(key, None)
+    return columns
+
+def _check_columns(record: dict, columns, fmt: str, buffered: int):
+    unknown = [key for key in record if key not in columns]
+    if unknown:
+        raise ValueError(f"{fmt} output: column(s) {', '.join(map(repr, unknown))} first appear after "
+                         f"the first {buffered} records, which fixed the columns; use NDJSON output "
+                         "for records with varying fields")
+
+class RecordSink:
+    """Base class: write records one at a time, then close."""
+
+    def write(self, record: dict):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class NDJSONSink(RecordSink):
+    """One JSON object per line."""
+
+    def __init__(self, path: str):
+        self.stream = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+
+    def write(self, record: dict):
+        self.stream.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    def close(self):
+        if self.stream is sys.stdout:
+            self.stream.flush()
+        else:
+            self.stream.close()
+
+class CSVSink(RecordSink):
+    """
+    CSV with the header collected from the keys of the first header_rows
+    records; a later record with a new key raises ValueError rather than
+    losing the value.
+    """
+
+    def __init__(self, path: str, header_rows: int = HEADER_ROWS):
+        self.stream = sys.stdout if path == "-" else open(path, "w", encoding="utf-8", newline="")
+        self.header_rows = header_rows
+        self.buffer = []
+        self.writer: Optional[csv.DictWriter] = None
+
+    def write(self, record: dict):
+        if self.writer is None:
+            self.buffer.append(record)
+            if len(self.buffer) >= self.header_rows:
+                self._start()
+            return
+        _check_columns(record, self.writer.fieldnames, "CSV", self.header_rows)
+        self.writer.writerow(record)
+
+    def _start(self):
+        self.writer = csv.DictWriter(self.stream, fieldnames=list(_columns(self.buffer)))
+        self.writer.writeheader()
+        self.writer.writerows(self.buffer)
+        self.buffer = []
+
+    def close(self):
+        if self.writer is None and self.buffer:
+            self._start()
+        if self.stream is sys.stdout:
+            self.stream.flush()
+        else:
+            self.stream.close()
+
+class ParquetSink(RecordSink):
+    """
+    Parquet written one row group at a time (requires pyarrow).
+
+    The schema is inferred from all records of the first row group, with
+    columns that are null throughout it stored as strings. Later records
+    must fit that schema: a new key or an incompatible value raises
+    ValueError.
+    """
+
+    def __init__(self, path: str, row_group_size: int = 10000):
+        if importlib.util.find_spec("pyarrow") is None:
+            raise RuntimeError("Parquet output requires the 'pyarrow' package")
+        if path == "-":
+            raise RuntimeError("Parquet output needs a file path")
+        self.path = path
+        self.row_group_size = row_group_size
+        self.buffer = []
+        self.writer = None
+        self.schema = None
+        self.text_columns = set()   # inferred as null in the first row group
+
+    def write(self, record: dict):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if not self.buffer:
+            return
+        if self.writer is None:
+            columns = _columns(self.buffer)
+            table = pa.Table.from_pydict({name: [record.get(name) for record in self.buffer]
+                                          for name in columns})
+            self.text_columns = {f.name for f in table.schema if pa.types.is_null(f.type)}
+            self.schema = pa.schema([pa.field(f.name, pa.string()) if f.name in self.text_columns else f
+                                     for f in table.schema])
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+        else:
+            for record in self.buffer:
+                _check_columns(record, self.schema.names, "Parquet", self.row_group_size)
+        rows = self.buffer
+        if self.text_columns:
+            rows = [{k: str(v) if k in self.text_columns and v is not None else v for k, v in record.items()}
+                    for record in rows]
+        try:
+            table = pa.Table.from_pylist(rows, schema=self.schema)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            raise ValueError(f"Parquet output: records do not fit the schema of the first row group: {e}")
+        self.writer.write_table(table)
+        self.buffer = []
+
+    def close(self):
+        self._flush()
+        if self.writer is not None:
+            self.writer.close()
+
+SINKS = {
+    "ndjson": NDJSONSink,
+    "jsonl": NDJSONSink,
+    "csv": CSVSink,
+    "parquet": ParquetSink,
+}
+
+def open_sink(path: str, fmt: Optional[str] = None) -> RecordSink:
+    """Open a sink, choosing the format from fmt or the file extension ('-' is NDJSON on stdout)."""
+    if fmt is None:
+        fmt = "ndjson" if path == "-" else Path(path).suffix.lstrip(".").lower()
+    if fmt not in SINKS:
+        raise ValueError(f"Unsupported output format '{fmt}' (use one of: {', '.join(SINKS)})")
+    return SINKS[fmt](path)
@@ -0,0 +1,117 @@
+"""
+Bulk site x species resolution (see 'natura_2000_query.py site-species-resolved').
+
+Site_Species_List_Details rows repeat the same taxa across thousands of
+sites. The pipeline runs in three passes so that upstream calls scale with
+the number of unique taxa, not with the number of rows:
+
+1. Spool: stream the rows to a temporary file, resolving each species code
+   locally through PolicyCodeCache and keying the row by its canonical
+   taxon name. Only the set of unique taxa is kept in memory.
+2. Resolve: resolve the unique taxa in bulk with SpeciesResolver.resolve_many
+   (one Global Names Verifier POST per batch, GBIF/ChecklistBank per name).
+3. Join: re-read the spooled rows and write each one to the sink with the
+   identity columns of its taxon appended (prefixed 'resolved_').
+"""
+
+import asyncio
+import json
+import sys
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+
+RESOLVER_DIR = Path(__file__).resolve().parent.parent / "species_id_entity_resolution"
+if str(RESOLVER_DIR) not in sys.path:
+    sys.path.insert(0, str(RESOLVER_DIR))
+
+from species_identifier_resolverv2 import (  # noqa: E402
+    GNV_BATCH_SIZE, MAX_WORKERS, PolicyCodeCache, SpeciesIdentity, SpeciesResolver, canonical_name,
+)
+from record_sinks import RecordSink  # noqa: E402
+from bmd_common import profiling  # noqa: E402
+
+# Output column -> SpeciesIdentity attribute, appended to every site row.
+# The prefix keeps them apart from the source columns (which include e.g.
+# species_code and, in some releases, kingdom).
+IDENTITY_COLUMNS = {
+    "resolved_name": "scientific_name",
+    "resolved_authorship": "authorship",
+    "resolved_policy_code": "policy_code",
+    "resolved_eunis_url": "eunis_url",
+    "resolved_gbif_usage_key": "gbif_usage_key",
+    "resolved_gbif_match_type": "gbif_match_type",
+    "resolved_gbif_status": "gbif_status",
+    "resolved_col_id": "checklistbank_id",
+    "resolved_kingdom": "kingdom",
+    "resolved_family": "family",
+}
+
+def row_value(row: dict, column: str) -> Optional[str]:
+    """A row field by column name, whatever its casing in the source table."""
+    value = row.get(column)
+    if value is None:
+        value = next((v for k, v in row.items() if k.lower() == column), None)
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+def taxon_query(row: dict, policy_cache: PolicyCodeCache) -> Optional[tuple]:
+    """(dedupe key, resolver query) for a site row, or None if it names no taxon.
+
+    Species codes known to the policy-code table are resolved locally, so
+    a coded row and a named row for the same taxon share one key.
+    """
+    code = row_value(row, "species_code")
+    if code:
+        info = policy_cache.get(code.upper())
+        if info:
+            return canonical_name(info["scientific_name"]), info["natura2000"]
+    name = row_value(row, "species_name") or row_value(row, "scientific_name")
+    if name:
+        return canonical_name(name), name
+    return None
+
+def identity_columns(identity: Optional[SpeciesIdentity]) -> dict:
+    if identity is None:
+        return dict.fromkeys(IDENTITY_COLUMNS)
+    return {column: getattr(identity, attribute) for column, attribute in IDENTITY_COLUMNS.items()}
+
+async def resolve_site_species(rows: AsyncIterator[dict], resolver: SpeciesResolver, sink: RecordSink,
+                               batch_size: int = GNV_BATCH_SIZE,
+                               max_workers: int = MAX_WORKERS) -> Dict[str, int]:
+    """Write every site row joined with its taxon identity to sink; returns counts."""
+    queries: Dict[str, str] = {}   # dedupe key -> first query seen for it
+    count = 0
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as spool:
+        with profiling.span("spool_rows", "pipeline"):
+            async for row in rows:
+                taxon = taxon_query(row, resolver.policy_cache)
+                key = None
+                if taxon is not None:
+                    key, query = taxon
+                    queries.setdefault(key, query)
+                spool.write(json.dumps([key, row], ensure_ascii=False, default=str) + "\n")
+                count += 1
+
+        keys = {query: key for key, query in queries.items()}
+        with profiling.span("resolve_taxa", "pipeline", taxa=len(queries)):
+            resolved = await asyncio.to_thread(
+                lambda: {keys[identity.query]: identity
+                         for identity in resolver.resolve_many(queries.values(), batch_size, max_workers)}
+            )
+
+        with profiling.span("join_rows", "pipeline"):
+            spool.seek(0)
+            for line in spool:
+                key, row = json.loads(line)
+                columns = identity_columns(resolved.get(key))
+                clashes = columns.keys() & row.keys()
+                if clashes:
+                    raise ValueError(f"Source rows already have the columns {', '.join(sorted(clashes))}")
+                row.update(columns)
+                sink.write(row)
+
+    matched = sum(1 for identity in resolved.values() if identity.gbif_usage_key is not None)
+    return {"rows": count, "taxa": len(queries), "gbif_matched": matched}
@@ -0,0 +1,530 @@
+"""
+Spatial and temporal index over STAC items and Natura2000 site geometries.
+
+Answers "which sites and cube items intersect this polygon and time range"
+(filter.spatial.geometry, filter.temporal and filter.site of
+bmd-query-example.json) without scanning the catalogue:
+
+- Entries (STAC items, sites) are kept as bounding boxes plus time
+  intervals in an STR-packed R-tree (Sort-Tile-Recursive, NODE_SIZE
+  children per node) stored as flat NumPy arrays, one per level. A query
+  walks the tree level by level, testing all surviving nodes of a level at
+  once, and then refines the candidates against their exact geometry
+  (vertex containment and edge crossings).
+- Additions go to an unpacked delta (checked linearly on every query) and
+  to an append-only log, so adding an item costs one small write. Once
+  the delta holds more than DELTA_LIMIT entries, it is merged into the
+  packed tree and the index is checkpointed.
+
+On disk (directory):
+
+    index.npz        packed tree, entry boxes/times/ids and flattened geometries
+    updates.ndjson   entries added or removed since the last checkpoint
+
+Geometries are GeoJSON (Polygon, MultiPolygon, Point, MultiPoint,
+LineString, MultiLineString), WKT POLYGON/MULTIPOLYGON, or a bbox.
+"""
+
+import calendar
+import json
+import math
+import os
+import tempfile
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from cube_storage import parse_wkt, points_in_polygon
+
+NODE_SIZE = 16
+DELTA_LIMIT = 4096
+INDEX_FILE = "index.npz"
+LOG_FILE = "updates.ndjson"
+KINDS = ("item", "site")
+EDGE_BLOCK = 1 << 20   # edge pairs compared per block during refinement
+
+# --- Geometry ------------------------------------------------------------------
+
+def _ring(coordinates) -> np.ndarray:
+    return np.asarray(coordinates, dtype=float).reshape(-1, 2)[:, :2]
+
+def geometry_parts(geometry) -> Tuple[List[np.ndarray], bool]:
+    """
+    (rings, areal) of a GeoJSON geometry, WKT polygon or (minx, miny, maxx, maxy)
+    bbox. Rings of areal geometries are closed polygon rings (holes included,
+    even-odd); otherwise they are paths or single points.
+    """
+    if isinstance(geometry, str):
+        return parse_wkt(geometry), True
+    if isinstance(geometry, (list, tuple)) and len(geometry) in (4, 6):
+        minx, miny = geometry[0], geometry[1]
+        maxx, maxy = geometry[len(geometry) // 2], geometry[len(geometry) // 2 + 1]
+        return [_ring([[minx, miny], [maxx, miny], [maxx, maxy], [minx, maxy], [minx, miny]])], True
+    if not isinstance(geometry, dict):
+        raise ValueError("Geometry must be GeoJSON, WKT or a bbox")
+    if geometry.get("type") == "Feature":
+        return geometry_parts(geometry.get("geometry"))
+    kind, coordinates = geometry.get("type"), geometry.get("coordinates")
+    if coordinates is None:
+        raise ValueError(f"GeoJSON {kind} has no coordinates")
+    if kind == "Polygon":
+        return [_ring(ring) for ring in coordinates], True
+    if kind == "MultiPolygon":
+        return [_ring(ring) for polygon in coordinates for ring in polygon], True
+    if kind == "Point":
+        return [_ring([coordinates])], False
+    if kind in ("MultiPoint", "LineString"):
+        points = [[point] for point in coordinates] if kind == "MultiPoint" else [coordinates]
+        return [_ring(part) for part in points], False
+    if kind == "MultiLineString":
+        return [_ring(line) for line in coordinates], False
+    raise ValueError(f"Unsupported geometry type: {kind}")
+
+def _bounds(rings: Sequence[np.ndarray]) -> Tuple[float, float, float, float]:
+    points = np.concatenate(rings)
+    return (float(points[:, 0].min()), float(points[:, 1].min()),
+            float(points[:, 0].max()), float(points[:, 1].max()))
+
+def _segments(rings: Sequence[np.ndarray], bbox) -> np.ndarray:
+    """(n, 4) segments x1, y1, x2, y2 of rings whose bounds overlap bbox (points as zero-length segments)."""
+    parts = [np.hstack([ring[:-1], ring[1:]]) if len(ring) > 1 else np.hstack([ring, ring]) for ring in rings]
+    if not parts:
+        return np.empty((0, 4))
+    segments = np.concatenate(parts)
+    minx, miny, maxx, maxy = bbox
+    keep = ((np.minimum(segments[:, 0], segments[:, 2]) <= maxx) & (np.maximum(segments[:, 0], segments[:, 2]) >= minx)
+            & (np.minimum(segments[:, 1], segments[:, 3]) <= maxy) & (np.maximum(segments[:, 1], segments[:, 3]) >= miny))
+    return segments[keep]
+
+def _orientation(ax, ay, bx, by, cx, cy):
+    return np.sign((bx - ax) * (cy - ay) - (by - ay) * (cx - ax))
+
+def _edges_cross(a: np.ndarray, b: np.ndarray) -> bool:
+    """Whether any segment of a touches or crosses any segment of b."""
+    if not len(a) or not len(b):
+        return False
+    block = max(1, EDGE_BLOCK // len(b))
+    bx1, by1, bx2, by2 = (b[:, i][None, :] for i in range(4))
+    for start in range(0, len(a), block):
+        ax1, ay1, ax2, ay2 = (a[start:start + block, i][:, None] for i in range(4))
+        o1 = _orientation(ax1, ay1, ax2, ay2, bx1, by1)
+        o2 = _orientation(ax1, ay1, ax2, ay2, bx2, by2)
+        o3 = _orientation(bx1, by1, bx2, by2, ax1, ay1)
+        o4 = _orientation(bx1, by1, bx2, by2, ax2, ay2)
+        boxes = ((np.minimum(ax1, ax2) <= np.maximum(bx1, bx2)) & (np.maximum(ax1, ax2) >= np.minimum(bx1, bx2))
+                 & (np.minimum(ay1, ay2) <= np.maximum(by1, by2)) & (np.maximum(ay1, ay2) >= np.minimum(by1, by2)))
+        if np.any((o1 * o2 <= 0) & (o3 * o4 <= 0) & boxes):
+            return True
+    return False
+
+def geometries_intersect(a: Tuple[List[np.ndarray], bool], b: Tuple[List[np.ndarray], bool]) -> bool:
+    """Exact intersection test of two geometry_parts() results."""
+    rings_a, rings_b = a[0], b[0]
+    bbox_a, bbox_b = _bounds(rings_a), _bounds(rings_b)
+    if bbox_a[0] > bbox_b[2] or bbox_a[2] < bbox_b[0] or bbox_a[1] > bbox_b[3] or bbox_a[3] < bbox_b[1]:
+        return False
+    for (rings, areal), other in ((a, rings_b), (b, rings_a)):
+        if areal:
+            points = np.concatenate(other)
+            if points_in_polygon(points[:, 0], points[:, 1], rings).any():
+                return True
+    return _edges_cross(_segments(rings_a, bbox_b), _segments(rings_b, bbox_a))
+
+# --- Time ----------------------------------------------------------------------
+
+def time_bound(value, end: bool = False) -> float:
+    """
+    Epoch seconds of an ISO date/datetime (None or '..' is open). Years
+    (YYYY), months (YYYY-MM) and dates used as an end cover the whole period.
+    """
+    if value in (None, "", ".."):
+        return math.inf if end else -math.inf
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().replace("Z", "+00:00")
+    if len(text) == 4:
+        text = f"{text}-12-31" if end else f"{text}-01-01"
+    elif len(text) == 7:
+        year, month = int(text[:4]), int(text[5:])
+        text = f"{text}-{calendar.monthrange(year, month)[1]:02d}" if end else f"{text}-01"
+    if len(text) == 10:
+        day = datetime.combine(date.fromisoformat(text), datetime.min.time(), timezone.utc)
+        return day.timestamp() + (86400 - 0.001 if end else 0)
+    moment = datetime.fromisoformat(text)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+def _iso(seconds: float) -> Optional[str]:
+    if not math.isfinite(seconds):
+        return None
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat().replace("+00:00", "Z")
+
+def item_interval(item: dict) -> Tuple[float, float]:
+    """(start, end) of a STAC item from datetime or start_/end_datetime."""
+    properties = item.get("properties") or {}
+    if properties.get("start_datetime") or properties.get("end_datetime"):
+        return (time_bound(properties.get("start_datetime")),
+                time_bound(properties.get("end_datetime"), end=True))
+    moment = properties.get("datetime")
+    return time_bound(moment), time_bound(moment, end=True)
+
+# --- STR packing ---------------------------------------------------------------
+
+def _node_bounds(boxes: np.ndarray, times: np.ndarray, node_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Bounds of consecutive groups of node_size boxes."""
+    starts = np.arange(0, len(boxes), node_size)
+    node_boxes = np.column_stack([
+        np.minimum.reduceat(boxes[:, 0], starts), np.minimum.reduceat(boxes[:, 1], starts),
+        np.maximum.reduceat(boxes[:, 2], starts), np.maximum.reduceat(boxes[:, 3], starts),
+    ])
+    node_times = np.column_stack([np.minimum.reduceat(times[:, 0], starts),
+                                  np.maximum.reduceat(times[:, 1], starts)])
+    return node_boxes, node_times
+
+def str_order(boxes: np.ndarray, node_size: int) -> np.ndarray:
+    """Sort-Tile-Recursive order: vertical slices by x centre, each sorted by y centre."""
+    count = len(boxes)
+    if count == 0:
+        return np.empty(0, dtype=np.int64)
+    leaves = -(-count // node_size)
+    slice_size = node_size * math.ceil(math.sqrt(leaves))
+    cx = boxes[:, 0] + boxes[:, 2]
+    cy = boxes[:, 1] + boxes[:, 3]
+    by_x = np.argsort(cx, kind="stable")
+    slices = np.empty(count, dtype=np.int64)
+    slices[by_x] = np.arange(count) // slice_size
+    return np.lexsort((cy, slices))
+
+def pack(boxes: np.ndarray, times: np.ndarray, node_size: int = NODE_SIZE):
+    """
+    (entry order, [(node boxes, node times), ...] from the leaves up to the root).
+    Node j of a level covers children j * node_size .. (j + 1) * node_size - 1
+    of the level below (of the entries, in entry order, for the leaves).
+    """
+    order = str_order(boxes, node_size)
+    levels = []
+    level_boxes, level_times = boxes[order], times[order]
+    while len(level_boxes) > 1 or (len(level_boxes) == 1 and not levels):
+        level_boxes, level_times = _node_bounds(level_boxes, level_times, node_size)
+        levels.append((level_boxes, level_times))
+    return order, levels
+
+def _overlaps(boxes: np.ndarray, times: np.ndarray, bbox, start: float, end: float) -> np.ndarray:
+    return ((boxes[:, 0] <= bbox[2]) & (boxes[:, 2] >= bbox[0])
+            & (boxes[:, 1] <= bbox[3]) & (boxes[:, 3] >= bbox[1])
+            & (times[:, 0] <= end) & (times[:, 1] >= start))
+
+class SpatialIndex:
+    """
+    STR-packed R-tree over entries ('item' or 'site', id) with bbox, time
+    interval and geometry, plus a delta of recent additions. With a
+    directory, the index is loaded from and persisted to it.
+    """
+
+    def __init__(self, directory: Optional[Path] = None, node_size: int = NODE_SIZE,
+                 delta_limit: int = DELTA_LIMIT):
+        self.directory = Path(directory) if directory is not None else None
+        self.node_size = node_size
+        self.delta_limit = delta_limit
+        self._set_packed({})
+        self._delta: List[dict] = []
+        self._slots: Dict[Tuple[str, str], Tuple[str, int]] = {}   # key -> ("packed" | "delta", position)
+        self._log = None
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._load()
+            self._log = open(self.directory / LOG_FILE, "a", encoding="utf-8")
+
+    # --- Storage ---
+
+    def _set_packed(self, arrays: Dict[str, np.ndarray]):
+        empty = {
+            "boxes": np.empty((0, 4)), "times": np.empty((0, 2)), "kinds": np.empty(0, dtype=np.uint8),
+            "ids": np.empty(0, dtype=str), "labels": np.empty(0, dtype=str), "areal": np.empty(0, dtype=bool),
+            "alive": np.empty(0, dtype=bool), "points": np.empty((0, 2)),
+            "ring_starts": np.zeros(1, dtype=np.int64), "entry_rings": np.zeros(1, dtype=np.int64),
+            "order": np.empty(0, dtype=np.int64),
+        }
+        self._packed = {**empty, **arrays}
+        self._levels = []
+        level = 0
+        while f"level{level}_boxes" in self._packed:
+            self._levels.append((self._packed[f"level{level}_boxes"], self._packed[f"level{level}_times"]))
+            level += 1
+
+    def _load(self):
+        index_path = self.directory / INDEX_FILE
+        if index_path.exists():
+            with np.load(index_path, allow_pickle=False) as data:
+                self._set_packed({name: data[name] for name in data.files})
+            self._packed["alive"] = self._packed["alive"].copy()
+            for position, (kind, entry_id) in enumerate(zip(self._packed["kinds"], self._packed["ids"])):
+                if self._packed["alive"][position]:
+                    self._slots[(KINDS[kind], str(entry_id))] = ("packed", position)
+        log_path = self.directory / LOG_FILE
+        if log_path.exists():
+            with open(log_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        change = json.loads(line)
+                    except ValueError:
+                        break   # torn final line of an interrupted write
+                    if change["op"] == "add":
+                        self._insert(self._entry_from_json(change["entry"]))
+                    else:
+                        self._discard((change["kind"], change["id"]))
+
+    @staticmethod
+    def _entry_to_json(entry: dict) -> dict:
+        return {
+            "kind": entry["kind"], "id": entry["id"], "label": entry["label"],
+            "start": None if entry["start"] == -math.inf else entry["start"],
+            "end": None if entry["end"] == math.inf else entry["end"],
+            "areal": entry["areal"], "rings": [ring.tolist() for ring in entry["rings"]],
+        }
+
+    @staticmethod
+    def _entry_from_json(data: dict) -> dict:
+        rings = [_ring(ring) for ring in data["rings"]]
+        return {
+            "kind": data["kind"], "id": data["id"], "label": data.get("label") or "",
+            "start": -math.inf if data["start"] is None else data["start"],
+            "end": math.inf if data["end"] is None else data["end"],
+            "areal": data["areal"], "rings": rings, "bbox": _bounds(rings),
+        }
+
+    def _append_log(self, change: dict, flush: bool = True):
+        if self._log is not None:
+            self._log.write(json.dumps(change) + "\n")
+            if flush:
+                self._log.flush()
+
+    def checkpoint(self):
+        """Merge the delta into the packed tree and, with a directory, persist it and clear the log."""
+        self._repack()
+        if self.directory is None:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=INDEX_FILE, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                arrays = dict(self._packed)
+                for level, (boxes, times) in enumerate(self._levels):
+                    arrays[f"level{level}_boxes"], arrays[f"level{level}_times"] = boxes, times
+                np.savez(f, **arrays)
+            os.replace(tmp_path, self.directory / INDEX_FILE)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._log.close()
+        self._log = open(self.directory / LOG_FILE, "w", encoding="utf-8")
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    # --- Updates ---
+
+    def _packed_entry(self, position: int) -> dict:
+        packed = self._packed
+        ring_from, ring_to = packed["entry_rings"][position], packed["entry_rings"][position + 1]
+        starts = packed["ring_starts"]
+        rings = [packed["points"][starts[r]:starts[r + 1]] for r in range(ring_from, ring_to)]
+        return {
+            "kind": KINDS[packed["kinds"][position]], "id": str(packed["ids"][position]),
+            "label": str(packed["labels"][position]),
+            "start": float(packed["times"][position, 0]), "end": float(packed["times"][position, 1]),
+            "areal": bool(packed["areal"][position]), "rings": rings,
+            "bbox": tuple(float(v) for v in packed["boxes"][position]),
+        }
+
+    def _repack(self):
+        """Rebuild the packed arrays and tree from all live entries."""
+        entries = [self._packed_entry(p) for p in np.flatnonzero(self._packed["alive"])]
+        entries += [entry for entry in self._delta if entry is not None]
+        rings = [ring for entry in entries for ring in entry["rings"]]
+        ring_lengths = [len(ring) for ring in rings]
+        boxes = np.array([entry["bbox"] for entry in entries], dtype=float).reshape(-1, 4)
+        times = np.array([(entry["start"], entry["end"]) for entry in entries], dtype=float).reshape(-1, 2)
+        order, levels = pack(boxes, times, self.node_size)
+        self._set_packed({
+            "boxes": boxes, "times": times,
+            "kinds": np.array([KINDS.index(entry["kind"]) for entry in entries], dtype=np.uint8),
+            "ids": np.array([entry["id"] for entry in entries], dtype=str),
+            "labels": np.array([entry["label"] for entry in entries], dtype=str),
+            "areal": np.array([entry["areal"] for entry in entries], dtype=bool),
+            "alive": np.ones(len(entries), dtype=bool),
+            "points": np.concatenate(rings) if rings else np.empty((0, 2)),
+            "ring_starts": np.concatenate([[0], np.cumsum(ring_lengths, dtype=np.int64)]),
+            "entry_rings": np.concatenate([[0], np.cumsum([len(entry["rings"]) for entry in entries],
+                                                          dtype=np.int64)]),
+            "order": order,
+        })
+        self._levels = levels
+        self._delta = []
+        self._slots = {(entry["kind"], entry["id"]): ("packed", position)
+                       for position, entry in enumerate(entries)}
+
+    def _discard(self, key: Tuple[str, str]) -> bool:
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return False
+        where, position = slot
+        if where == "packed":
+            self._packed["alive"][position] = False
+        else:
+            self._delta[position] = None
+        return True
+
+    def _insert(self, entry: dict):
+        self._discard((entry["kind"], entry["id"]))
+        self._slots[(entry["kind"], entry["id"])] = ("delta", len(self._delta))
+        self._delta.append(entry)
+
+    def add(self, kind: str, entry_id: str, geometry, start=None, end=None, label: str = ""):
+        """Add or replace an entry; geometry as accepted by geometry_parts()."""
+        self._add(kind, entry_id, geometry, start, end, label)
+        self._after_add()
+
+    def _after_add(self):
+        if self._log is not None:
+            self._log.flush()
+        if len(self._delta) > self.delta_limit:
+            self.checkpoint()
+
+    def _add(self, kind: str, entry_id: str, geometry, start=None, end=None, label: str = ""):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown entry kind: {kind}")
+        rings, areal = geometry_parts(geometry)
+        start_s = start if isinstance(start, float) else time_bound(start)
+        end_s = end if isinstance(end, float) else time_bound(end, end=True)
+        if start_s > end_s:
+            raise ValueError(f"{kind} {entry_id}: start is after end")
+        entry = {"kind": kind, "id": str(entry_id), "label": label or "", "start": start_s, "end": end_s,
+                 "areal": areal, "rings": rings, "bbox": _bounds(rings)}
+        self._insert(entry)
+        self._append_log({"op": "add", "entry": self._entry_to_json(entry)}, flush=False)
+
+    def add_item(self, item: dict):
+        """Add a STAC Item (geometry, or bbox when the geometry is null)."""
+        self._add_item(item)
+        self._after_add()
+
+    def _add_item(self, item: dict):
+        geometry = item.get("geometry") or item.get("bbox")
+        if not geometry:
+            raise ValueError(f"STAC item {item.get('id')} has neither geometry nor bbox")
+        start, end = item_interval(item)
+        self._add("item", item["id"], geometry, start, end, label=item.get("collection") or "")
+
+    def add_items(self, items):
+        """Add the items of an ItemCollection / FeatureCollection, or of an iterable of items."""
+        for item in items.get("features", []) if isinstance(items, dict) else items:
+            self._add_item(item)
+        self._after_add()
+
+    def add_site(self, site_code: str, geometry, name: str = "", start=None, end=None):
+        self.add("site", site_code, geometry, start, end, label=name)
+
+    def add_sites(self, features, code_property: str = "SITECODE", name_property: str = "SITENAME"):
+        """Add site polygons from a GeoJSON FeatureCollection (Natura2000 spatial data attributes)."""
+        for feature in features.get("features", []) if isinstance(features, dict) else features:
+            properties = feature.get("properties") or {}
+            self._add("site", properties[code_property], feature["geometry"],
+                      label=properties.get(name_property) or "")
+        self._after_add()
+
+    def remove(self, kind: str, entry_id: str) -> bool:
+        removed = self._discard((kind, str(entry_id)))
+        if removed:
+            self._append_log({"op": "remove", "kind": kind, "id": str(entry_id)})
+        return removed
+
+    # --- Queries ---
+
+    def _packed_candidates(self, bbox, start: float, end: float) -> np.ndarray:
+        """Packed positions whose bbox and interval overlap the query."""
+        if not self._levels:
+            return np.empty(0, dtype=np.int64)
+        size = self.node_size
+        boxes, times = self._levels[-1]
+        nodes = np.flatnonzero(_overlaps(boxes, times, bbox, start, end))
+        for boxes, times in reversed(self._levels[:-1]):
+            children = (nodes[:, None] * size + np.arange(size)).ravel()
+            children = children[children < len(boxes)]
+            nodes = children[_overlaps(boxes[children], times[children], bbox, start, end)]
+        entries = (nodes[:, None] * size + np.arange(size)).ravel()
+        entries = self._packed["order"][entries[entries < len(self._packed["order"])]]
+        hits = _overlaps(self._packed["boxes"][entries], self._packed["times"][entries], bbox, start, end)
+        entries = entries[hits]
+        return entries[self._packed["alive"][entries]]
+
+    def intersects(self, geometry, start=None, end=None, kinds: Optional[Iterable[str]] = None,
+                   exact: bool = True) -> List[dict]:
+        """
+        Entries whose geometry intersects geometry and whose interval overlaps
+        [start, end] (ISO dates/datetimes, open if None). exact=False returns
+        bbox candidates without geometry refinement.
+        """
+        return self._intersects(geometry_parts(geometry), time_bound(start), time_bound(end, end=True),
+                                kinds, exact)
+
+    def _intersects(self, query: Tuple[List[np.ndarray], bool], start_s: float, end_s: float,
+                    kinds: Optional[Iterable[str]] = None, exact: bool = True) -> List[dict]:
+        bbox = _bounds(query[0])
+        wanted = set(kinds) if kinds is not None else set(KINDS)
+        candidates = [self._packed_entry(p) for p in self._packed_candidates(bbox, start_s, end_s)]
+        for entry in self._delta:
+            if entry is None:
+                continue
+            box = entry["bbox"]
+            if (box[0] <= bbox[2] and box[2] >= bbox[0] and box[1] <= bbox[3] and box[3] >= bbox[1]
+                    and entry["start"] <= end_s and entry["end"] >= start_s):
+                candidates.append(entry)
+        results = []
+        for entry in candidates:
+            if entry["kind"] not in wanted:
+                continue
+            if exact and not geometries_intersect(query, (entry["rings"], entry["areal"])):
+                continue
+            results.append({"kind": entry["kind"], "id": entry["id"], "label": entry["label"] or None,
+                            "bbox": list(entry["bbox"]), "start": _iso(entry["start"]), "end": _iso(entry["end"])})
+        results.sort(key=lambda r: (r["kind"], r["id"]))
+        return results
+
+    def query(self, request: dict) -> Dict[str, List[dict]]:
+        """
+        Sites and items matching a BMD query (bmd-query-example.json):
+        filter.spatial.geometry (or the geometry of filter.site.codeSite when
+        there is none) and filter.temporal from/to.
+        """
+        query_filter = request.get("filter") or {}
+        temporal = query_filter.get("temporal") or {}
+        geometry = (query_filter.get("spatial") or {}).get("geometry")
+        site_code = (query_filter.get("site") or {}).get("codeSite")
+        if geometry is not None:
+            parts = geometry_parts(geometry)
+        elif site_code:
+            slot = self._slots.get(("site", site_code))
+            if slot is None:
+                raise ValueError(f"Site {site_code} is not in the spatial index")
+            entry = self._packed_entry(slot[1]) if slot[0] == "packed" else self._delta[slot[1]]
+            parts = entry["rings"], entry["areal"]
+        else:
+            raise ValueError("The query has neither filter.spatial.geometry nor filter.site.codeSite")
+        matches = self._intersects(parts, time_bound(temporal.get("from")),
+                                   time_bound(temporal.get("to"), end=True))
+        return {kind + "s": [m for m in matches if m["kind"] == kind] for kind in KINDS}
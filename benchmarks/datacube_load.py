@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Load test for the data cube job engine (DataSpaceMVP/datacube_engine.py).
+
+Submits a stream of DataCubeRequests to an in-process DataCubeEngine running
+the stub builder on its process pool, then polls until every accepted job
+has finished. A fraction of the requests repeat earlier ones, exercising the
+idempotent job sharing; with --passes 2 the second pass is answered from the
+built-cube store (the 200 fast path). Rejections by a full queue are counted,
+not retried.
+
+Reports, per pass, how requests were answered (queued as a new build,
+deduplicated onto a queued or running job, prebuilt, rejected), build
+throughput, job latency (submit to finished, per request), and queue wait
+and build time of the builds queued in that pass, as JSON.
+
+    python datacube_load.py --requests 200 --unique 50 --workers 4 --build-seconds 0.2
+    python datacube_load.py --requests 500 --queue-depth 20 --rate 100 --passes 2
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "DataSpaceMVP"))
+
+from datacube_engine import CubeStore, DataCubeEngine, EngineBusy  # noqa: E402
+from run_benchmarks import latency_summary, peak_rss_mb  # noqa: E402
+
+POLL_INTERVAL = 0.01   # seconds between job status polls
+
+def cube_request(i: int) -> tuple:
+    """(site code, DataCubeRequest) number i."""
+    year = 2000 + i % 25
+    return f"BM{i // 25:07d}", {
+        "variables": ["ndvi", "land_cover"],
+        "temporalRange": {"start": f"{year}-01-01", "end": f"{year}-12-31"},
+    }
+
+async def run_pass(engine: DataCubeEngine, requests: int, unique: int, rate: float) -> dict:
+    outcomes = {"queued": 0, "deduplicated": 0, "prebuilt": 0, "rejected": 0}
+    submitted = []   # (job, submit time)
+    seen, built = set(), []
+    start = time.perf_counter()
+    for i in range(requests):
+        if rate:
+            await asyncio.sleep(max(0.0, start + i / rate - time.perf_counter()))
+        else:
+            await asyncio.sleep(0)
+        site_code, request = cube_request(i % unique)
+        try:
+            job, prebuilt = engine.submit(site_code, request)
+        except EngineBusy:
+            outcomes["rejected"] += 1
+            continue
+        if prebuilt:
+            outcomes["prebuilt"] += 1
+        elif job.job_id in seen:
+            outcomes["deduplicated"] += 1
+        else:
+            outcomes["queued"] += 1
+            built.append(job)
+        seen.add(job.job_id)
+        submitted.append((job, time.perf_counter()))
+
+    latencies = []
+    pending = submitted
+    while pending:
+        still = []
+        for job, at in pending:
+            if job.status in ("succeeded", "failed"):
+                latencies.append(max(0.0, job.finished - at))
+            else:
+                still.append((job, at))
+        pending = still
+        if pending:
+            await asyncio.sleep(POLL_INTERVAL)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "outcomes": outcomes,
+        "failed_jobs": sum(1 for job in built if job.status == "failed"),
+        "elapsed_s": round(elapsed, 3),
+        "builds_per_s": round(len(built) / elapsed, 3) if elapsed else None,
+        "job_latency_ms": latency_summary(latencies),
+        "queue_wait_ms": latency_summary([job.started - job.submitted for job in built]),
+        "build_ms": latency_summary([job.finished - job.started for job in built]),
+    }
+
+async def run(args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = DataCubeEngine(CubeStore(Path(tmp)), "stub", {"seconds": args.build_seconds},
+                                workers=args.workers, queue_depth=args.queue_depth)
+        async with engine:
+            passes = [await run_pass(engine, args.requests, args.unique, args.rate)
+                      for _ in range(args.passes)]
+    return {
+        "settings": {
+            "requests": args.requests, "unique": args.unique, "workers": args.workers,
+            "queue_depth": args.queue_depth, "build_seconds": args.build_seconds, "rate": args.rate,
+        },
+        "passes": passes,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the BMD data cube job engine")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per pass (default: 200)")
+    parser.add_argument("--unique", type=int, default=50, help="Distinct cubes among them (default: 50)")
+    parser.add_argument("--workers", type=int, default=2, help="Concurrent builds (default: 2)")
+    parser.add_argument("--queue-depth", type=int, default=100, help="Engine queue depth (default: 100)")
+    parser.add_argument("--build-seconds", type=float, default=0.2, help="Stub build time (default: 0.2)")
+    parser.add_argument("--rate", type=float, default=0, help="Requests per second (default: unthrottled)")
+    parser.add_argument("--passes", type=int, default=1, help="Passes over the same requests (default: 1)")
+    parser.add_argument("--output", metavar="FILE", help="Write the JSON report to FILE instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
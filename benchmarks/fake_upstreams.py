@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the upstream APIs used by the BMD tools.
+
+One HTTP server answers all four upstreams under separate path prefixes:
+
+- /discodata/sql?query=...                       EEA DiscoData SQL endpoint
+- /eea/daviz.json                                EUNIS species with Natura2000 codes
+- /gbif/v1/species/match?name=...                GBIF species match
+- /checklistbank/dataset/3/nameusage/{key}       ChecklistBank name usage
+- /gnv/api/v1/verifications (POST)               Global Names Verifier
+
+Responses are built from the JSON fixtures in fixtures/, with the queried
+site code or name substituted in, so any number of distinct queries gets a
+realistic answer. Latency, 503 errors and 429 throttling can be injected.
+
+Run standalone with:
+    python fake_upstreams.py --port 8080 --latency 0.05 --error-rate 0.01
+"""
+
+import argparse
+import copy
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+# Synthetic EUNIS species served after the fixture ones (codes 5000, 5001, ...)
+SYNTHETIC_SPECIES = 3000
+SYNTHETIC_CODE_BASE = 5000
+
+TABLE_PATTERN = re.compile(r"\[latest\]\.\[(\w+)\]")
+LITERAL_PATTERN = re.compile(r"'([^']*)'")
+
+def load_fixture(name: str):
+    with open(FIXTURES_DIR / name, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def synthetic_species_name(index: int) -> str:
+    """Scientific name of the index-th synthetic EUNIS species."""
+    return f"Benchmarkia species{index:04d}"
+
+def usage_key(name: str) -> int:
+    """Stable GBIF-style usage key for a name."""
+    return zlib.crc32(name.lower().encode("utf-8")) % 10_000_000 + 1
+
+class UpstreamFixtures:
+    """Fixture templates and the response builders for each endpoint."""
+
+    def __init__(self, species: int = SYNTHETIC_SPECIES):
+        self.discodata = load_fixture("discodata.json")
+        self.gbif = load_fixture("gbif_match.json")
+        self.checklistbank = load_fixture("checklistbank_nameusage.json")
+        self.gnv = load_fixture("gnv_verification.json")
+        eunis = load_fixture("eunis_species.json")
+        eunis["items"] += [
+            {"o": str(SYNTHETIC_CODE_BASE + i), "name": synthetic_species_name(i),
+             "author": "Bench, 2025", "s": f"https://eunis.eea.europa.eu/species/{900000 + i}"}
+            for i in range(species)
+        ]
+        self.eunis = eunis
+
+    def sql(self, sql: str, page: Optional[int], page_size: Optional[int]) -> dict:
+        match = TABLE_PATTERN.search(sql)
+        table = match.group(1) if match else ""
+        templates = self.discodata.get(table, [])
+        if "COUNT(*)" in sql.upper():
+            return {"records": [{"row_count": len(templates), "checksum": len(templates)}]}
+        key_column = "code_2000" if table == "Habitat_Information" else "site_code"
+        records = []
+        for code in LITERAL_PATTERN.findall(sql):
+            for template in templates:
+                record = dict(template)
+                record[key_column] = code
+                records.append(record)
+        if page is not None and page_size:
+            records = records[(page - 1) * page_size:page * page_size]
+        return {"records": records}
+
+    def gbif_match(self, name: str) -> dict:
+        data = copy.deepcopy(self.gbif)
+        key = usage_key(name)
+        data.update(usageKey=key, speciesKey=key, scientificName=name, canonicalName=name,
+                    genus=name.split()[0], species=name)
+        return data
+
+    def nameusage(self, key: str) -> dict:
+        data = copy.deepcopy(self.checklistbank)
+        data["id"] = f"BM{key}"
+        return data
+
+    def verifications(self, names) -> dict:
+        entries = []
+        for name in names:
+            entry = copy.deepcopy(self.gnv)
+            entry["name"] = name
+            entries.append(entry)
+        return {"names": entries}
+
+class FaultSettings:
+    """Injected latency and failures, shared by all handler threads."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, seed: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """Return (delay seconds, status override or None) for one request."""
+        with self._lock:
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            roll = self._random.random()
+        if roll < self.error_rate:
+            return delay, 503
+        if roll < self.error_rate + self.throttle_rate:
+            return delay, 429
+        return delay, None
+
+def make_handler(fixtures: UpstreamFixtures, faults: FaultSettings, counts: Dict[str, int]):
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive, as the real APIs do
+
+        def _send(self, status: int, body: dict, headers: Optional[dict] = None):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _begin(self, upstream: str) -> bool:
+            """Count, delay and maybe fail a request; False if a fault was sent."""
+            with lock:
+                counts[upstream] = counts.get(upstream, 0) + 1
+            delay, status = faults.draw()
+            if delay:
+                time.sleep(delay)
+            if status == 503:
+                self._send(503, {"error": "injected failure"})
+                return False
+            if status == 429:
+                self._send(429, {"error": "injected throttling"}, {"Retry-After": "0"})
+                return False
+            return True
+
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            params = urllib.parse.parse_qs(url.query)
+            path = url.path
+            if path == "/counts":
+                with lock:
+                    return self._send(200, dict(counts))
+            if path == "/discodata/sql":
+                if not self._begin("discodata"):
+                    return
+                page = int(params["p"][0]) if "p" in params else None
+                page_size = int(params["nrOfHits"][0]) if "nrOfHits" in params else None
+                return self._send(200, fixtures.sql(params.get("query", [""])[0], page, page_size))
+            if path == "/eea/daviz.json":
+                if not self._begin("eea"):
+                    return
+                return self._send(200, fixtures.eunis)
+            if path == "/gbif/v1/species/match":
+                if not self._begin("gbif"):
+                    return
+                return self._send(200, fixtures.gbif_match(params.get("name", [""])[0]))
+            if path.startswith("/checklistbank/dataset/3/nameusage/"):
+                if not self._begin("checklistbank"):
+                    return
+                return self._send(200, fixtures.nameusage(path.rsplit("/", 1)[-1]))
+            self._send(404, {"error": f"unknown path {path}"})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if urllib.parse.urlsplit(self.path).path != "/gnv/api/v1/verifications":
+                return self._send(404, {"error": "unknown path"})
+            if not self._begin("gnv"):
+                return
+            self._send(200, fixtures.verifications(json.loads(body).get("nameStrings", [])))
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+class FakeUpstreams:
+    """All fake upstreams on one local port, served from a background thread."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, faults: Optional[FaultSettings] = None,
+                 species: int = SYNTHETIC_SPECIES):
+        self.faults = faults or FaultSettings()
+        self.counts: Dict[str, int] = {}
+        handler = make_handler(UpstreamFixtures(species), self.faults, self.counts)
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def urls(self) -> Dict[str, str]:
+        """Endpoint URLs in the form the CLIs' module constants expect."""
+        base = self.base_url
+        return {
+            "EEA_BASE": f"{base}/discodata/sql?query=",
+            "EEA_SPECIES_URL": f"{base}/eea/daviz.json",
+            "GBIF_MATCH_URL": f"{base}/gbif/v1/species/match",
+            "CHECKLISTBANK_URL": f"{base}/checklistbank/dataset/3/nameusage/{{usage_key}}",
+            "GNV_URL": f"{base}/gnv/api/v1/verifications",
+        }
+
+    def start(self) -> "FakeUpstreams":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fake EEA, GBIF, ChecklistBank and GNV APIs locally")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="Added delay per request (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform +/- jitter on the delay (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    args = parser.parse_args()
+
+    faults = FaultSettings(args.latency, args.jitter, args.error_rate, args.throttle_rate)
+    upstreams = FakeUpstreams(port=args.port, faults=faults)
+    print(json.dumps(upstreams.urls(), indent=2))
+    try:
+        upstreams.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        upstreams.server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Cold-start guard for the CLIs.
+
+Measures, each as the median of several fresh interpreter runs:
+- interpreter startup alone (the baseline),
+- 'natura_2000_query.py help' and 'species_identifier_resolverv2.py --help',
+- importing each CLI module,
+and in-process:
+- loading a policy-code snapshot of SNAPSHOT_CODES codes and looking codes up,
+- exact and misspelt name lookups in a NameMatcher over the snapshot's names.
+
+It also checks that importing the CLIs pulls in no network library
+(requests, httpx). Results are printed as JSON; the exit status is 1 if a
+budget is exceeded or a network library is imported eagerly.
+
+    python import_time.py
+    python import_time.py --runs 20 --output startup.json
+"""
+
+import argparse
+import json
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+NATURA_DIR = ROOT / "DataSpaceMVP"
+RESOLVER_DIR = ROOT / "species_id_entity_resolution"
+sys.path.insert(0, str(NATURA_DIR))
+sys.path.insert(0, str(RESOLVER_DIR))
+
+from policy_code_snapshot import PolicyCodeSnapshot, write_snapshot  # noqa: E402
+from name_matcher import NameMatcher  # noqa: E402
+
+SNAPSHOT_CODES = 3311      # size of the EEA EUNIS list with Natura2000 codes
+LAZY_MODULES = ("requests", "httpx")
+
+# Budgets in milliseconds; process timings are measured above the bare interpreter
+BUDGETS = {
+    "natura_help": 150.0,
+    "resolver_help": 150.0,
+    "natura_import": 150.0,
+    "resolver_import": 150.0,
+    "snapshot_load": 1.0,
+    "snapshot_lookup": 0.1,
+    "name_match_exact": 0.1,
+    "name_match_fuzzy": 1.0,
+}
+
+def run_ms(args, cwd: Path, runs: int) -> float:
+    """Median wall time of a fresh interpreter running args."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=cwd, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=False)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def eager_network_imports(module: str, cwd: Path) -> list:
+    """Network libraries that importing module loads."""
+    code = (f"import sys; import {module}; "
+            f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))")
+    output = subprocess.run([sys.executable, "-c", code], cwd=cwd, capture_output=True,
+                            text=True, check=True).stdout.strip()
+    return [m for m in output.split(",") if m]
+
+def synthetic_names(count: int) -> list:
+    """Reproducible pseudo-Latin binomials (letter mix comparable to real names)."""
+    rng = random.Random(0)
+    syllables = ["a", "ae", "an", "ar", "ca", "chi", "co", "da", "el", "er", "gal", "i", "is", "la", "li",
+                 "lo", "ma", "mi", "mo", "na", "ni", "o", "on", "pa", "pe", "ra", "re", "ri", "ro", "sa",
+                 "so", "ta", "te", "ti", "to", "tri", "u", "um", "us", "va", "vi"]
+    word = lambda parts: "".join(rng.choice(syllables) for _ in range(parts))
+    names = set()
+    while len(names) < count:
+        names.add(f"{word(rng.randint(2, 4)).capitalize()} {word(rng.randint(2, 4))}us")
+    return sorted(names)
+
+def snapshot_timings(repeats: int = 200) -> dict:
+    """Median snapshot load and lookup times (ms) for a synthetic full-size code list."""
+    codes = {
+        f"A{i:04d}": {"scientific_name": f"{name} (Author, 1758)",
+                      "authorship": "(Author, 1758)", "eunis_url": f"https://eunis.eea.europa.eu/species/{i}"}
+        for i, name in enumerate(synthetic_names(SNAPSHOT_CODES))
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "policy_codes.bin"
+        write_snapshot(path, codes, time.time(), str.lower, str.lower)
+        loads = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            snapshot = PolicyCodeSnapshot.load(path)
+            loads.append((time.perf_counter() - start) * 1000)
+        lookups = []
+        for i in range(0, SNAPSHOT_CODES, max(1, SNAPSHOT_CODES // repeats)):
+            start = time.perf_counter()
+            assert snapshot.get(f"A{i:04d}") is not None
+            lookups.append((time.perf_counter() - start) * 1000)
+        return {"size_bytes": path.stat().st_size, "snapshot_load": statistics.median(loads),
+                "snapshot_lookup": statistics.median(lookups), **name_match_timings(snapshot, repeats)}
+
+def name_match_timings(snapshot: PolicyCodeSnapshot, repeats: int) -> dict:
+    """Median exact and one-typo lookup times (ms) over the snapshot's names."""
+    records = list(snapshot.records())
+    matcher = NameMatcher()
+    for info in records:
+        matcher.add(info["scientific_name"], info)
+    timings = {"name_match_exact": [], "name_match_fuzzy": []}
+    for info in records[::max(1, len(records) // repeats)]:
+        name = info["scientific_name"]
+        typo = len(name) * 2 // 3
+        for kind, query in (("name_match_exact", name), ("name_match_fuzzy", name[:typo] + "q" + name[typo + 1:])):
+            start = time.perf_counter()
+            match = matcher.match(query)
+            timings[kind].append((time.perf_counter() - start) * 1000)
+            assert match is not None and match.payload["natura2000"] == info["natura2000"], query
+    return {kind: statistics.median(values) for kind, values in timings.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time budget check for the BMD CLIs")
+    parser.add_argument("--runs", type=int, default=10, help="Interpreter runs per measurement (default: 10)")
+    parser.add_argument("--output", metavar="FILE", help="Write the JSON report to FILE instead of stdout")
+    args = parser.parse_args()
+
+    baseline = run_ms(["-c", "pass"], ROOT, args.runs)
+    measured = {
+        "natura_help": run_ms(["natura_2000_query.py", "help"], NATURA_DIR, args.runs) - baseline,
+        "resolver_help": run_ms(["species_identifier_resolverv2.py", "--help"], RESOLVER_DIR, args.runs) - baseline,
+        "natura_import": run_ms(["-c", "import natura_2000_query"], NATURA_DIR, args.runs) - baseline,
+        "resolver_import": run_ms(["-c", "import species_identifier_resolverv2"], RESOLVER_DIR, args.runs) - baseline,
+    }
+    snapshot = snapshot_timings()
+    measured["snapshot_load"] = snapshot["snapshot_load"]
+    measured["snapshot_lookup"] = snapshot["snapshot_lookup"]
+    measured["name_match_exact"] = snapshot["name_match_exact"]
+    measured["name_match_fuzzy"] = snapshot["name_match_fuzzy"]
+    eager = {
+        "natura_2000_query": eager_network_imports("natura_2000_query", NATURA_DIR),
+        "species_identifier_resolverv2": eager_network_imports("species_identifier_resolverv2", RESOLVER_DIR),
+    }
+
+    over_budget = {name: round(ms, 3) for name, ms in measured.items() if ms > BUDGETS[name]}
+    report = {
+        "python": sys.version.split()[0],
+        "interpreter_startup_ms": round(baseline, 3),
+        "measured_ms": {name: round(ms, 3) for name, ms in measured.items()},
+        "budgets_ms": BUDGETS,
+        "snapshot_size_bytes": snapshot["size_bytes"],
+        "eager_network_imports": eager,
+        "over_budget": over_budget,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    for name, ms in over_budget.items():
+        print(f"Over budget: {name} {ms} ms > {BUDGETS[name]} ms", file=sys.stderr)
+    for module, libraries in eager.items():
+        if libraries:
+            print(f"Eager import: {module} loads {', '.join(libraries)}", file=sys.stderr)
+    if over_budget or any(eager.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for the Natura2000 query tool and the species resolver.
+
+Starts the fake upstreams (fake_upstreams.py) on a local port, then runs each
+scenario at each size in a fresh subprocess pointed at them, so peak RSS is
+measured per run. Reports throughput, p50/p95/p99 latency and peak RSS as
+JSON; with --baseline, compares against an earlier report and exits 1 on
+regressions.
+
+Examples:
+    python run_benchmarks.py --output results.json
+    python run_benchmarks.py --sizes 1,100 --scenarios resolver-async --latency 0.02
+    python run_benchmarks.py --baseline results.json --tolerance 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "DataSpaceMVP"))
+sys.path.insert(0, str(ROOT / "species_id_entity_resolution"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_upstreams import FakeUpstreams, FaultSettings, SYNTHETIC_CODE_BASE, SYNTHETIC_SPECIES  # noqa: E402
+
+DEFAULT_SIZES = [1, 100, 10000]
+DEFAULT_CONCURRENCY = 16
+WORKER_TIMEOUT = 1800   # seconds per scenario run
+
+# Metrics compared against a baseline, and whether higher is better
+REGRESSION_METRICS = {
+    "throughput_qps": True,
+    "latency_ms.p95": False,
+    "peak_rss_mb": False,
+}
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def latency_summary(seconds: List[float]) -> Optional[dict]:
+    if not seconds:
+        return None
+    return {
+        "p50": round(percentile(seconds, 50) * 1000, 3),
+        "p95": round(percentile(seconds, 95) * 1000, 3),
+        "p99": round(percentile(seconds, 99) * 1000, 3),
+        "max": round(max(seconds) * 1000, 3),
+        "samples": len(seconds),
+    }
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def site_codes(size: int) -> List[str]:
+    return [f"BM{i:07d}" for i in range(size)]
+
+def species_queries(size: int) -> List[str]:
+    """Distinct names, with every fifth query a Natura2000 policy code."""
+    return [
+        str(SYNTHETIC_CODE_BASE + i % SYNTHETIC_SPECIES) if i % 5 == 0 else f"Benchmarkia query{i:05d}"
+        for i in range(size)
+    ]
+
+# --- Scenarios (run inside the worker process) -----------------------------
+#
+# Each returns (per-query latencies or None, number of failed queries).
+# Scenarios without per-query latencies report upstream request latencies.
+
+async def _gather_limited(items, worker, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def timed(item):
+        async with semaphore:
+            start = time.perf_counter()
+            result = await worker(item)
+            latencies.append(time.perf_counter() - start)
+            return result
+
+    return latencies, await asyncio.gather(*(timed(item) for item in items))
+
+def natura_site_info(size: int, concurrency: int):
+    import natura_2000_query as n2k
+
+    async def run():
+        try:
+            latencies, results = await _gather_limited(site_codes(size), n2k.get_site_info, concurrency)
+            return latencies, sum(1 for r in results if not r["results"])
+        finally:
+            await n2k.close_client()
+
+    return asyncio.run(run())
+
+def natura_site_bundle(size: int, concurrency: int):
+    import natura_2000_query as n2k
+
+    async def run():
+        try:
+            results = await n2k.get_sites_bundle(site_codes(size))
+            return None, sum(1 for r in results if not r["info"])
+        finally:
+            await n2k.close_client()
+
+    return asyncio.run(run())
+
+def _failed(identity) -> bool:
+    return not identity.gbif_usage_key or not identity.gnv_sources
+
+def resolver_resolve(size: int, concurrency: int, resolver):
+    def timed(query):
+        start = time.perf_counter()
+        identity = resolver.resolve(query)
+        return time.perf_counter() - start, identity
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, species_queries(size)))
+    return [t for t, _ in results], sum(1 for _, identity in results if _failed(identity))
+
+def resolver_resolve_many(size: int, concurrency: int, resolver):
+    identities = list(resolver.resolve_many(species_queries(size), max_workers=concurrency))
+    return None, sum(1 for identity in identities if _failed(identity))
+
+def resolver_async(size: int, concurrency: int, resolver):
+    import species_identifier_resolverv2 as sr
+
+    async def run():
+        async with sr.AsyncSpeciesResolver(resolver.policy_cache, verbose=False,
+                                           identity_cache=resolver.identity_cache) as async_resolver:
+            latencies, results = await _gather_limited(
+                species_queries(size), async_resolver.resolve, concurrency
+            )
+        return latencies, sum(1 for identity in results if _failed(identity))
+
+    return asyncio.run(run())
+
+SCENARIOS = {
+    "natura-site-info": (natura_site_info, "natura"),
+    "natura-site-bundle": (natura_site_bundle, "natura"),
+    "resolver-resolve": (resolver_resolve, "resolver"),
+    "resolver-resolve-many": (resolver_resolve_many, "resolver"),
+    "resolver-async": (resolver_async, "resolver"),
+}
+
+def run_worker(scenario: str, size: int, urls: Dict[str, str], concurrency: int,
+               warm: bool, rate_limits: bool) -> dict:
+    """Run one scenario against the fake upstreams and measure it."""
+    from bmd_common import profiling, traffic_control
+
+    function, tool = SCENARIOS[scenario]
+    workdir = Path(tempfile.mkdtemp(prefix="bmd-bench-"))
+    if not rate_limits:
+        traffic_control.configure_host("127.0.0.1", rate=1e9, burst=10 ** 9)
+
+    args = []
+    if tool == "natura":
+        import natura_2000_query as n2k
+        n2k.EEA_BASE = urls["EEA_BASE"]
+        n2k.configure_cache(enabled=warm, path=workdir / "natura_cache.sqlite")
+    else:
+        import species_identifier_resolverv2 as sr
+        sr.EEA_SPECIES_URL = urls["EEA_SPECIES_URL"]
+        sr.GBIF_MATCH_URL = urls["GBIF_MATCH_URL"]
+        sr.CHECKLISTBANK_URL = urls["CHECKLISTBANK_URL"]
+        sr.GNV_URL = urls["GNV_URL"]
+        sr.CACHE_FILE = workdir / "policy_codes.bin"
+        sr.LEGACY_CACHE_FILE = workdir / "policy_codes.json"
+        policy_cache = sr.PolicyCodeCache(verbose=False)
+        policy_cache.get("A072")   # load policy codes before timing
+        identity_cache = sr.IdentityCache(path=workdir / "identities.sqlite") if warm else None
+        args.append(sr.SpeciesResolver(policy_cache, verbose=False, identity_cache=identity_cache))
+
+    if warm:
+        function(size, concurrency, *args)
+    rss_before = peak_rss_mb()
+    profiling.enable()
+    profiling.reset()
+    start = time.perf_counter()
+    latencies, failed = function(size, concurrency, *args)
+    elapsed = time.perf_counter() - start
+    upstream = profiling.durations("request", "upstream")
+
+    return {
+        "scenario": scenario,
+        "size": size,
+        "warm": warm,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_qps": round(size / elapsed, 2) if elapsed else None,
+        "latency_ms": latency_summary(latencies if latencies is not None else upstream),
+        "latency_source": "query" if latencies is not None else "upstream_request",
+        "upstream_requests": len(upstream),
+        "upstream_latency_ms": latency_summary(upstream),
+        "failed_queries": failed,
+        "peak_rss_mb": peak_rss_mb(),
+        "rss_before_run_mb": rss_before,
+        "hosts": traffic_control.controller_stats(),
+    }
+
+# --- Driver -------------------------------------------------------------------
+
+def run_scenario(scenario: str, size: int, upstreams: FakeUpstreams, args) -> dict:
+    command = [
+        sys.executable, __file__, "--worker", scenario, str(size),
+        "--urls", json.dumps(upstreams.urls()), "--concurrency", str(args.concurrency),
+    ]
+    if args.warm:
+        command.append("--warm")
+    if args.rate_limits:
+        command.append("--rate-limits")
+    counts_before = dict(upstreams.counts)
+    proc = subprocess.run(command, capture_output=True, text=True, timeout=WORKER_TIMEOUT)
+    if proc.returncode != 0:
+        return {"scenario": scenario, "size": size, "error": proc.stderr.strip()[-2000:]}
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["server_requests"] = {
+        name: count - counts_before.get(name, 0) for name, count in upstreams.counts.items()
+        if count != counts_before.get(name, 0)
+    }
+    return result
+
+def metric(result: dict, path: str):
+    value = result
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+def find_regressions(results: List[dict], baseline: dict, tolerance: float) -> List[str]:
+    """Compare results with a baseline report; describe every metric beyond tolerance."""
+    previous = {(r["scenario"], r["size"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        old = previous.get((result["scenario"], result["size"]))
+        if old is None or "error" in result or "error" in old:
+            continue
+        for path, higher_is_better in REGRESSION_METRICS.items():
+            new_value, old_value = metric(result, path), metric(old, path)
+            if not new_value or not old_value:
+                continue
+            change = (new_value - old_value) / old_value
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                regressions.append(
+                    f"{result['scenario']} @ {result['size']}: {path} {old_value} -> {new_value} ({change:+.0%})"
+                )
+    return regressions
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline benchmarks against local fake EEA/GBIF/ChecklistBank/GNV servers",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"Scenarios: {', '.join(SCENARIOS)}",
+    )
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="Comma-separated scenarios to run (default: all)")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="Comma-separated query counts (default: 1,100,10000)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"Concurrent queries per run (default: {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--latency", type=float, default=0.005, help="Upstream delay per request (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.002, help="Uniform +/- jitter on the delay (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upstream requests failing with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of upstream requests answered with 429")
+    parser.add_argument("--warm", action="store_true",
+                        help="Measure a second pass with the response caches filled by the first")
+    parser.add_argument("--rate-limits", action="store_true",
+                        help="Keep the per-host rate limits (lifted by default so the client is measured)")
+    parser.add_argument("--output", metavar="FILE", help="Write the JSON report to FILE instead of stdout")
+    parser.add_argument("--baseline", metavar="FILE", help="Earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative change before a metric counts as a regression (default: 0.25)")
+    parser.add_argument("--worker", nargs=2, metavar=("SCENARIO", "SIZE"), help=argparse.SUPPRESS)
+    parser.add_argument("--urls", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        scenario, size = args.worker
+        result = run_worker(scenario, int(size), json.loads(args.urls), args.concurrency,
+                            args.warm, args.rate_limits)
+        print(json.dumps(result))
+        return
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+
+    faults = FaultSettings(args.latency, args.jitter, args.error_rate, args.throttle_rate)
+    results = []
+    with FakeUpstreams(faults=faults) as upstreams:
+        for scenario in scenarios:
+            for size in sizes:
+                print(f"Running {scenario} with {size} queries...", file=sys.stderr)
+                result = run_scenario(scenario, size, upstreams, args)
+                if "error" in result:
+                    print(f"  failed: {result['error'].splitlines()[-1]}", file=sys.stderr)
+                else:
+                    p95 = metric(result, "latency_ms.p95")
+                    print(f"  {result['throughput_qps']} q/s, p95 {'n/a' if p95 is None else p95} ms, "
+                          f"peak RSS {result['peak_rss_mb']} MB", file=sys.stderr)
+                results.append(result)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "concurrency": args.concurrency,
+            "warm": args.warm,
+            "rate_limits": args.rate_limits,
+            "faults": {"latency": args.latency, "jitter": args.jitter,
+                       "error_rate": args.error_rate, "throttle_rate": args.throttle_rate},
+        },
+        "results": results,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    for line in regressions:
+        print(f"Regression: {line}", file=sys.stderr)
+    if regressions or any("error" in r for r in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
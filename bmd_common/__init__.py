@@ -0,0 +1,12 @@
+"""
+Modules shared by the Natura2000 CLI (DataSpaceMVP) and the species
+identifier resolver (species_id_entity_resolution):
+
+- traffic_control: per-host rate limiting, retries and circuit breaking,
+  so both tools draw from the same budget per upstream within a process.
+- single_flight: coalescing of identical concurrent calls.
+- profiling: counters, timings and spans behind --profile.
+
+Entry points put the repository root on sys.path and import these as
+'bmd_common.<module>'.
+"""
@@ -0,0 +1,192 @@
+"""
+Lightweight hot-path instrumentation shared by the Natura2000 and species
+resolver CLIs.
+
+Code records spans (timed sections), counters and histogram observations
+through the module-level functions below. Recording is a no-op until
+enable() is called (the CLIs do this for --profile), and write_profile()
+then produces three files from one run:
+
+- <prefix>.json        structured summary plus the raw span list
+- <prefix>.trace.json  Chrome trace timeline (chrome://tracing, Perfetto)
+- <prefix>.prom        Prometheus text-format metrics
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+# Histogram buckets (seconds) for latency observations
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = False
+_trace = True
+_lock = threading.Lock()
+_origin = time.perf_counter()
+_spans = []
+_counters: Dict[Tuple, float] = {}
+_histograms: Dict[Tuple, dict] = {}
+
+def enable(trace: bool = True):
+    """Start recording. With trace=False only counters and histograms are kept,
+    so memory stays bounded in long-running processes."""
+    global _enabled, _trace, _origin
+    _enabled = True
+    _trace = trace
+    _origin = time.perf_counter()
+
+def enabled() -> bool:
+    return _enabled
+
+def reset():
+    """Discard everything recorded so far."""
+    global _origin
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+        _histograms.clear()
+        _origin = time.perf_counter()
+
+def _labels_key(name: str, labels: dict) -> Tuple:
+    return (name,) + tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _lane() -> int:
+    """Timeline lane: the current asyncio task if any, else the thread."""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return id(task) if task is not None else threading.get_ident()
+
+def count(name: str, value: float = 1, **labels):
+    """Increment a counter."""
+    if not _enabled:
+        return
+    key = _labels_key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name: str, value: float, **labels):
+    """Record a latency observation (seconds) in a histogram."""
+    if not _enabled:
+        return
+    key = _labels_key(name, labels)
+    with _lock:
+        hist = _histograms.setdefault(key, {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0})
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                hist["buckets"][i] += 1
+        hist["sum"] += value
+        hist["count"] += 1
+
+@contextmanager
+def span(name: str, category: str = "app", **args):
+    """Time a section; recorded as a timeline span and a histogram observation.
+
+    args become histogram labels, so keep them low-cardinality.
+    """
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        if _trace:
+            with _lock:
+                _spans.append((name, category, start - _origin, end - start, _lane(), args))
+        observe(f"{category}_{name}_seconds", end - start, **args)
+
+def durations(name: str, category: str) -> List[float]:
+    """Durations (seconds) of the recorded spans with this name and category."""
+    with _lock:
+        return [d for n, c, _, d, _, _ in _spans if n == name and c == category]
+
+def parse_json(response, source: str):
+    """response.json() timed as a 'json_parse' span."""
+    with span("json_parse", "parse", source=source):
+        return response.json()
+
+def cache_lookup(cache: str, hit: bool):
+    """Count a cache hit or miss."""
+    count("cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+def summary() -> dict:
+    """Aggregated metrics, including hit ratios per cache."""
+    with _lock:
+        counters = [{"name": k[0], "labels": dict(k[1:]), "value": v} for k, v in _counters.items()]
+        histograms = [
+            {"name": k[0], "labels": dict(k[1:]), "count": h["count"], "sum": round(h["sum"], 6),
+             "mean": round(h["sum"] / h["count"], 6) if h["count"] else None,
+             "buckets": dict(zip(map(str, LATENCY_BUCKETS), h["buckets"]))}
+            for k, h in _histograms.items()
+        ]
+    ratios = {}
+    for c in counters:
+        if c["name"] == "cache_requests_total":
+            entry = ratios.setdefault(c["labels"]["cache"], {"hit": 0, "miss": 0})
+            entry[c["labels"]["result"]] += c["value"]
+    for entry in ratios.values():
+        total = entry["hit"] + entry["miss"]
+        entry["hit_ratio"] = round(entry["hit"] / total, 4) if total else None
+    return {"counters": counters, "histograms": histograms, "cache_hit_ratios": ratios}
+
+def chrome_trace() -> dict:
+    """Spans as Chrome trace 'complete' events (microseconds)."""
+    pid = os.getpid()
+    with _lock:
+        spans = list(_spans)
+    return {
+        "traceEvents": [
+            {"name": name, "cat": category, "ph": "X", "ts": round(start * 1e6, 1),
+             "dur": round(duration * 1e6, 1), "pid": pid, "tid": lane, "args": args}
+            for name, category, start, duration, lane, args in spans
+        ],
+        "displayTimeUnit": "ms",
+    }
+
+def _prom_labels(labels: dict, extra: dict = None) -> str:
+    labels = {**labels, **(extra or {})}
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+def prometheus_text() -> str:
+    """Counters and histograms in Prometheus text exposition format."""
+    data = summary()
+    lines = []
+    for name in sorted({c["name"] for c in data["counters"]}):
+        lines.append(f"# TYPE bmd_{name} counter")
+        for c in data["counters"]:
+            if c["name"] == name:
+                lines.append(f"bmd_{name}{_prom_labels(c['labels'])} {c['value']}")
+    for name in sorted({h["name"] for h in data["histograms"]}):
+        lines.append(f"# TYPE bmd_{name} histogram")
+        for h in data["histograms"]:
+            if h["name"] != name:
+                continue
+            for bound, n in h["buckets"].items():
+                lines.append(f"bmd_{name}_bucket{_prom_labels(h['labels'], {'le': bound})} {n}")
+            lines.append(f"bmd_{name}_bucket{_prom_labels(h['labels'], {'le': '+Inf'})} {h['count']}")
+            lines.append(f"bmd_{name}_sum{_prom_labels(h['labels'])} {h['sum']}")
+            lines.append(f"bmd_{name}_count{_prom_labels(h['labels'])} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+def write_profile(prefix: str, extra: dict = None):
+    """Write the JSON summary, Chrome trace and Prometheus dump for this run."""
+    with _lock:
+        spans = [
+            {"name": n, "category": c, "start": round(s, 6), "duration": round(d, 6), "lane": l, "args": a}
+            for n, c, s, d, l, a in _spans
+        ]
+    with open(f"{prefix}.json", "w", encoding="utf-8") as f:
+        json.dump({**summary(), **(extra or {}), "spans": spans}, f, indent=2, default=str)
+    with open(f"{prefix}.trace.json", "w", encoding="utf-8") as f:
+        json.dump(chrome_trace(), f, default=str)
+    with open(f"{prefix}.prom", "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
@@ -0,0 +1,102 @@
+"""
+Single-flight request coalescing.
+
+While a call for a key is in flight, further calls for the same key wait
+for it and receive its result (or exception) instead of starting their own.
+Nothing is cached once the call completes; persistent caching is left to
+the response caches. Keys should be normalised by the caller (e.g. the
+normalised SQL text, or an upper-cased policy code).
+
+SingleFlight serves threads; AsyncSingleFlight serves coroutines in one
+event loop.
+"""
+
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from . import profiling
+
+T = TypeVar("T")
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Thread-safe coalescing of identical concurrent calls."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.shared = 0
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """Run fn() for key, or wait for the in-flight call with the same key."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+        if not leader:
+            profiling.count("singleflight_shared_total", group=self.name)
+            call.done.wait()
+        else:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class AsyncSingleFlight:
+    """Coalescing of identical concurrent coroutine calls within one event loop.
+
+    The shared call runs as its own task, so a caller that is cancelled does
+    not cancel the work the other callers are waiting on. Once the last
+    caller has gone (cancelled or timed out), the shared task is cancelled
+    too and the key is released, so a hung call cannot hold it.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.shared = 0
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Await fn() for key, or the in-flight call with the same key."""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(fn()))
+            flight.task.add_done_callback(lambda _, key=key, flight=flight: self._forget(key, flight))
+        else:
+            self.shared += 1
+            profiling.count("singleflight_shared_total", group=self.name)
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+                self._forget(key, flight)
+
+    def _forget(self, key: Hashable, flight: _Flight):
+        # A cancelled flight may finish after a new one took its key
+        if self._flights.get(key) is flight:
+            del self._flights[key]
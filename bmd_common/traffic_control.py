@@ -0,0 +1,353 @@
+"""
+Shared per-host traffic control for calls to upstream APIs
+(DiscoData, GBIF, ChecklistBank, Global Names Verifier).
+
+Every request to a host goes through that host's HostController, which
+combines:
+- a token bucket rate limit,
+- an adaptive (AIMD) concurrency limit that halves on 429/503/timeouts and
+  grows slowly on success,
+- retries with jittered exponential backoff that honour Retry-After,
+- a circuit breaker that fails fast while a host is consistently failing.
+
+Controllers work from threads (requests.Session) and from asyncio
+(httpx.AsyncClient), so one process shares a single budget per host.
+"""
+
+import asyncio
+import email.utils
+import random
+import threading
+import time
+import urllib.parse
+from typing import Dict, Optional
+
+from . import profiling
+
+# Statuses worth retrying; 429 and 503 also signal overload
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+OVERLOAD_STATUSES = {429, 503}  # also shrink the concurrency limit
+
+DEFAULT_SETTINGS = {
+    "rate": 5.0,                # requests per second
+    "burst": 10,                # token bucket capacity
+    "initial_concurrency": 4,
+    "min_concurrency": 1,
+    "max_concurrency": 32,
+    "max_retries": 4,
+    "backoff_base": 0.5,        # seconds
+    "backoff_cap": 30.0,
+    "failure_threshold": 5,     # consecutive failures before the circuit opens
+    "reset_timeout": 30.0,      # seconds before a half-open probe
+}
+
+HOST_SETTINGS: Dict[str, dict] = {
+    "discodata.eea.europa.eu": {"rate": 5.0, "burst": 10},
+    "api.gbif.org": {"rate": 10.0, "burst": 20, "max_concurrency": 16},
+    "api.checklistbank.org": {"rate": 5.0, "burst": 10},
+    "verifier.globalnames.org": {"rate": 2.0, "burst": 4, "max_concurrency": 4},
+}
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a host's circuit breaker is open."""
+
+class TokenBucket:
+    """Token bucket; reserve() returns how long the caller must wait."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open probe after a timeout."""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probing:
+                self._probing = True  # let exactly one probe through
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def release_probe(self):
+        """End a half-open probe without a verdict (e.g. the probe was throttled)."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+class AdaptiveConcurrency:
+    """AIMD concurrency limit shared by threads and event loops."""
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._async_waiters = []
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self):
+        with self._cond:
+            while not self._try_acquire():
+                self._cond.wait()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self._try_acquire():
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            await waiter
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._wake()
+
+    def _wake(self):
+        self._cond.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_set_done, waiter)
+
+    def on_success(self):
+        with self._cond:
+            # Additive increase: roughly +1 per limit's worth of successes
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._wake()
+
+    def on_overload(self):
+        with self._cond:
+            # Multiplicative decrease
+            self.limit = max(self.minimum, self.limit / 2)
+
+def _set_done(future):
+    if not future.done():
+        future.set_result(None)
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class HostController:
+    """Rate limit, concurrency, retry and circuit breaking for one host."""
+
+    def __init__(self, host: str, **settings):
+        self.host = host
+        self.settings = {**DEFAULT_SETTINGS, **settings}
+        s = self.settings
+        self.bucket = TokenBucket(s["rate"], s["burst"])
+        self.breaker = CircuitBreaker(s["failure_threshold"], s["reset_timeout"])
+        self.concurrency = AdaptiveConcurrency(
+            s["initial_concurrency"], s["min_concurrency"], s["max_concurrency"]
+        )
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "failures": 0, "rejected": 0}
+        self._stats_lock = threading.Lock()   # stats are shared by threads
+
+    def _count(self, stat: str):
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+    def _backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.settings["backoff_cap"])
+        # Full jitter
+        ceiling = min(self.settings["backoff_cap"], self.settings["backoff_base"] * 2 ** attempt)
+        return random.uniform(0, ceiling)
+
+    def _check_circuit(self):
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise CircuitOpenError(f"Circuit open for {self.host}; not sending request")
+
+    def _record(self, response):
+        profiling.count("upstream_responses_total", host=self.host, status=response.status_code)
+        profiling.count("upstream_bytes_total", len(response.content), host=self.host)
+
+    def _retry(self):
+        self._count("retries")
+        profiling.count("upstream_retries_total", host=self.host)
+
+    def _outcome(self, status: Optional[int]) -> str:
+        """Classify a response (None = transport error) and update the controls."""
+        if status == 429:
+            # Throttled, not broken: back off without tripping the breaker
+            self._count("throttled")
+            self.concurrency.on_overload()
+            self.breaker.release_probe()
+            return "retry"
+        if status is None or status in OVERLOAD_STATUSES:
+            self._count("failures")
+            self.concurrency.on_overload()
+            self.breaker.record_failure()
+            return "retry"
+        if status in RETRY_STATUSES:
+            self._count("failures")
+            self.breaker.record_failure()
+            return "retry"
+        self.concurrency.on_success()
+        self.breaker.record_success()
+        return "done"
+
+    def request(self, session, method: str, url: str, **kwargs):
+        """Send a request with a requests.Session under this host's controls."""
+        max_retries = self.settings["max_retries"]
+        for attempt in range(max_retries + 1):
+            self._check_circuit()
+            try:
+                time.sleep(self.bucket.reserve())
+                self.concurrency.acquire()
+            except BaseException:
+                self.breaker.release_probe()
+                raise
+            self._count("requests")
+            try:
+                with profiling.span("request", "upstream", host=self.host):
+                    response = session.request(method, url, **kwargs)
+            except Exception:
+                self._outcome(None)
+                if attempt == max_retries:
+                    raise
+                self._retry()
+                time.sleep(self._backoff(attempt))
+                continue
+            except BaseException:
+                self.breaker.release_probe()
+                raise
+            finally:
+                self.concurrency.release()
+            self._record(response)
+            if self._outcome(response.status_code) == "done" or attempt == max_retries:
+                return response
+            self._retry()
+            time.sleep(self._backoff(attempt, retry_after_seconds(response.headers.get("Retry-After"))))
+
+    async def request_async(self, client, method: str, url: str, **kwargs):
+        """Send a request with an httpx.AsyncClient under this host's controls."""
+        max_retries = self.settings["max_retries"]
+        for attempt in range(max_retries + 1):
+            self._check_circuit()
+            # A probe cancelled (e.g. by a caller's timeout) before its verdict
+            # must hand the half-open slot back, or the circuit never closes
+            try:
+                await asyncio.sleep(self.bucket.reserve())
+                await self.concurrency.acquire_async()
+            except BaseException:
+                self.breaker.release_probe()
+                raise
+            self._count("requests")
+            try:
+                with profiling.span("request", "upstream", host=self.host):
+                    response = await client.request(method, url, **kwargs)
+            except Exception:
+                self._outcome(None)
+                if attempt == max_retries:
+                    raise
+                self._retry()
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            except BaseException:
+                self.breaker.release_probe()
+                raise
+            finally:
+                self.concurrency.release()
+            self._record(response)
+            if self._outcome(response.status_code) == "done" or attempt == max_retries:
+                return response
+            self._retry()
+            await asyncio.sleep(self._backoff(attempt, retry_after_seconds(response.headers.get("Retry-After"))))
+
+_controllers: Dict[str, HostController] = {}
+_registry_lock = threading.Lock()
+
+def configure_host(host: str, **settings):
+    """Override settings for a host. Applies to controllers created afterwards."""
+    unknown = set(settings) - set(DEFAULT_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown traffic settings: {', '.join(sorted(unknown))}")
+    HOST_SETTINGS.setdefault(host, {}).update(settings)
+
+def get_controller(url: str) -> HostController:
+    """Return the process-wide controller for a URL's host."""
+    host = urllib.parse.urlsplit(url).hostname or ""
+    with _registry_lock:
+        if host not in _controllers:
+            _controllers[host] = HostController(host, **HOST_SETTINGS.get(host, {}))
+        return _controllers[host]
+
+def controlled_request(session, method: str, url: str, **kwargs):
+    """requests-based request through the shared controller for url's host."""
+    return get_controller(url).request(session, method, url, **kwargs)
+
+async def controlled_request_async(client, method: str, url: str, **kwargs):
+    """httpx-based request through the shared controller for url's host."""
+    return await get_controller(url).request_async(client, method, url, **kwargs)
+
+def controller_stats() -> Dict[str, dict]:
+    """Per-host counters and current limits."""
+    return {
+        host: {
+            **controller.stats,
+            "concurrency_limit": round(controller.concurrency.limit, 2),
+            "circuit": controller.breaker.state,
+        }
+        for host, controller in _controllers.items()
+    }
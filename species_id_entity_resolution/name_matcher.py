@@ -0,0 +1,280 @@
+"""
+In-process approximate matching of scientific names.
+
+NameMatcher indexes names by their canonical form (authorship, rank and
+hybrid markers, subgenera and diacritics removed) and answers lookups
+without a network round trip:
+
+- EXACT: the canonical forms are equal (a dict lookup).
+- FUZZY: the closest indexed name within a small edit distance. Candidates
+  come from a trigram index (q-gram count filter, probing only the query's
+  rarest trigrams) and are verified with a banded Levenshtein distance, so
+  a lookup touches a few dozen names.
+- HIGHERRANK: an infraspecific name whose species is indexed.
+
+Confidence follows GBIF's species/match scale: 99 for an exact canonical
+match, lower by FUZZY_PENALTY per edit. Ties between different names are
+treated like GBIF's "multiple equal matches" and return no match, leaving
+the decision to the GBIF match call.
+
+The resolver indexes the EEA policy-code names (PolicyCodeCache.match_name)
+and, optionally, a local checklist snapshot (load_checklist) whose matches
+stand in for the GBIF match response.
+"""
+
+import csv
+import unicodedata
+from dataclasses import dataclass
+from itertools import chain
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+EXACT_CONFIDENCE = 99
+HIGHERRANK_CONFIDENCE = 90
+FUZZY_PENALTY = 8          # confidence lost per edit
+MIN_CONFIDENCE = 80        # default threshold for accepting a match
+MIN_FUZZY_LENGTH = 6       # shorter names only match exactly
+
+# Markers dropped from names (compared lowercase, without a trailing '.')
+RANK_MARKERS = frozenset({
+    "subsp", "ssp", "var", "subvar", "f", "fo", "forma", "cv", "agg", "aggr",
+    "s.l", "s.str", "s.lat", "sensu", "cf", "aff", "nothosubsp", "nothovar",
+    "sp", "spp", "sp.nov",
+})
+HYBRID_MARKERS = frozenset({"x", "×"})
+# Lowercase particles that start an author name ('de Candolle', 'von Post')
+AUTHOR_PARTICLES = frozenset({"d'", "da", "de", "del", "della", "den", "der", "di", "du", "la", "van", "von"})
+
+MAX_WORDS = 4   # genus, species, infraspecific epithet (and one spare)
+
+def _strip_accents(text: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+def canonical_form(name: str) -> str:
+    """
+    Lowercase canonical name used as the matching key, e.g.
+    'Mentha × piperita L.' -> 'mentha piperita',
+    'Anacamptis pyramidalis var. tanayensis (Chenevard) Soó' -> 'anacamptis pyramidalis tanayensis',
+    'Carabus (Procerus) olympiae Sella, 1855' -> 'carabus olympiae'
+    """
+    if name.isupper():
+        name = name.capitalize()
+    words = _strip_accents(name.replace("×", " × ").replace("†", " ")).split()
+    kept: List[str] = []
+    for i, word in enumerate(words):
+        marker = word.lower().rstrip(".")
+        if word in HYBRID_MARKERS or marker in RANK_MARKERS:
+            continue
+        if not kept:
+            kept.append(word)
+            continue
+        # Subgenus in parentheses right after the genus
+        if len(kept) == 1 and word.startswith("(") and word.endswith(")") and word[1:2].isupper():
+            continue
+        # Authorship starts with a capital, '(' or a year, or an author particle
+        if not word[:1].islower():
+            break
+        if marker in AUTHOR_PARTICLES and i + 1 < len(words) and words[i + 1][:1].isupper():
+            break
+        kept.append(word)
+        if len(kept) == MAX_WORDS:
+            break
+    return " ".join(kept).lower()
+
+def levenshtein(a: str, b: str, max_distance: int) -> int:
+    """
+    Edit distance between a and b, or max_distance + 1 if it is larger.
+    Only the diagonal band of width 2 * max_distance + 1 is computed, after
+    dropping the common prefix and suffix.
+    """
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    if len(a) < len(b):
+        a, b = b, a
+    if len(a) - len(b) > max_distance:
+        return max_distance + 1
+    over = max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        lo, hi = max(1, i - max_distance), min(len(b), i + max_distance)
+        current = [over] * (len(b) + 1)
+        current[0] = i if i <= max_distance else over
+        row_min = current[0]
+        for j in range(lo, hi + 1):
+            cost = previous[j - 1] + (ca != b[j - 1])
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            current[j] = cost
+            if cost < row_min:
+                row_min = cost
+        if row_min > max_distance:
+            return over
+        previous = current
+    return min(previous[-1], over)
+
+def _trigrams(key: str) -> set:
+    padded = f"  {key}  "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def max_edits(key: str) -> int:
+    """Edits tolerated for a canonical name of this length."""
+    if len(key) < MIN_FUZZY_LENGTH:
+        return 0
+    if len(key) <= 10:
+        return 1
+    if len(key) <= 20:
+        return 2
+    return 3
+
+@dataclass
+class NameMatch:
+    """A matched name with a GBIF-style match type and confidence."""
+    name: str
+    payload: Any
+    match_type: str        # EXACT, FUZZY or HIGHERRANK
+    confidence: int
+    distance: int = 0
+
+class NameMatcher:
+    """Exact and edit-distance lookups over a fixed set of names."""
+
+    def __init__(self):
+        self._names: List[str] = []
+        self._keys: List[str] = []
+        self._payloads: List[Any] = []
+        self._exact: Dict[str, List[int]] = {}
+        self._grams: List[Optional[frozenset]] = []
+        self._postings: Dict[str, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, name: str, payload: Any = None):
+        """Index name; payload is returned with its matches."""
+        key = canonical_form(name)
+        if not key:
+            return
+        entry = len(self._names)
+        self._names.append(name)
+        self._keys.append(key)
+        self._payloads.append(payload)
+        entries = self._exact.setdefault(key, [])
+        entries.append(entry)
+        grams = None
+        if len(entries) == 1:
+            grams = frozenset(_trigrams(key))
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(entry)
+        self._grams.append(grams)
+
+    def _pick(self, entries: List[int]) -> Optional[int]:
+        """The one entry meant by a set of equally good candidates, or None if ambiguous."""
+        if len(entries) == 1:
+            return entries[0]
+        accepted = [e for e in entries
+                    if isinstance(self._payloads[e], dict) and self._payloads[e].get("status") == "ACCEPTED"]
+        return accepted[0] if len(accepted) == 1 else None
+
+    def _match(self, entry: int, match_type: str, confidence: int, distance: int) -> NameMatch:
+        return NameMatch(self._names[entry], self._payloads[entry], match_type, confidence, distance)
+
+    def match(self, name: str, min_confidence: int = MIN_CONFIDENCE) -> Optional[NameMatch]:
+        """The best match for name with at least min_confidence, or None."""
+        key = canonical_form(name)
+        if not key:
+            return None
+        match = self._lookup(key, min_confidence)
+        words = key.split()
+        if match is None and len(words) > 2 and HIGHERRANK_CONFIDENCE >= min_confidence:
+            entries = self._exact.get(" ".join(words[:2]))
+            entry = self._pick(entries) if entries else None
+            if entry is not None:
+                match = self._match(entry, "HIGHERRANK", HIGHERRANK_CONFIDENCE, 0)
+        return match
+
+    def _lookup(self, key: str, min_confidence: int) -> Optional[NameMatch]:
+        entries = self._exact.get(key)
+        if entries is not None:
+            entry = self._pick(entries)
+            return None if entry is None else self._match(entry, "EXACT", EXACT_CONFIDENCE, 0)
+
+        limit = min(max_edits(key), (EXACT_CONFIDENCE - min_confidence) // FUZZY_PENALTY)
+        if limit <= 0:
+            return None
+        grams = _trigrams(key)
+        # Each edit removes at most three of the query's trigrams, so a match
+        # shares `needed` of them and has at least one of the rarest 3 * limit + 1
+        needed = len(grams) - 3 * limit
+        postings = sorted((self._postings.get(gram, ()) for gram in grams), key=len)
+        if needed > 0:
+            postings = postings[:3 * limit + 1]
+        best, best_distance = [], limit + 1
+        for entry in set(chain.from_iterable(postings)):
+            if needed > 0 and len(grams & self._grams[entry]) < needed:
+                continue
+            distance = levenshtein(key, self._keys[entry], min(best_distance, limit))
+            if distance < best_distance:
+                best, best_distance = [entry], distance
+            elif distance == best_distance and distance <= limit:
+                best.append(entry)
+        if not best:
+            return None
+        # Names sharing a canonical form count as one candidate
+        candidates = list(chain.from_iterable(self._exact[self._keys[e]] for e in best))
+        entry = self._pick(candidates)
+        if entry is None:
+            return None
+        return self._match(entry, "FUZZY", EXACT_CONFIDENCE - FUZZY_PENALTY * best_distance, best_distance)
+
+# Darwin Core Taxon columns -> GBIF species/match response fields
+CHECKLIST_FIELDS = {
+    "taxonID": "usageKey",
+    "scientificName": "scientificName",
+    "canonicalName": "canonicalName",
+    "scientificNameAuthorship": "authorship",
+    "taxonRank": "rank",
+    "taxonomicStatus": "status",
+    "acceptedNameUsageID": "acceptedUsageKey",
+    "kingdom": "kingdom",
+    "phylum": "phylum",
+    "class": "class",
+    "order": "order",
+    "family": "family",
+    "genus": "genus",
+}
+
+def _checklist_value(field: str, value: str):
+    if field in ("usageKey", "acceptedUsageKey") and value.isdigit():
+        return int(value)
+    if field in ("rank", "status"):
+        # 'homotypic synonym' -> 'HOMOTYPIC_SYNONYM', as in GBIF responses
+        return "_".join(value.upper().split())
+    return value
+
+def load_checklist(path: Path) -> NameMatcher:
+    """
+    Index a local checklist snapshot: a Darwin Core Taxon table (e.g. Taxon.tsv
+    from a GBIF backbone or ChecklistBank export; tab-separated unless the file
+    ends in .csv). Each name's payload is shaped like a GBIF match response.
+    """
+    path = Path(path)
+    matcher = NameMatcher()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f, delimiter="," if path.suffix.lower() == ".csv" else "\t",
+                                quoting=csv.QUOTE_NONE if path.suffix.lower() != ".csv" else csv.QUOTE_MINIMAL)
+        if not reader.fieldnames or "scientificName" not in reader.fieldnames:
+            raise ValueError(f"{path} is not a Darwin Core Taxon table (no scientificName column)")
+        for row in reader:
+            payload = {field: _checklist_value(field, row[column].strip())
+                       for column, field in CHECKLIST_FIELDS.items() if (row.get(column) or "").strip()}
+            name = payload.get("canonicalName") or payload.get("scientificName")
+            if name:
+                matcher.add(name, payload)
+    return matcher
@@ -0,0 +1,146 @@
+"""
+Compact binary snapshot of the EEA policy-code table used by PolicyCodeCache.
+
+Loading is a single file read plus two small array copies (no parsing of
+the records), so the ~3,300 codes are available in well under a
+millisecond. Lookups binary-search sorted index arrays and decode only the
+records they touch.
+
+Layout (integers little-endian):
+
+    header   8s magic, float64 timestamp, uint32 record count n, uint32 blob size
+    offsets  uint32[n + 1]  start of each record in the blob (records sorted by code)
+    by_name  uint32[n]      record numbers sorted by normalized name
+    by_canon uint32[n]      record numbers sorted by canonical name
+    blob     records as UTF-8 fields joined by 0x1F:
+             code, scientific_name, authorship, eunis_url, name_key, canonical_key
+"""
+
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional
+
+MAGIC = b"BMDPCS01"
+HEADER = struct.Struct("<8sdII")
+SEPARATOR = b"\x1f"
+
+FIELDS = ("natura2000", "scientific_name", "authorship", "eunis_url")
+NAME_KEY, CANONICAL_KEY = 4, 5   # positions of the search keys in a record
+
+def _uint32_array(data: bytes) -> array:
+    values = array("I")
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+def _uint32_bytes(values) -> bytes:
+    data = array("I", values)
+    if sys.byteorder == "big":
+        data.byteswap()
+    return data.tobytes()
+
+def write_snapshot(path: Path, codes: Dict[str, dict], timestamp: float,
+                   name_key: Callable[[str], str], canonical_key: Callable[[str], str]):
+    """Write codes ({code: {scientific_name, authorship, eunis_url}}) atomically to path."""
+    records = []
+    for code, info in codes.items():
+        name = info["scientific_name"]
+        fields = (code, name, info.get("authorship") or "", info.get("eunis_url") or "",
+                  name_key(name), canonical_key(name))
+        records.append([field.replace("\x1f", " ").encode("utf-8") for field in fields])
+    records.sort(key=lambda r: r[0])
+
+    blob, offsets = bytearray(), []
+    for record in records:
+        offsets.append(len(blob))
+        blob += SEPARATOR.join(record)
+    offsets.append(len(blob))
+    by_name = sorted(range(len(records)), key=lambda i: records[i][NAME_KEY])
+    by_canonical = sorted(range(len(records)), key=lambda i: records[i][CANONICAL_KEY])
+
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, timestamp, len(records), len(blob)))
+            f.write(_uint32_bytes(offsets))
+            f.write(_uint32_bytes(by_name))
+            f.write(_uint32_bytes(by_canonical))
+            f.write(blob)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class PolicyCodeSnapshot:
+    """Read-only view of a snapshot file."""
+
+    def __init__(self, data: bytes):
+        if len(data) < HEADER.size:
+            raise ValueError("Policy code snapshot is truncated")
+        magic, self.timestamp, count, blob_size = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a policy code snapshot")
+        start = HEADER.size
+        index_size = 4 * (3 * count + 1)
+        if len(data) != start + index_size + blob_size:
+            raise ValueError("Policy code snapshot is truncated")
+        self.count = count
+        self.offsets = _uint32_array(data[start:start + 4 * (count + 1)])
+        start += 4 * (count + 1)
+        self.by_name = _uint32_array(data[start:start + 4 * count])
+        start += 4 * count
+        self.by_canonical = _uint32_array(data[start:start + 4 * count])
+        self.blob = data[start + 4 * count:]
+
+    @classmethod
+    def load(cls, path: Path) -> "PolicyCodeSnapshot":
+        with open(path, "rb") as f:
+            return cls(f.read())
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _fields(self, record: int) -> list:
+        return self.blob[self.offsets[record]:self.offsets[record + 1]].split(SEPARATOR)
+
+    def _record(self, record: int) -> dict:
+        return {name: value.decode("utf-8") or None for name, value in zip(FIELDS, self._fields(record))}
+
+    def records(self) -> Iterator[dict]:
+        """Every record, in code order."""
+        for record in range(self.count):
+            yield self._record(record)
+
+    def _search(self, key: str, field: int, order=None) -> Optional[dict]:
+        """Leftmost record whose field equals key (order maps positions to records)."""
+        target = key.encode("utf-8")
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = order[mid] if order is not None else mid
+            if self._fields(record)[field] < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.count:
+            return None
+        record = order[lo] if order is not None else lo
+        if self._fields(record)[field] != target:
+            return None
+        return self._record(record)
+
+    def get(self, code: str) -> Optional[dict]:
+        return self._search(code, 0)
+
+    def get_by_name_key(self, key: str) -> Optional[dict]:
+        return self._search(key, NAME_KEY, self.by_name)
+
+    def get_by_canonical_key(self, key: str) -> Optional[dict]:
+        return self._search(key, CANONICAL_KEY, self.by_canonical)
@@ -13,19 +13,100 @@ Usage:
     python species_resolver.py "A072"
     python species_resolver.py "Pernis apivorus"
     python species_resolver.py "Falco apivorus" --refresh-cache
+    python species_resolver.py --batch names.txt > identities.ndjson
 """
 
-import requests
+# Network libraries (requests, httpx) are imported on first use so that
+# cached lookups and --help do not pay for them
+import asyncio
+import importlib.util
 import json
 import sys
-from typing import Dict, Optional, List
-from dataclasses import dataclass, asdict
+from typing import Dict, Optional, List, Iterable, Iterator
+from dataclasses import dataclass, asdict, replace
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
 import argparse
 from pathlib import Path
+import sqlite3
+import threading
 import time
 
-# Cache file for EEA policy codes
-CACHE_FILE = Path.home() / '.species_resolver_cache.json'
+# Per-host rate limiting / retry / circuit breaking is shared with the
+# Natura2000 tooling (bmd_common at the repository root) so both CLIs draw
+# from the same budget per upstream
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+from bmd_common.traffic_control import controlled_request, controlled_request_async, controller_stats  # noqa: E402
+from bmd_common import profiling  # noqa: E402
+from bmd_common.single_flight import AsyncSingleFlight, SingleFlight  # noqa: E402
+from policy_code_snapshot import PolicyCodeSnapshot, write_snapshot  # noqa: E402
+from name_matcher import MIN_CONFIDENCE, NameMatcher, load_checklist  # noqa: E402
+
+# Cache file for EEA policy codes (binary snapshot, see policy_code_snapshot.py)
+CACHE_FILE = Path.home() / '.species_resolver_cache.bin'
+# Caches written by earlier versions (SQLite table, whole-file JSON); imported once if present
+LEGACY_SQLITE_CACHE_FILE = Path.home() / '.species_resolver_cache.sqlite'
+LEGACY_CACHE_FILE = Path.home() / '.species_resolver_cache.json'
+
+# Cache file for upstream (GBIF, ChecklistBank, GNV) responses
+IDENTITY_CACHE_FILE = Path.home() / '.species_resolver_identities.sqlite'
+
+# How long cached upstream responses stay valid (seconds)
+SOURCE_TTLS = {
+    'gbif': 30 * 24 * 3600,
+    'checklistbank': 30 * 24 * 3600,
+    'gnv': 14 * 24 * 3600,
+}
+NEGATIVE_TTL = 24 * 3600                 # "no match" answers are rechecked daily
+IDENTITY_CACHE_MAX_BYTES = 100 * 1024 * 1024
+
+# Upstream endpoints
+EEA_SPECIES_URL = "https://www.eea.europa.eu/data-and-maps/daviz/sds/list-of-eunis-species-with-1/daviz.json"
+GBIF_MATCH_URL = "https://api.gbif.org/v1/species/match"
+CHECKLISTBANK_URL = "https://api.checklistbank.org/dataset/3/nameusage/{usage_key}"
+GNV_URL = "https://verifier.globalnames.org/api/v1/verifications"
+GNV_PREFERRED_SOURCES = [1, 11, 158, 163, 180, 207]  # CoL, GBIF, EUNIS, IUCN, iNaturalist, Wikidata
+
+USER_AGENT = 'SpeciesResolverCLI/2.0 (Educational/Research)'
+
+# Per-source timeouts (seconds) for the async resolver; a slow source
+# yields a partial identity instead of holding up the others
+SOURCE_TIMEOUTS = {
+    'gbif': 10.0,
+    'checklistbank': 10.0,
+    'gnv': 15.0,
+}
+
+# Batch resolution defaults
+GNV_BATCH_SIZE = 250   # names per Global Names Verifier POST
+MAX_WORKERS = 8        # concurrent GBIF/ChecklistBank lookups
+
+def normalize_name(name: str) -> str:
+    """Lowercase a name and collapse whitespace"""
+    return ' '.join(name.lower().split())
+
+
+def canonical_name(name: str) -> str:
+    """
+    Strip authorship from a scientific name and normalize it,
+    e.g. 'Pernis apivorus (Linnaeus, 1758)' -> 'pernis apivorus'
+    """
+    words = name.split()
+    kept = words[:1]
+    for word in words[1:]:
+        # Authorship starts with a capital, '(' or a year
+        if not word[:1].islower():
+            break
+        kept.append(word)
+    return ' '.join(kept).lower()
+
+
+def unavailable(source: str) -> Dict:
+    """Stand-in response for a source that failed or timed out (never cached)"""
+    return {'unavailable': source}
+
 
 @dataclass
 class SpeciesIdentity:
@@ -63,62 +144,120 @@ class SpeciesIdentity:
     wikidata_id: Optional[str] = None
     iucn_id: Optional[str] = None
     eunis_code: Optional[str] = None
+    
+    # Upstream sources that failed or timed out (the identity is incomplete)
+    unavailable_sources: Optional[List[str]] = None
 
 
 class PolicyCodeCache:
-    """Cache for EEA EUNIS policy code mappings"""
+    """
+    Cache for EEA EUNIS policy code mappings.
     
-    def __init__(self):
-        self.cache = self._load_cache()
+    Codes are kept in a compact binary snapshot (policy_code_snapshot.py)
+    searchable by Natura2000 code, normalized scientific name and canonical
+    name without authorship. Nothing is read until the first lookup, and
+    loading the snapshot is a single file read. Refreshes write a new
+    snapshot and atomically swap it in. Misspelt names are matched by a
+    NameMatcher over the snapshot's names, built on first use.
+    """
+    
+    def __init__(self, verbose: bool = True):
+        self.verbose = verbose
         self.cache_age_hours = 24 * 7  # Refresh weekly
+        self._fetch_attempted = False
+        self._loaded = False
+        self.snapshot: Optional[PolicyCodeSnapshot] = None
+        self._matcher: Optional[tuple] = None   # (snapshot, NameMatcher over its names)
+    
+    def _log(self, message: str):
+        """Print a status message (to stderr when not verbose, to keep stdout clean)"""
+        print(message, file=sys.stdout if self.verbose else sys.stderr)
+    
+    def _read_snapshot(self) -> Optional[PolicyCodeSnapshot]:
+        try:
+            return PolicyCodeSnapshot.load(CACHE_FILE)
+        except (OSError, ValueError) as e:
+            self._log(f"Cache load failed: {e}")
+            return None
     
-    def _load_cache(self) -> Dict:
-        """Load cache from disk"""
+    def _load_cache(self) -> Optional[PolicyCodeSnapshot]:
+        """Read the snapshot if it is recent; returns None if missing or stale"""
+        if not CACHE_FILE.exists():
+            self._import_legacy_cache()
         if CACHE_FILE.exists():
-            try:
-                with open(CACHE_FILE, 'r') as f:
-                    data = json.load(f)
-                    # Check if cache is recent
-                    cache_time = data.get('timestamp', 0)
-                    if time.time() - cache_time < self.cache_age_hours * 3600:
-                        print(f"Loaded {len(data.get('codes', {}))} policy codes from cache")
-                        return data
-            except Exception as e:
-                print(f"Cache load failed: {e}")
-        return {'codes': {}, 'timestamp': 0}
+            snapshot = self._read_snapshot()
+            if snapshot and time.time() - snapshot.timestamp < self.cache_age_hours * 3600:
+                return snapshot
+        return None
     
-    def _save_cache(self):
-        """Save cache to disk"""
+    def _import_legacy_cache(self):
+        """Convert a cache written by earlier versions (SQLite or JSON) into a snapshot"""
         try:
-            self.cache['timestamp'] = time.time()
-            with open(CACHE_FILE, 'w') as f:
-                json.dump(self.cache, f)
-            print(f"Saved {len(self.cache['codes'])} policy codes to cache")
+            if LEGACY_SQLITE_CACHE_FILE.exists():
+                db = sqlite3.connect(f"file:{LEGACY_SQLITE_CACHE_FILE}?mode=ro", uri=True)
+                try:
+                    codes = {
+                        code: {'scientific_name': name, 'authorship': authorship, 'eunis_url': url}
+                        for code, name, authorship, url in db.execute(
+                            "SELECT natura2000, scientific_name, authorship, eunis_url FROM policy_codes")
+                    }
+                    row = db.execute("SELECT value FROM meta WHERE key = 'timestamp'").fetchone()
+                    timestamp = float(row[0]) if row else 0.0
+                finally:
+                    db.close()
+            elif LEGACY_CACHE_FILE.exists():
+                with open(LEGACY_CACHE_FILE, 'r') as f:
+                    data = json.load(f)
+                codes, timestamp = data.get('codes'), data.get('timestamp', 0)
+            else:
+                return
+            if codes:
+                self._save_cache(codes, timestamp)
         except Exception as e:
-            print(f"Cache save failed: {e}")
+            self._log(f"Legacy cache import failed: {e}")
+    
+    def _save_cache(self, codes: Dict, timestamp: Optional[float] = None):
+        """
+        Write codes to a new snapshot file and atomically replace the cache.
+        """
+        try:
+            write_snapshot(CACHE_FILE, codes, time.time() if timestamp is None else timestamp,
+                           normalize_name, canonical_name)
+            self._log(f"Saved {len(codes)} policy codes to cache")
+        except (OSError, ValueError) as e:
+            self._log(f"Cache save failed: {e}")
+    
+    def _ensure_loaded(self):
+        """Read the snapshot on first lookup, fetching from EEA if there is no recent one"""
+        if not self._loaded:
+            self._loaded = True
+            self.snapshot = self._load_cache()
+        if self.snapshot is None and not self._fetch_attempted:
+            self.fetch_from_eea()
     
     def fetch_from_eea(self) -> Dict:
         """
         Fetch policy codes from EEA JSON API
         Using: https://www.eea.europa.eu/data-and-maps/daviz/sds/list-of-eunis-species-with-1/daviz.json
         """
-        print("\nFetching policy codes from EEA EUNIS database...")
+        self._log("\nFetching policy codes from EEA EUNIS database...")
         
         urls = [
             # All species with N2000 codes (3311 species)
-            "https://www.eea.europa.eu/data-and-maps/daviz/sds/list-of-eunis-species-with-1/daviz.json",
+            EEA_SPECIES_URL,
         ]
         
+        import requests
         codes = {}
         for url in urls:
             try:
-                response = requests.get(url, timeout=30)
+                response = controlled_request(requests, 'GET', url, timeout=30)
                 response.raise_for_status()
-                data = response.json()
+                data = profiling.parse_json(response, 'eea')
                 
                 # Parse the EEA JSON structure
                 items = data.get('items', [])
-                print(f"Retrieved {len(items)} species records from EEA")
+                self._log(f"Retrieved {len(items)} species records from EEA")
                 
                 for item in items:
                     n2000_code = item.get('o', '').strip()
@@ -135,72 +274,232 @@ class PolicyCodeCache:
                         }
                 
             except Exception as e:
-                print(f"Failed to fetch from {url}: {e}")
+                self._log(f"Failed to fetch from {url}: {e}")
         
+        self._fetch_attempted = True
         if codes:
-            self.cache['codes'] = codes
-            self._save_cache()
+            self._save_cache(codes)
+        
+        # Reopen the (new or, if the fetch failed, stale) cache file
+        self._loaded = True
+        if CACHE_FILE.exists():
+            self.snapshot = self._read_snapshot()
         
         return codes
     
+    def load(self):
+        """Make the policy codes available now instead of on the first lookup"""
+        self._ensure_loaded()
+    
     def get(self, code: str) -> Optional[Dict]:
         """Get policy code info, fetching if needed"""
-        code_upper = code.upper().strip()
-        
-        if not self.cache['codes']:
-            self.fetch_from_eea()
-        
-        return self.cache['codes'].get(code_upper)
+        self._ensure_loaded()
+        info = self.snapshot.get(code.upper().strip()) if self.snapshot else None
+        profiling.cache_lookup('policy_code', info is not None)
+        return info
     
     def get_by_name(self, scientific_name: str) -> Optional[Dict]:
-        """Get policy code info by scientific name"""
-        if not self.cache['codes']:
-            self.fetch_from_eea()
-        
-        # Search for matching scientific name (case-insensitive)
-        name_lower = scientific_name.lower().strip()
-        for code, info in self.cache['codes'].items():
-            if info['scientific_name'].lower() == name_lower:
-                return info
-        
-        return None
+        """Get policy code info by scientific name (case-insensitive, authorship ignored)"""
+        self._ensure_loaded()
+        info = self.snapshot and (self.snapshot.get_by_name_key(normalize_name(scientific_name))
+                                  or self.snapshot.get_by_canonical_key(canonical_name(scientific_name)))
+        profiling.cache_lookup('policy_code', info is not None)
+        return info
+    
+    def match_name(self, scientific_name: str, min_confidence: int = MIN_CONFIDENCE) -> Optional[tuple]:
+        """
+        Approximate name lookup for names get_by_name does not know, e.g.
+        'Pernis apivora' or 'Lutra lutra lutra'; returns (policy info, NameMatch)
+        """
+        self._ensure_loaded()
+        if not self.snapshot:
+            return None
+        if self._matcher is None or self._matcher[0] is not self.snapshot:
+            matcher = NameMatcher()
+            for info in self.snapshot.records():
+                matcher.add(info['scientific_name'], info)
+            self._matcher = (self.snapshot, matcher)
+        match = self._matcher[1].match(scientific_name, min_confidence)
+        profiling.count('name_match_total', source='policy_code', match_type=match.match_type if match else 'NONE')
+        return (match.payload, match) if match else None
     
     def refresh(self):
         """Force refresh from EEA"""
-        self.cache = {'codes': {}, 'timestamp': 0}
         self.fetch_from_eea()
 
 
+class IdentityCache:
+    """
+    Persistent cache of upstream responses used to build species identities.
+    
+    Entries are keyed on (source, normalized name or usage key) and expire
+    after the source's TTL, or after NEGATIVE_TTL when the source had no
+    match. Failed requests are never cached. The file is kept under a size
+    bound by evicting least recently used entries.
+    """
+    
+    # How each source signals "no match"
+    NEGATIVE = {
+        'gbif': lambda data: not data.get('usageKey'),
+        'checklistbank': lambda data: not data.get('id'),
+        'gnv': lambda data: not data.get('results'),
+    }
+    EVICT_EVERY = 100  # puts between size checks
+    
+    def __init__(self, path: Path = IDENTITY_CACHE_FILE, ttls: Optional[Dict[str, float]] = None,
+                 negative_ttl: float = NEGATIVE_TTL, max_bytes: int = IDENTITY_CACHE_MAX_BYTES):
+        self.ttls = {**SOURCE_TTLS, **(ttls or {})}
+        self.negative_ttl = negative_ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()  # shared by batch worker threads
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS responses (
+                source TEXT NOT NULL,
+                key TEXT NOT NULL,
+                body TEXT NOT NULL,
+                negative INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (source, key)
+            );
+            CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at);
+        """)
+    
+    def get(self, source: str, key: str) -> Optional[Dict]:
+        """Return a cached response if still valid, else None"""
+        now = time.time()
+        with self._lock:
+            row = self.db.execute(
+                "SELECT body, negative, fetched_at FROM responses WHERE source = ? AND key = ?",
+                (source, key)
+            ).fetchone()
+            ttl = self.negative_ttl if row and row[1] else self.ttls[source]
+            if row is None or now - row[2] >= ttl:
+                self.misses += 1
+                profiling.cache_lookup(f'identity_{source}', False)
+                return None
+            with self.db:
+                self.db.execute("UPDATE responses SET accessed_at = ? WHERE source = ? AND key = ?",
+                                (now, source, key))
+            self.hits += 1
+        profiling.cache_lookup(f'identity_{source}', True)
+        return json.loads(row[0])
+    
+    def put(self, source: str, key: str, data: Dict):
+        """Store a successful upstream response (including "no match")"""
+        body = json.dumps(data, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            with self.db:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (source, key, body, int(self.NEGATIVE[source](data)), len(body), now, now)
+                )
+            self._puts += 1
+            if self._puts % self.EVICT_EVERY == 0:
+                self._evict()
+    
+    def _evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        victims, freed = [], 0
+        for source, key, size in self.db.execute(
+                "SELECT source, key, size FROM responses ORDER BY accessed_at").fetchall():
+            victims.append((source, key))
+            freed += size
+            if freed >= excess:
+                break
+        with self.db:
+            self.db.executemany("DELETE FROM responses WHERE source = ? AND key = ?", victims)
+    
+    def close(self):
+        self.db.close()
+
+
 class SpeciesResolver:
     """Main resolver class for species identifiers"""
     
-    def __init__(self, policy_cache: PolicyCodeCache):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'SpeciesResolverCLI/2.0 (Educational/Research)'
-        })
+    def __init__(self, policy_cache: PolicyCodeCache, verbose: bool = True,
+                 identity_cache: Optional[IdentityCache] = None,
+                 checklist: Optional[NameMatcher] = None):
+        self._session = None
+        self._session_lock = threading.Lock()
         self.policy_cache = policy_cache
+        self.verbose = verbose
+        self.identity_cache = identity_cache
+        # Local checklist snapshot answering GBIF matches without a request
+        self.checklist = checklist
+        # Identical lookups in flight at the same time share one call and result
+        self._flight = SingleFlight('resolver')
+    
+    @property
+    def session(self):
+        """requests.Session, created (importing requests) on first use"""
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                self._session = requests.Session()
+                self._session.headers.update({
+                    'User-Agent': USER_AGENT
+                })
+        return self._session
+    
+    def _log(self, message: str):
+        """Print a progress message (suppressed when not verbose)"""
+        if self.verbose:
+            print(message)
+    
+    def _warn(self, message: str):
+        """Report an upstream failure; always shown, on stderr in batch mode"""
+        print(message, file=sys.stdout if self.verbose else sys.stderr)
+    
+    def _cache_get(self, source: str, key: str) -> Optional[Dict]:
+        return self.identity_cache.get(source, key) if self.identity_cache else None
+    
+    def _cache_put(self, source: str, key: str, data: Dict):
+        if self.identity_cache:
+            self.identity_cache.put(source, key, data)
+    
+    @staticmethod
+    def _as_query(identity: SpeciesIdentity, query: str) -> SpeciesIdentity:
+        """A shared result, labelled with the caller's own query string"""
+        return identity if identity.query == query else replace(identity, query=query)
     
     def resolve(self, query: str) -> SpeciesIdentity:
         """
-        Main resolution method that orchestrates all API calls
+        Main resolution method that orchestrates all API calls.
+        Concurrent calls for the same query (after upper/strip, as in
+        _resolve_policy_code) share one resolution.
         """
-        print(f"\nResolving: {query}")
-        print("=" * 60)
+        identity = self._flight.do(('resolve', query.upper().strip()), lambda: self._resolve(query))
+        return self._as_query(identity, query)
+    
+    def _resolve(self, query: str) -> SpeciesIdentity:
+        self._log(f"\nResolving: {query}")
+        self._log("=" * 60)
         
         # Step 1: Check if it's a policy code (query EEA dynamically)
         scientific_name, policy_info = self._resolve_policy_code(query)
         
         # Step 2: Query GBIF
-        print("\nQuerying GBIF Backbone Taxonomy...")
+        self._log("\nQuerying GBIF Backbone Taxonomy...")
         gbif_data = self._query_gbif(scientific_name)
         
         # Step 3: Query ChecklistBank
-        print("Querying ChecklistBank (Catalogue of Life)...")
+        self._log("Querying ChecklistBank (Catalogue of Life)...")
         clb_data = self._query_checklistbank(gbif_data.get('usageKey'))
         
         # Step 4: Query Global Names Verifier
-        print("Querying Global Names Verifier (100+ databases)...")
+        self._log("Querying Global Names Verifier (100+ databases)...")
         gnv_data = self._query_global_names(scientific_name)
         
         # Build complete identity
@@ -211,98 +510,235 @@ class SpeciesResolver:
         
         return identity
     
+    def resolve_many(self, queries: Iterable[str], batch_size: int = GNV_BATCH_SIZE,
+                     max_workers: int = MAX_WORKERS) -> Iterator[SpeciesIdentity]:
+        """
+        Resolve many queries, yielding each identity as soon as it completes.
+        
+        Queries are consumed in chunks of batch_size. Each chunk is verified with
+        a single Global Names Verifier POST, while GBIF match and ChecklistBank
+        lookups run on a bounded thread pool (one per unique name). The next
+        chunk is submitted before the current one is yielded, so the pool stays
+        busy while the caller consumes results; memory is bounded by two chunks.
+        Results are yielded in completion order.
+        """
+        from requests.adapters import HTTPAdapter
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=max_workers))
+        queries = iter(queries)
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = self._submit_chunk(executor, list(islice(queries, batch_size)))
+            following = None
+            try:
+                while pending is not None:
+                    following = self._submit_chunk(executor, list(islice(queries, batch_size)))
+                    yield from self._chunk_identities(*pending)
+                    pending, following = following, None
+            finally:
+                # A caller that stops early should not wait for lookups it will never see
+                for chunk in (pending, following):
+                    if chunk is not None:
+                        for future in [chunk[1], *chunk[2]]:
+                            future.cancel()
+    
+    def _submit_chunk(self, executor: ThreadPoolExecutor, chunk: List[str]) -> Optional[tuple]:
+        """Start the lookups for a chunk of queries: (by_name, GNV future, GBIF futures)"""
+        if not chunk:
+            return None
+        # Policy codes resolve locally; group queries by scientific name
+        by_name: Dict[str, List[tuple]] = {}
+        for query in chunk:
+            scientific_name, policy_info = self._resolve_policy_code(query)
+            by_name.setdefault(scientific_name, []).append((query, policy_info))
+        
+        gnv_future = executor.submit(self._query_global_names_batch, list(by_name))
+        gbif_futures = {
+            executor.submit(self._query_gbif_and_checklistbank, name): name
+            for name in by_name
+        }
+        return by_name, gnv_future, gbif_futures
+    
+    def _chunk_identities(self, by_name: Dict[str, List[tuple]], gnv_future,
+                          gbif_futures) -> Iterator[SpeciesIdentity]:
+        """Identities of a submitted chunk, as its GBIF lookups complete"""
+        gnv_results = gnv_future.result()
+        for future in as_completed(gbif_futures):
+            name = gbif_futures[future]
+            gbif_data, clb_data = future.result()
+            for query, policy_info in by_name[name]:
+                yield self._build_identity(
+                    query, name, policy_info,
+                    gbif_data, clb_data, gnv_results.get(name, {})
+                )
+    
+    def _query_gbif_and_checklistbank(self, scientific_name: str) -> tuple:
+        """GBIF match followed by the dependent ChecklistBank lookup"""
+        gbif_data = self._query_gbif(scientific_name)
+        return gbif_data, self._query_checklistbank(gbif_data.get('usageKey'))
+    
     def _resolve_policy_code(self, query: str) -> tuple:
         """Check if query is a policy code and resolve via EEA API"""
         upper_query = query.upper().strip()
         
         # Check if it looks like a policy code (e.g., A072, 1234)
         if upper_query.startswith('A') or upper_query.isdigit():
-            print(f"Checking if '{upper_query}' is an EEA/EUNIS policy code...")
+            self._log(f"Checking if '{upper_query}' is an EEA/EUNIS policy code...")
             policy_info = self.policy_cache.get(upper_query)
             
             if policy_info:
-                print(f"Recognized EEA policy code: {upper_query}")
-                print(f"  -> {policy_info['scientific_name']} {policy_info.get('authorship', '')}")
+                self._log(f"Recognized EEA policy code: {upper_query}")
+                self._log(f"  -> {policy_info['scientific_name']} {policy_info.get('authorship', '')}")
                 if policy_info.get('eunis_url'):
-                    print(f"  -> EUNIS: {policy_info['eunis_url']}")
+                    self._log(f"  -> EUNIS: {policy_info['eunis_url']}")
                 return policy_info['scientific_name'], policy_info
         
         # If not a policy code format, try searching by scientific name in EEA database
-        print(f"Checking if '{query}' exists in EEA/EUNIS policy database...")
+        self._log(f"Checking if '{query}' exists in EEA/EUNIS policy database...")
         policy_info = self.policy_cache.get_by_name(query)
         
         if policy_info:
-            print(f"Found in EEA database with policy code: {policy_info['natura2000']}")
-            print(f"  -> {policy_info['scientific_name']} {policy_info.get('authorship', '')}")
+            self._log(f"Found in EEA database with policy code: {policy_info['natura2000']}")
+            self._log(f"  -> {policy_info['scientific_name']} {policy_info.get('authorship', '')}")
             if policy_info.get('eunis_url'):
-                print(f"  -> EUNIS: {policy_info['eunis_url']}")
+                self._log(f"  -> EUNIS: {policy_info['eunis_url']}")
             return query, policy_info
         
+        # Misspellings and rank/hybrid variants of a listed name resolve to its
+        # spelling; subspecies of a listed species keep their own name
+        matched = self.policy_cache.match_name(query)
+        if matched:
+            policy_info, match = matched
+            self._log(f"Approximate match in EEA database: {policy_info['scientific_name']} "
+                      f"({match.match_type}, {match.confidence}% confidence), "
+                      f"policy code {policy_info['natura2000']}")
+            if match.match_type == 'HIGHERRANK':
+                return query, policy_info
+            return policy_info['scientific_name'], policy_info
+        
         return query, None
     
+    def _match_checklist(self, scientific_name: str) -> Optional[Dict]:
+        """GBIF-style match response from the local checklist, or None to ask GBIF"""
+        if self.checklist is None:
+            return None
+        match = self.checklist.match(scientific_name)
+        profiling.count('name_match_total', source='checklist', match_type=match.match_type if match else 'NONE')
+        if match is None:
+            return None
+        return {**match.payload, 'matchType': match.match_type, 'confidence': match.confidence}
+    
     def _query_gbif(self, scientific_name: str) -> Dict:
         """Query GBIF Species Match API"""
+        return self._flight.do(('gbif', normalize_name(scientific_name)),
+                               lambda: self._fetch_gbif(scientific_name))
+    
+    def _fetch_gbif(self, scientific_name: str) -> Dict:
+        local = self._match_checklist(scientific_name)
+        if local is not None:
+            return self._gbif_result(local)
+        key = normalize_name(scientific_name)
+        cached = self._cache_get('gbif', key)
+        if cached is not None:
+            return self._gbif_result(cached)
         try:
-            url = "https://api.gbif.org/v1/species/match"
             params = {
                 'name': scientific_name,
                 'verbose': 'true'
             }
-            response = self.session.get(url, params=params, timeout=10)
+            response = controlled_request(self.session, 'GET', GBIF_MATCH_URL, params=params, timeout=10)
             response.raise_for_status()
-            data = response.json()
-            
-            if data.get('usageKey'):
-                print(f"GBIF match: {data.get('scientificName')}")
-                print(f"  Match type: {data.get('matchType')} ({data.get('confidence')}% confidence)")
-                print(f"  Status: {data.get('status')}, Rank: {data.get('rank')}")
-                return data
-            else:
-                print("No GBIF match found")
-                return {}
+            data = profiling.parse_json(response, 'gbif')
+            self._cache_put('gbif', key, data)
+            return self._gbif_result(data)
         except Exception as e:
-            print(f"GBIF query failed: {e}")
-            return {}
+            self._warn(f"GBIF query failed: {e}")
+            return unavailable('gbif')
+    
+    def _gbif_result(self, data: Dict) -> Dict:
+        """Log and return a GBIF match response ({} if nothing matched)"""
+        if data.get('usageKey'):
+            self._log(f"GBIF match: {data.get('scientificName')}")
+            self._log(f"  Match type: {data.get('matchType')} ({data.get('confidence')}% confidence)")
+            self._log(f"  Status: {data.get('status')}, Rank: {data.get('rank')}")
+            return data
+        self._log("No GBIF match found")
+        return {}
     
     def _query_checklistbank(self, usage_key: Optional[int]) -> Dict:
         """Query ChecklistBank API"""
         if not usage_key:
             return {}
-        
+        return self._flight.do(('checklistbank', str(usage_key)),
+                               lambda: self._fetch_checklistbank(usage_key))
+    
+    def _fetch_checklistbank(self, usage_key: int) -> Dict:
+        cached = self._cache_get('checklistbank', str(usage_key))
+        if cached is not None:
+            return cached
         try:
-            url = f"https://api.checklistbank.org/dataset/3/nameusage/{usage_key}"
-            response = self.session.get(url, timeout=10)
+            url = CHECKLISTBANK_URL.format(usage_key=usage_key)
+            response = controlled_request(self.session, 'GET', url, timeout=10)
             response.raise_for_status()
-            data = response.json()
-            print(f"ChecklistBank ID: {data.get('id')}")
+            data = profiling.parse_json(response, 'checklistbank')
+            self._cache_put('checklistbank', str(usage_key), data)
+            self._log(f"ChecklistBank ID: {data.get('id')}")
             return data
         except Exception as e:
-            print(f"ChecklistBank query failed: {e}")
-            return {}
+            self._warn(f"ChecklistBank query failed: {e}")
+            return unavailable('checklistbank')
     
     def _query_global_names(self, scientific_name: str) -> Dict:
         """Query Global Names Verifier API"""
+        verified = self._flight.do(('gnv', normalize_name(scientific_name)),
+                                   lambda: self._query_global_names_batch([scientific_name]))
+        return self._global_names_result(next(iter(verified.values()), None))
+    
+    def _global_names_result(self, name_data: Optional[Dict]) -> Dict:
+        """Log and return the verification of one name ({} if nothing matched)"""
+        if name_data and name_data.get('unavailable'):
+            return name_data
+        if name_data:
+            results = name_data.get('results', [])
+            self._log(f"Global Names Verifier: {len(results)} source matches")
+            return name_data
+        self._log("No Global Names matches")
+        return {}
+    
+    @staticmethod
+    def _global_names_payload(names: List[str]) -> Dict:
+        return {
+            "nameStrings": names,
+            "preferredSources": GNV_PREFERRED_SOURCES
+        }
+    
+    def _query_global_names_batch(self, names: List[str]) -> Dict[str, Dict]:
+        """Verify a list of names in one Global Names Verifier POST, keyed by input name"""
+        results = {}
+        misses = []
+        for name in names:
+            cached = self._cache_get('gnv', normalize_name(name))
+            if cached is not None:
+                results[name] = cached
+            else:
+                misses.append(name)
+        if not misses:
+            return results
         try:
-            url = "https://verifier.globalnames.org/api/v1/verifications"
-            payload = {
-                "nameStrings": [scientific_name],
-                "preferredSources": [1, 11, 158, 163, 180, 207]  
-                # CoL, GBIF, EUNIS, IUCN, iNaturalist, Wikidata
-            }
-            response = self.session.post(url, json=payload, timeout=15)
+            payload = self._global_names_payload(misses)
+            # Allow more time for large batches
+            response = controlled_request(self.session, 'POST', GNV_URL, json=payload,
+                                          timeout=15 + len(misses) / 10)
             response.raise_for_status()
-            data = response.json()
-            
-            if data.get('names') and len(data['names']) > 0:
-                results = data['names'][0].get('results', [])
-                print(f"Global Names Verifier: {len(results)} source matches")
-                return data['names'][0]
-            else:
-                print("No Global Names matches")
-                return {}
+            data = profiling.parse_json(response, 'gnv')
+            # Verifier returns one entry per input name, in input order
+            for name, name_data in zip(misses, data.get('names') or []):
+                self._cache_put('gnv', normalize_name(name), name_data)
+                results[name] = name_data
         except Exception as e:
-            print(f"Global Names query failed: {e}")
-            return {}
+            self._warn(f"Global Names query failed: {e}")
+            for name in misses:
+                results.setdefault(name, unavailable('gnv'))
+        return results
     
     def _build_identity(self, query: str, scientific_name: str, 
                        policy_info: Optional[Dict], gbif_data: Dict,
@@ -340,15 +776,210 @@ class SpeciesResolver:
             family=gbif_data.get('family'),
             genus=gbif_data.get('genus'),
             checklistbank_id=clb_data.get('id'),
-            gnv_sources=gnv_sources if gnv_sources else None
+            gnv_sources=gnv_sources if gnv_sources else None,
+            unavailable_sources=[data['unavailable'] for data in (gbif_data, clb_data, gnv_data)
+                                 if data.get('unavailable')] or None
         )
 
 
+class AsyncSpeciesResolver(SpeciesResolver):
+    """
+    Asyncio resolver that runs independent upstream calls concurrently.
+    
+    GBIF match and Global Names verification start together; only the
+    ChecklistBank lookup waits for GBIF's usageKey. Each source has its own
+    timeout, so one slow upstream yields a partial identity rather than
+    delaying the whole result. Latency is roughly max(GBIF + CLB, GNV).
+    """
+    
+    def __init__(self, policy_cache: PolicyCodeCache, verbose: bool = True,
+                 identity_cache: Optional[IdentityCache] = None,
+                 timeouts: Optional[Dict[str, float]] = None,
+                 checklist: Optional[NameMatcher] = None):
+        super().__init__(policy_cache, verbose, identity_cache, checklist)
+        self.timeouts = {**SOURCE_TIMEOUTS, **(timeouts or {})}
+        self.client = None
+        self._async_flight = AsyncSingleFlight('resolver_async')
+    
+    def _get_client(self):
+        """Create the httpx client lazily, inside the running event loop"""
+        if self.client is None:
+            import httpx
+            self.client = httpx.AsyncClient(headers={'User-Agent': USER_AGENT},
+                                            timeout=httpx.Timeout(max(self.timeouts.values())))
+        return self.client
+    
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc):
+        await self.aclose()
+    
+    async def resolve(self, query: str) -> SpeciesIdentity:
+        """Resolve one query with GBIF->ChecklistBank and GNV running in parallel"""
+        identity = await self._async_flight.do(('resolve', query.upper().strip()),
+                                               lambda: self._resolve_async(query))
+        return self._as_query(identity, query)
+    
+    async def _resolve_async(self, query: str) -> SpeciesIdentity:
+        self._log(f"\nResolving: {query}")
+        self._log("=" * 60)
+        
+        scientific_name, policy_info = self._resolve_policy_code(query)
+        
+        self._log("\nQuerying GBIF, ChecklistBank and Global Names Verifier concurrently...")
+        (gbif_data, clb_data), gnv_data = await asyncio.gather(
+            self._query_gbif_and_checklistbank_async(scientific_name),
+            self._with_timeout('gnv', self._query_global_names_async(scientific_name)),
+        )
+        
+        return self._build_identity(
+            query, scientific_name, policy_info,
+            gbif_data, clb_data, gnv_data
+        )
+    
+    async def _with_timeout(self, source: str, coro) -> Dict:
+        """Await an upstream call, marking the source unavailable if it exceeds its timeout"""
+        try:
+            return await asyncio.wait_for(coro, self.timeouts[source])
+        except asyncio.TimeoutError:
+            self._log(f"{source} timed out after {self.timeouts[source]}s; continuing without it")
+            return unavailable(source)
+    
+    async def _query_gbif_and_checklistbank_async(self, scientific_name: str) -> tuple:
+        """GBIF match, then the dependent ChecklistBank lookup (the critical path)"""
+        gbif_data = await self._with_timeout('gbif', self._query_gbif_async(scientific_name))
+        clb_data = await self._with_timeout(
+            'checklistbank', self._query_checklistbank_async(gbif_data.get('usageKey'))
+        )
+        return gbif_data, clb_data
+    
+    async def _query_gbif_async(self, scientific_name: str) -> Dict:
+        return await self._async_flight.do(('gbif', normalize_name(scientific_name)),
+                                           lambda: self._fetch_gbif_async(scientific_name))
+    
+    async def _fetch_gbif_async(self, scientific_name: str) -> Dict:
+        local = self._match_checklist(scientific_name)
+        if local is not None:
+            return self._gbif_result(local)
+        key = normalize_name(scientific_name)
+        cached = self._cache_get('gbif', key)
+        if cached is not None:
+            return self._gbif_result(cached)
+        try:
+            response = await controlled_request_async(
+                self._get_client(), 'GET', GBIF_MATCH_URL,
+                params={'name': scientific_name, 'verbose': 'true'},
+                timeout=self.timeouts['gbif']
+            )
+            response.raise_for_status()
+            data = profiling.parse_json(response, 'gbif')
+            self._cache_put('gbif', key, data)
+            return self._gbif_result(data)
+        except Exception as e:
+            self._warn(f"GBIF query failed: {e}")
+            return unavailable('gbif')
+    
+    async def _query_checklistbank_async(self, usage_key: Optional[int]) -> Dict:
+        if not usage_key:
+            return {}
+        return await self._async_flight.do(('checklistbank', str(usage_key)),
+                                           lambda: self._fetch_checklistbank_async(usage_key))
+    
+    async def _fetch_checklistbank_async(self, usage_key: int) -> Dict:
+        cached = self._cache_get('checklistbank', str(usage_key))
+        if cached is not None:
+            return cached
+        try:
+            response = await controlled_request_async(
+                self._get_client(), 'GET', CHECKLISTBANK_URL.format(usage_key=usage_key),
+                timeout=self.timeouts['checklistbank']
+            )
+            response.raise_for_status()
+            data = profiling.parse_json(response, 'checklistbank')
+            self._cache_put('checklistbank', str(usage_key), data)
+            self._log(f"ChecklistBank ID: {data.get('id')}")
+            return data
+        except Exception as e:
+            self._warn(f"ChecklistBank query failed: {e}")
+            return unavailable('checklistbank')
+    
+    async def _query_global_names_async(self, scientific_name: str) -> Dict:
+        return await self._async_flight.do(('gnv', normalize_name(scientific_name)),
+                                           lambda: self._fetch_global_names_async(scientific_name))
+    
+    async def _fetch_global_names_async(self, scientific_name: str) -> Dict:
+        key = normalize_name(scientific_name)
+        cached = self._cache_get('gnv', key)
+        if cached is not None:
+            return self._global_names_result(cached)
+        try:
+            response = await controlled_request_async(
+                self._get_client(), 'POST', GNV_URL,
+                json=self._global_names_payload([scientific_name]),
+                timeout=self.timeouts['gnv']
+            )
+            response.raise_for_status()
+            names = profiling.parse_json(response, 'gnv').get('names') or []
+            if names:
+                self._cache_put('gnv', key, names[0])
+            return self._global_names_result(names[0] if names else None)
+        except Exception as e:
+            self._warn(f"Global Names query failed: {e}")
+            return unavailable('gnv')
+
+
+async def resolve_async(cache: PolicyCodeCache, query: str,
+                        identity_cache: Optional[IdentityCache] = None,
+                        checklist: Optional[NameMatcher] = None) -> SpeciesIdentity:
+    """Resolve a single query with the async resolver"""
+    async with AsyncSpeciesResolver(cache, identity_cache=identity_cache, checklist=checklist) as resolver:
+        return await resolver.resolve(query)
+
+
+def read_queries(stream) -> Iterator[str]:
+    """Yield one query per non-empty line, skipping '#' comments"""
+    for line in stream:
+        query = line.strip()
+        if query and not query.startswith('#'):
+            yield query
+
+
+def write_ndjson(identity: SpeciesIdentity, stream=sys.stdout):
+    """Write a species identity as a single JSON line"""
+    with profiling.span('serialize', 'output'):
+        stream.write(json.dumps(asdict(identity), default=str, ensure_ascii=False) + '\n')
+    stream.flush()
+
+
+def run_batch(resolver: SpeciesResolver, path: str, batch_size: int, max_workers: int):
+    """Resolve every query in a file (or stdin for '-') and stream NDJSON to stdout"""
+    stream = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8')
+    count = 0
+    start = time.time()
+    try:
+        for identity in resolver.resolve_many(read_queries(stream), batch_size, max_workers):
+            write_ndjson(identity)
+            count += 1
+            if count % batch_size == 0:
+                print(f"Resolved {count} queries ({time.time() - start:.1f}s)", file=sys.stderr)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    print(f"Resolved {count} queries in {time.time() - start:.1f}s", file=sys.stderr)
+
+
 def print_identity(identity: SpeciesIdentity, format_type: str = 'pretty'):
     """Print species identity in various formats"""
     
     if format_type == 'json':
-        print(json.dumps(asdict(identity), indent=2, default=str))
+        with profiling.span('serialize', 'output'):
+            print(json.dumps(asdict(identity), indent=2, default=str))
         return
     
     # Pretty print
@@ -422,28 +1053,68 @@ Examples:
   python species_resolver.py "Pernis apivorus"
   python species_resolver.py "Falco apivorus" --format json
   python species_resolver.py "1234" --refresh-cache
+  python species_resolver.py "Pernis apivora" --checklist Taxon.tsv
+  python species_resolver.py --batch checklist.txt > identities.ndjson
+  cat checklist.txt | python species_resolver.py --batch - --workers 16
         """
     )
     
-    parser.add_argument('query', help='Species name or policy code (e.g., A072 or "Pernis apivorus")')
+    parser.add_argument('query', nargs='?',
+                       help='Species name or policy code (e.g., A072 or "Pernis apivorus")')
     parser.add_argument('--format', choices=['pretty', 'json'], default='pretty',
                        help='Output format (default: pretty)')
     parser.add_argument('--refresh-cache', action='store_true',
                        help='Force refresh policy codes from EEA')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Bypass the cache of GBIF/ChecklistBank/GNV responses')
+    parser.add_argument('--checklist', metavar='FILE',
+                       help='Local Darwin Core Taxon table (e.g. GBIF backbone Taxon.tsv) matched '
+                            'before calling GBIF')
+    parser.add_argument('--batch', metavar='FILE',
+                       help="Resolve one query per line from FILE ('-' for stdin), writing NDJSON")
+    parser.add_argument('--batch-size', type=int, default=GNV_BATCH_SIZE,
+                       help=f'Names per Global Names Verifier request (default: {GNV_BATCH_SIZE})')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS,
+                       help=f'Concurrent GBIF/ChecklistBank lookups (default: {MAX_WORKERS})')
+    parser.add_argument('--profile', metavar='PREFIX',
+                       help='Write PREFIX.json, PREFIX.trace.json (Chrome trace) and PREFIX.prom metrics')
     
     args = parser.parse_args()
+    if not args.query and not args.batch:
+        parser.error('a query or --batch FILE is required')
+    if args.profile:
+        profiling.enable()
     
+    identity_cache = None
     try:
-        # Initialize policy code cache
-        cache = PolicyCodeCache()
+        # Initialize policy code cache (status goes to stderr in batch mode)
+        verbose = not args.batch
+        cache = PolicyCodeCache(verbose=verbose)
         
         if args.refresh_cache:
-            print("Forcing cache refresh...")
+            cache._log("Forcing cache refresh...")
             cache.refresh()
         
         # Resolve species
-        resolver = SpeciesResolver(cache)
-        identity = resolver.resolve(args.query)
+        identity_cache = None if args.no_cache else IdentityCache()
+        checklist = None
+        if args.checklist:
+            with profiling.span('load_checklist', 'app'):
+                checklist = load_checklist(args.checklist)
+            cache._log(f"Loaded {len(checklist)} names from {args.checklist}")
+        if args.batch:
+            resolver = SpeciesResolver(cache, verbose=verbose, identity_cache=identity_cache, checklist=checklist)
+            run_batch(resolver, args.batch, args.batch_size, args.workers)
+            return
+        
+        with profiling.span('resolve', 'app'):
+            if importlib.util.find_spec('httpx') is not None:
+                identity = asyncio.run(resolve_async(cache, args.query, identity_cache, checklist))
+            else:
+                # httpx not installed: fall back to the sequential resolver
+                resolver = SpeciesResolver(cache, verbose=verbose, identity_cache=identity_cache,
+                                           checklist=checklist)
+                identity = resolver.resolve(args.query)
         print_identity(identity, args.format)
         
     except KeyboardInterrupt:
@@ -454,6 +1125,12 @@ Examples:
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        if identity_cache is not None:
+            identity_cache.close()
+        if args.profile:
+            profiling.write_profile(args.profile, {'hosts': controller_stats()})
+            print(f"Profile written to {args.profile}.{{json,trace.json,prom}}", file=sys.stderr)
 
 
 if __name__ == '__main__':
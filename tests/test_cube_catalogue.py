@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+ds = pytest.importorskip("pyarrow.dataset")
+
+from cube_catalogue import _schema, catalogue_row, cube_filter  # noqa: E402
+
+def cube(cube_id, start, end, site="AT1101112", layers=("gbif_occurrences", "chelsa_month"), version="v1"):
+    return {"cube_id": cube_id, "n2k_site_code": site, "cube_version": version,
+            "start_year": start, "end_year": end, "layers": list(layers),
+            "layer_metadata": {"gbif_occurrences": {"resolution": "1km"}}}
+
+CUBES = [
+    cube("to-2015", "2010", "2015"),
+    cube("to-2015-05", "2010-01", "2015-05"),
+    cube("from-2016", "2016", "2020"),
+    cube("from-2015-07", "2015-07", "2018"),
+    cube("other-site", "2000", "2030", site="DE1234567", layers=("chelsa_month",)),
+]
+
+@pytest.fixture(scope="module")
+def dataset():
+    return ds.dataset(pa.Table.from_pylist([catalogue_row(c) for c in CUBES], schema=_schema()))
+
+def matching(dataset, **filters):
+    table = dataset.to_table(columns=["cube_id"], filter=cube_filter(**filters))
+    return sorted(table.column("cube_id").to_pylist())
+
+def test_period_overlap_uses_the_end_of_stored_periods(dataset):
+    # A cube ending in '2015' covers all of 2015, including June
+    assert matching(dataset, period=("2015-06", "2015-06")) == ["other-site", "to-2015"]
+    assert matching(dataset, period=("2015", "2015")) == ["from-2015-07", "other-site", "to-2015", "to-2015-05"]
+    assert matching(dataset, period=("2015-12", "2016-01")) == ["from-2015-07", "from-2016", "other-site",
+                                                               "to-2015"]
+    assert matching(dataset, period=("2031", "2040")) == []
+
+def test_site_layer_and_version_filters(dataset):
+    assert cube_filter() is None
+    assert matching(dataset, site_code="DE1234567") == ["other-site"]
+    assert matching(dataset, layer="gbif_occurrences", period=("2017", "2017")) == ["from-2015-07", "from-2016"]
+    assert matching(dataset, layer="gbif") == []
+    assert matching(dataset, cube_version="v2") == []
+
+def test_catalogue_row_validation():
+    row = catalogue_row(cube("c", "2010", "2015-06"))
+    assert row["layers"] == "gbif_occurrences,chelsa_month"
+    assert row["layer_metadata"] == '{"gbif_occurrences": {"resolution": "1km"}}'
+    assert row["entry_hash"] != catalogue_row(cube("c", "2010", "2015-07"))["entry_hash"]
+    with pytest.raises(ValueError, match="end_year must be YYYY or YYYY-MM"):
+        catalogue_row(cube("c", "2010", "2015-6"))
+    with pytest.raises(ValueError, match="lacks cube_version"):
+        catalogue_row({"cube_id": "c", "n2k_site_code": "AT1101112"})
+    with pytest.raises(ValueError, match="Unknown cube columns"):
+        catalogue_row({**cube("c", "2010", "2015"), "colour": "red"})
+
+@pytest.fixture
+def catalogue(tmp_path):
+    pytest.importorskip("deltalake")
+    from cube_catalogue import CubeCatalogue
+    return CubeCatalogue(tmp_path / "catalogue")
+
+def test_upsert_rewrites_only_changed_cubes(catalogue):
+    assert catalogue.version() is None
+    assert catalogue.upsert(CUBES) == len(CUBES)
+    assert catalogue.upsert(CUBES) == 0
+    assert catalogue.upsert([cube("to-2015", "2010", "2016")]) == 1
+    assert [c["end_year"] for c in catalogue.query(site_code="AT1101112") if c["cube_id"] == "to-2015"] == ["2016"]
+    assert sorted(c["cube_id"] for c in catalogue.query(columns=["cube_id"])) == sorted(c["cube_id"] for c in CUBES)
+
+def test_remove_and_compact_keep_the_remaining_rows(catalogue):
+    catalogue.upsert(CUBES[:2])
+    catalogue.upsert(CUBES[2:])
+    assert catalogue.remove(["other-site", "missing"]) == 1
+    assert catalogue.remove([]) == 0
+    catalogue.compact()
+    assert sorted(c["cube_id"] for c in catalogue.query(columns=["cube_id"])) == sorted(
+        c["cube_id"] for c in CUBES[:4])
+
+def test_crate_sync_regenerates_only_changed_fragments(catalogue, tmp_path):
+    from cube_catalogue import CRATE_FILE, CrateWriter, _fragment_name
+    crate = CrateWriter(catalogue, tmp_path / "crate")
+    catalogue.upsert(CUBES)
+    assert crate.sync() == {"changed": len(CUBES), "removed": 0, "cubes": len(CUBES)}
+    assert crate.sync() == {"changed": 0, "removed": 0, "cubes": len(CUBES)}
+
+    def inodes():
+        return {path.name: path.stat().st_ino for path in crate.fragments.glob("*.json")}
+
+    before = inodes()
+    catalogue.upsert([cube("from-2016", "2016", "2021")])
+    assert crate.sync() == {"changed": 1, "removed": 0, "cubes": len(CUBES)}
+    after = inodes()
+    rewritten = {name for name in before if after[name] != before[name]}
+    assert rewritten == {_fragment_name("from-2016")}
+
+    catalogue.remove(["to-2015"])
+    assert crate.sync() == {"changed": 0, "removed": 1, "cubes": len(CUBES) - 1}
+    assert _fragment_name("to-2015") not in inodes()
+
+    graph = json.loads((tmp_path / "crate" / CRATE_FILE).read_text(encoding="utf-8"))["@graph"]
+    entities = {entity["@id"]: entity for entity in graph}
+    assert sorted(part["@id"] for part in entities["./"]["hasPart"]) == sorted(
+        c["cube_id"] for c in CUBES if c["cube_id"] != "to-2015")
+    assert entities["from-2016"]["temporalCoverage"] == "2016/2021"
+    assert "to-2015" not in entities and "site:DE1234567" in entities
@@ -0,0 +1,151 @@
+import json
+
+import numpy as np
+import pytest
+
+import cube_storage
+from cube_storage import (CubeStore, LazyArray, parse_wkt, points_in_polygon, subset, subset_gbif, write_array,
+                          write_datatree)
+from eea_grid import encode_cellcodes, lonlat_to_laea
+
+def open_array(directory):
+    meta = json.loads((directory / ".zarray").read_text())
+    attrs = json.loads((directory / ".zattrs").read_text())
+    return LazyArray(directory, meta, attrs)
+
+@pytest.fixture
+def stored(tmp_path):
+    source = np.arange(7 * 5 * 3, dtype=np.float64).reshape(7, 5, 3)
+    write_array(tmp_path, "t2m", source, ("time", "lat", "lon"), {"time": 2, "lat": 2, "lon": 2},
+                {"units": "K"})
+    return source, open_array(tmp_path / "t2m")
+
+def test_slices_read_only_the_overlapping_chunks(stored):
+    source, array = stored
+    assert array.dims == ("time", "lat", "lon") and array.attrs == {"units": "K"}
+    np.testing.assert_array_equal(array[1:4, 2:5, 1], source[1:4, 2:5, 1])
+    assert array.chunk_reads == 2 * 2 * 1
+    np.testing.assert_array_equal(array[-1], source[-1])
+    np.testing.assert_array_equal(array.values, source)
+    with pytest.raises(IndexError):
+        array[7]
+    with pytest.raises(IndexError):
+        array[::2]
+
+@pytest.mark.parametrize("dtype, expected", [("float32", np.nan), ("int16", 0), ("bool", False)])
+def test_missing_chunks_are_filled(tmp_path, dtype, expected):
+    write_array(tmp_path, "v", np.ones((4, 4), dtype=dtype), ("y", "x"), {"y": 2, "x": 2})
+    (tmp_path / "v" / "1.1").unlink()
+    array = open_array(tmp_path / "v")
+    block = array[2:, 2:]
+    if dtype == "float32":
+        assert np.isnan(block).all()
+    else:
+        assert (block == expected).all()
+    assert (array[:2, :2] == 1).all()
+
+def test_missing_chunks_without_fill_value(tmp_path):
+    write_array(tmp_path, "v", np.ones((2, 2), dtype=np.float64), ("y", "x"), {"y": 1, "x": 2})
+    meta_path = tmp_path / "v" / ".zarray"
+    meta = json.loads(meta_path.read_text())
+    meta["fill_value"] = None
+    meta_path.write_text(json.dumps(meta))
+    (tmp_path / "v" / "1.0").unlink()
+    assert np.isnan(open_array(tmp_path / "v")[1]).all()
+
+TIMES = np.arange("2020-01", "2022-01", dtype="datetime64[M]")
+LAT = np.round(45.05 + 0.1 * np.arange(10), 2)
+LONG = np.round(10.05 + 0.1 * np.arange(10), 2)
+SITE = "POLYGON ((10.2 45.2, 10.5 45.2, 10.5 45.5, 10.2 45.5, 10.2 45.2))"
+# Occurrence cells: two inside SITE, one outside
+CELL_CODES = encode_cellcodes(*lonlat_to_laea([10.3, 10.45, 10.8], [45.3, 45.42, 45.8]), "1km")
+
+@pytest.fixture
+def cube(tmp_path):
+    rng = np.random.default_rng(3)
+    tas = rng.normal(280, 5, (len(TIMES), len(LAT), len(LONG)))
+    bio1 = rng.normal(10, 1, (len(LAT), len(LONG))).astype(np.float32)
+    n = 40
+    coords = np.stack([rng.integers(0, 2, n), rng.integers(0, 3, n), rng.integers(0, len(TIMES), n)])
+    data = rng.integers(1, 5, n)
+    tree = {
+        "static/chelsa_clim_ref_period": {"coords": {"lat": LAT, "long": LONG},
+                                          "data_vars": {"bio1": (["lat", "long"], bio1)},
+                                          "attrs": {"source": "CHELSA"}},
+        "dynamic/chelsa_month": {"coords": {"time": TIMES, "lat": LAT, "long": LONG},
+                                 "data_vars": {"tas": (["time", "lat", "long"], tas)}},
+        "dynamic/gbif_occurences": {"coords": {"specieskey": np.array([11, 12]), "eeacellcode": CELL_CODES,
+                                               "time": TIMES},
+                                    "data_vars": {"coords": (["ndim", "nnz"], coords), "data": (["nnz"], data),
+                                                  "shape": (["ndim"], np.array([2, 3, len(TIMES)])),
+                                                  "dims": (["ndim"], np.array(["specieskey", "eeacellcode",
+                                                                               "time"]))}},
+    }
+    path = write_datatree(tmp_path / "AT1101112.zarr", tree, chunks={"time": 12, "lat": 4, "long": 4, "nnz": 8},
+                          attrs={"site": "AT1101112"})
+    return path, {"tas": tas, "bio1": bio1, "coords": coords, "data": data}
+
+def test_write_datatree_round_trip(cube):
+    path, source = cube
+    assert (path / ".zmetadata").exists()
+    store = CubeStore(path)
+    assert store.attrs == {"site": "AT1101112"}
+    assert store.groups() == ["dynamic/chelsa_month", "dynamic/gbif_occurences", "static/chelsa_clim_ref_period"]
+    static = store.group("static/chelsa_clim_ref_period")
+    assert static.attrs == {"source": "CHELSA"}
+    np.testing.assert_array_equal(static.coords["lat"], LAT)
+    np.testing.assert_array_equal(static["bio1"].values, source["bio1"])
+    monthly = store.group("dynamic/chelsa_month")
+    np.testing.assert_array_equal(monthly.coords["time"], TIMES)
+    assert monthly["tas"].dims == ("time", "lat", "long")
+    np.testing.assert_array_equal(monthly["tas"].values, source["tas"])
+    with pytest.raises(KeyError):
+        store.group("dynamic/missing")
+
+def test_subset_reads_only_the_chunks_it_intersects(cube):
+    path, source = cube
+    group = CubeStore(path).group("dynamic/chelsa_month")
+    cut = subset(group, SITE, ("2021-01", "2021-06"))
+    # lat/long centres 0.25-0.45 (indices 2-4) span two 4-cell tiles each; 2021-01..06 is one time chunk
+    assert group.chunk_reads == 1 * 2 * 2
+    assert group["tas"].chunk_reads == 4
+    np.testing.assert_array_equal(cut["coords"]["time"], TIMES[12:18])
+    np.testing.assert_array_equal(cut["coords"]["lat"], LAT[2:5])
+    np.testing.assert_array_equal(cut["coords"]["long"], LONG[2:5])
+    dims, tas = cut["variables"]["tas"]
+    assert dims == ("time", "lat", "long")
+    np.testing.assert_array_equal(tas, source["tas"][12:18, 2:5, 2:5])
+    assert cut["mask"].shape == (3, 3) and cut["mask"].all()
+
+    whole = subset(CubeStore(path).group("dynamic/chelsa_month"))
+    np.testing.assert_array_equal(whole["variables"]["tas"][1], source["tas"])
+    assert whole["mask"] is None
+
+def test_subset_gbif_filters_by_time_and_cell(cube):
+    path, source = cube
+    group = CubeStore(path).group("dynamic/gbif_occurences")
+    cut = subset_gbif(group, SITE, ("2021-01", "2021-06"))
+    coords, data = source["coords"], source["data"]
+    keep = (coords[2] >= 12) & (coords[2] < 18) & (coords[1] < 2)
+    expected = sorted(zip(*coords[:, keep].tolist(), data[keep].tolist()))
+    assert sorted(zip(*cut["coords"].tolist(), cut["data"].tolist())) == expected
+    assert cut["dims"] == ["specieskey", "eeacellcode", "time"]
+    assert cut["shape"].tolist() == [2, 3, len(TIMES)]
+
+    offsets = group["time_offsets"].values
+    start, stop = int(offsets[12]), int(offsets[18])
+    assert group["coords"].chunk_reads == -(-stop // 8) - start // 8 < -(-len(data) // 8)
+
+    everything = subset_gbif(CubeStore(path).group("dynamic/gbif_occurences"))
+    assert int(everything["data"].sum()) == int(data.sum())
+
+def test_points_in_polygon_with_holes_and_multipolygons(monkeypatch):
+    monkeypatch.setattr(cube_storage, "POINT_BLOCK", 8)   # several blocks per ring
+    holed = parse_wkt("POLYGON ((0 0, 4 0, 4 4, 0 4, 0 0), (1 1, 3 1, 3 3, 1 3, 1 1))")
+    lon = np.array([[0.5, 2.0, 5.0], [3.5, 1.5, -1.0]])
+    lat = np.array([[0.5, 2.0, 5.0], [3.5, 0.5, 2.0]])
+    assert points_in_polygon(lon, lat, holed).tolist() == [[True, False, False], [True, True, False]]
+    multi = parse_wkt("MULTIPOLYGON (((0 0, 1 0, 1 1, 0 1, 0 0)), ((2 2, 3 2, 3 3, 2 3, 2 2)))")
+    assert points_in_polygon([0.5, 2.5, 1.5], [0.5, 2.5, 1.5], multi).tolist() == [True, True, False]
+    with pytest.raises(ValueError):
+        parse_wkt("POINT (1 2)")
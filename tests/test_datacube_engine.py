@@ -0,0 +1,139 @@
+import asyncio
+import json
+
+import pytest
+
+import datacube_engine
+import natura_2000_query as natura
+from datacube_engine import CubeStore, DataCubeEngine, EngineBusy, validate_request
+from http_service import HTTPError, Router
+
+SITE = "AT1101112"
+REQUEST = {"variables": ["ndvi", "lst"], "temporalRange": {"start": "2020-01-01", "end": "2020-12-31"}}
+
+def cube_request(**extra):
+    return dict(REQUEST, **extra)
+
+def engine(tmp_path, seconds=0.2, **kwargs):
+    return DataCubeEngine(CubeStore(tmp_path / "cubes"), "stub", {"seconds": seconds}, workers=1, **kwargs)
+
+async def wait_for(job, status="succeeded", timeout=30.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while job.status != status:
+        assert loop.time() < deadline, f"job still {job.status}"
+        await asyncio.sleep(0.01)
+
+def test_identical_requests_share_a_job_and_its_callbacks(tmp_path):
+    finished = []
+
+    async def on_complete(job):
+        finished.append(job)
+
+    async def main():
+        async with engine(tmp_path, on_complete=on_complete) as cubes:
+            job, built = cubes.submit(SITE, cube_request(callbackUrl="https://a.example.org/done"))
+            same, same_built = cubes.submit(SITE, {"variables": ["lst", "ndvi", "lst"],
+                                                   "temporalRange": REQUEST["temporalRange"],
+                                                   "callbackUrl": "https://b.example.org/done"})
+            other, _ = cubes.submit("AT1101113", cube_request())
+            assert same is job and not built and not same_built
+            assert other is not job
+            assert job.callbacks == ["https://a.example.org/done", "https://b.example.org/done"]
+            await wait_for(job)
+            await wait_for(other)
+            assert cubes.submit(SITE, cube_request()) == (job, True)
+            return job
+
+    job = asyncio.run(main())
+    assert job in finished
+
+def test_prebuilt_cube_is_answered_without_queueing(tmp_path):
+    async def build():
+        async with engine(tmp_path) as cubes:
+            job, _ = cubes.submit(SITE, cube_request())
+            await wait_for(job)
+            return cubes.result(job)
+
+    item = asyncio.run(build())
+
+    async def restart():
+        async with engine(tmp_path) as cubes:
+            job, built = cubes.submit(SITE, cube_request())
+            router = Router()
+            natura.add_datacube_routes(router, cubes)
+            handler, params = router.resolve("POST", f"/sites/{SITE}/datacubes")
+            response = await handler(params, {}, cube_request())
+            return job, built, cubes.result(job), response, cubes.stats()
+
+    job, built, result, response, stats = asyncio.run(restart())
+    assert built and job.status == "succeeded" and job.progress == 1.0
+    assert result == item
+    assert response.status == 200 and response.body["jobId"] == job.job_id
+    assert stats["queued"] == 0 and stats["jobs"] == {"succeeded": 1}
+
+def test_full_queue_rejects_new_requests(tmp_path):
+    async def main():
+        async with engine(tmp_path, queue_depth=1) as cubes:
+            first, _ = cubes.submit(SITE, cube_request())
+            with pytest.raises(EngineBusy):
+                cubes.submit("AT1101113", cube_request())
+            assert cubes.submit(SITE, cube_request())[0] is first
+            router = Router()
+            natura.add_datacube_routes(router, cubes)
+            handler, params = router.resolve("POST", "/sites/AT1101114/datacubes")
+            with pytest.raises(HTTPError) as error:
+                await handler(params, {}, cube_request())
+            assert error.value.status == 503 and "Retry-After" in error.value.headers
+            await wait_for(first)
+
+    asyncio.run(main())
+
+def test_result_is_409_until_the_job_succeeds_and_progress_is_reported(tmp_path):
+    async def main():
+        async with engine(tmp_path, seconds=1.0) as cubes:
+            router = Router()
+            natura.add_datacube_routes(router, cubes)
+            job, _ = cubes.submit(SITE, cube_request())
+            handler, params = router.resolve("GET", f"/datacubes/{job.job_id}/result")
+            with pytest.raises(HTTPError) as error:
+                await handler(params, {})
+            assert error.value.status == 409
+
+            status, status_params = router.resolve("GET", f"/datacubes/{job.job_id}")
+            seen = []
+            while job.status != "succeeded":
+                seen.append((await status(status_params, {}))["progress"])
+                await asyncio.sleep(0.02)
+            assert seen == sorted(seen)
+            assert any(0.0 < p < 1.0 for p in seen)
+            assert (await status(status_params, {}))["progress"] == 1.0
+            return await handler(params, {})
+
+    item = asyncio.run(main())
+    assert item["properties"]["bmd:variables"] == ["lst", "ndvi"]
+
+def test_submit_before_start_is_a_clear_error(tmp_path):
+    with pytest.raises(RuntimeError, match="before start"):
+        engine(tmp_path).submit(SITE, cube_request())
+
+@pytest.mark.parametrize("url", ["ftp://example.org/done", "/relative", "http://localhost:8000/x",
+                                 "http://127.0.0.1/x", "http://10.0.0.5/x", "http://[::1]/x",
+                                 "http://169.254.169.254/latest/meta-data"])
+def test_callback_url_must_be_a_public_http_url(url):
+    with pytest.raises(ValueError, match="callbackUrl"):
+        validate_request(cube_request(callbackUrl=url))
+
+def test_public_callback_url_is_accepted():
+    assert validate_request(cube_request(callbackUrl="https://example.org/done"))["callbackUrl"] == \
+        "https://example.org/done"
+
+def test_cube_store_put_leaves_no_temporary_file(tmp_path):
+    store = CubeStore(tmp_path)
+    with pytest.raises(TypeError):
+        store.put("key", {"bad": object()})
+    assert list(store.path("key").iterdir()) == []
+    store.put("key", {"id": "cube"})
+    assert [p.name for p in store.path("key").iterdir()] == ["item.json"]
+    assert json.loads((store.path("key") / "item.json").read_text()) == {"id": "cube"}
+    assert datacube_engine.CubeStore(tmp_path).get("key") == {"id": "cube"}
@@ -0,0 +1,112 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from eea_grid import (aggregate_dataset, aggregate_occurrences, cell_centres, cell_totals, coarsen_cellcodes,
+                      decode_cellcodes, encode_cellcodes, grid_index, laea_to_lonlat, lonlat_to_laea)
+
+def test_decode_cellcodes_at_each_resolution():
+    easting, northing, size = decode_cellcodes(["1kmE4012N3101", "100mE40120N31015", "10kmE401N310"])
+    assert easting.tolist() == [4012000, 4012000, 4010000]
+    assert northing.tolist() == [3101000, 3101500, 3100000]
+    assert size.tolist() == [1000, 100, 10000]
+
+def test_decode_accepts_bytes_and_keeps_shape():
+    easting, _, _ = decode_cellcodes(np.array([[b"1kmE1N2", b"1kmE3N4"]]))
+    assert easting.shape == (1, 2)
+    assert easting.tolist() == [[1000, 3000]]
+
+@pytest.mark.parametrize("code", ["1kmE4012", "1kmX4012N3101", "5kmE4N3", "1kmE40a2N3101", "kmE4N3"])
+def test_decode_rejects_malformed_codes(code):
+    with pytest.raises(ValueError, match="Invalid EEA cell code"):
+        decode_cellcodes(["1kmE4012N3101", code])
+
+def test_encode_decode_round_trip():
+    rng = np.random.default_rng(7)
+    easting = rng.integers(2_000_000, 7_000_000, 1000)
+    northing = rng.integers(1_000_000, 5_500_000, 1000)
+    for resolution, metres in (("100m", 100), ("1km", 1000), ("10km", 10000)):
+        codes = encode_cellcodes(easting, northing, resolution)
+        decoded_e, decoded_n, size = decode_cellcodes(codes)
+        assert (size == metres).all()
+        assert (decoded_e == easting // metres * metres).all()
+        assert (decoded_n == northing // metres * metres).all()
+
+def test_encode_rejects_unknown_resolution():
+    with pytest.raises(ValueError, match="Unsupported grid resolution"):
+        encode_cellcodes([0], [0], "5km")
+
+def test_coarsen_cellcodes():
+    assert coarsen_cellcodes(["100mE40129N31015"], "1km").tolist() == ["1kmE4012N3101"]
+    assert coarsen_cellcodes(["1kmE4019N3109"], 10000).tolist() == ["10kmE401N310"]
+    with pytest.raises(ValueError, match="finer resolution"):
+        coarsen_cellcodes(["1kmE4012N3101"], "100m")
+
+def test_projection_origin_and_round_trip():
+    easting, northing = lonlat_to_laea(np.array([10.0]), np.array([52.0]))
+    assert easting[0] == pytest.approx(4321000.0)
+    assert northing[0] == pytest.approx(3210000.0)
+    lon, lat = np.array([-9.1, 16.37, 28.0]), np.array([38.7, 48.21, 65.0])
+    back_lon, back_lat = laea_to_lonlat(*lonlat_to_laea(lon, lat))
+    np.testing.assert_allclose(back_lon, lon, atol=1e-9)
+    np.testing.assert_allclose(back_lat, lat, atol=1e-9)
+
+def test_cell_centres_fall_inside_their_cells():
+    lon, lat = cell_centres(["1kmE4321N3210"])
+    easting, northing = lonlat_to_laea(lon, lat)
+    assert easting[0] == pytest.approx(4321500.0)
+    assert northing[0] == pytest.approx(3210500.0)
+
+# A 3 x 4 lat/long grid with 0.1 degree cells, and 1 km EEA cells around chosen points
+LAT = np.array([45.0, 45.1, 45.2])
+LONG = np.array([10.0, 10.1, 10.2, 10.3])
+POINTS = [(10.0, 45.0), (10.33, 45.23), (10.2, 45.1), (11.0, 46.0), (10.02, 45.01)]
+CELLS = encode_cellcodes(*lonlat_to_laea(*zip(*POINTS)), "1km")
+CELL_GRID = [(0, 0), (2, 3), (1, 2), (-1, -1), (0, 0)]   # cell 1 is an edge cell, cell 3 off the grid
+DIMS = ["specieskey", "eeacellcode", "time"]
+SHAPE = [2, len(CELLS), 3]
+# (species, cell, time) -> count
+ENTRIES = {(0, 0, 0): 2, (1, 0, 2): 3, (0, 1, 1): 5, (0, 2, 0): 7, (1, 3, 1): 11, (1, 4, 0): 13}
+COORDS = np.array(list(ENTRIES)).T
+DATA = np.array(list(ENTRIES.values()))
+
+def test_grid_index_places_cells_by_centre():
+    rows, columns = grid_index(CELLS, LAT, LONG)
+    assert list(zip(rows.tolist(), columns.tolist())) == CELL_GRID
+    rows, columns = grid_index(CELLS, LAT[::-1], LONG)   # descending latitudes, as in CHELSA
+    assert rows.tolist() == [2, 0, 1, -1, 2]
+    assert columns.tolist() == [c for _, c in CELL_GRID]
+
+def test_aggregate_occurrences_by_hand():
+    totals = aggregate_occurrences(COORDS, DATA, SHAPE, DIMS, CELLS, LAT, LONG)
+    expected = np.zeros((3, 4))
+    expected[0, 0] = 2 + 3 + 13
+    expected[2, 3] = 5
+    expected[1, 2] = 7
+    np.testing.assert_array_equal(totals, expected)
+    # Everything but the off-grid cell is conserved
+    assert totals.sum() == DATA.sum() - 11
+    per_cell = cell_totals(COORDS, DATA, DIMS, len(CELLS))
+    assert per_cell.tolist() == [5, 5, 7, 11, 13]
+    assert totals.sum() == per_cell.sum() - per_cell[3]
+
+def test_aggregate_occurrences_keeps_dimensions():
+    by_time = aggregate_occurrences(COORDS, DATA, SHAPE, DIMS, CELLS, LAT, LONG, keep=["time"])
+    assert by_time.shape == (3, 3, 4)
+    assert by_time[0, 0, 0] == 2 + 13 and by_time[0, 1, 2] == 7
+    assert by_time[1, 2, 3] == 5 and by_time[2, 0, 0] == 3
+    assert by_time.sum() == DATA.sum() - 11
+    by_species_time = aggregate_occurrences(COORDS, DATA, SHAPE, DIMS, CELLS, LAT, LONG,
+                                            keep=["specieskey", "time"])
+    assert by_species_time.shape == (2, 3, 3, 4)
+    np.testing.assert_array_equal(by_species_time.sum(axis=0), by_time)
+    assert by_species_time[1, 0, 0, 0] == 13 and by_species_time[1, 2, 0, 0] == 3
+
+def test_aggregate_dataset_reads_datatree_nodes():
+    def node(**arrays):
+        return {name: SimpleNamespace(values=np.asarray(values)) for name, values in arrays.items()}
+    gbif = node(coords=COORDS, data=DATA, shape=SHAPE, dims=DIMS, eeacellcode=CELLS)
+    grid = node(lat=LAT, long=LONG)
+    np.testing.assert_array_equal(aggregate_dataset(gbif, grid, keep=["time"]),
+                                  aggregate_occurrences(COORDS, DATA, SHAPE, DIMS, CELLS, LAT, LONG, ["time"]))
@@ -0,0 +1,75 @@
+import pytest
+
+import eea_response_cache
+from eea_response_cache import ResponseCache, cache_key
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(eea_response_cache.time, "time", clock)
+    return clock
+
+def test_keys_ignore_whitespace():
+    assert cache_key("SELECT *\n  FROM t") == cache_key(" SELECT * FROM t ")
+    assert cache_key("SELECT * FROM t") != cache_key("SELECT * FROM u")
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    cache = ResponseCache(tmp_path / "cache.sqlite", ttl=100)
+    cache.put("SELECT 1", [{"a": 1}], etag='"v1"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+    entry = cache.get("SELECT  1")
+    assert entry.data == [{"a": 1}] and entry.fresh
+    clock.now += 100
+    entry = cache.get("SELECT 1")
+    assert entry is not None and not entry.fresh     # stale entries are kept for revalidation
+    assert entry.validators() == {"If-None-Match": '"v1"', "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    cache.touch("SELECT 1")
+    assert cache.get("SELECT 1").fresh
+    cache.close()
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    body = ["x" * 40]                                  # 46 bytes of JSON per entry
+    cache = ResponseCache(tmp_path / "cache.sqlite", ttl=100, max_bytes=100)
+    cache.EVICT_EVERY = 1
+    cache.put("SELECT a", body)
+    cache.put("SELECT b", body)
+    assert cache.get("SELECT a") is not None            # a is now more recent than b
+    cache.put("SELECT c", body)
+    assert cache.get("SELECT b") is None
+    assert cache.get("SELECT a") is not None and cache.get("SELECT c") is not None
+    cache.close()
+
+def test_size_is_checked_every_evict_every_puts(tmp_path, clock, monkeypatch):
+    cache = ResponseCache(tmp_path / "cache.sqlite", ttl=100, max_bytes=100)
+    cache.EVICT_EVERY = 3
+    checks = []
+    evict = cache._evict
+    monkeypatch.setattr(cache, "_evict", lambda: (checks.append(cache._puts), evict()))
+    for name in "abcdefg":
+        cache.put(f"SELECT {name}", ["x" * 40])
+    assert checks == [3, 6]
+    # Each check trims to the bound; the puts since the last one are kept
+    assert [cache.get(f"SELECT {name}") is not None for name in "abcdefg"] == [False] * 4 + [True] * 3
+    cache.close()
+
+def test_memory_layer_is_bounded_and_survives_reopen(tmp_path, clock):
+    path = tmp_path / "cache.sqlite"
+    cache = ResponseCache(path, ttl=100, memory_items=2)
+    for name in "abc":
+        cache.put(f"SELECT {name}", name)
+    assert list(cache._memory) == [cache_key("SELECT b"), cache_key("SELECT c")]
+    assert cache.get("SELECT a").data == "a"            # from SQLite, now in memory again
+    assert list(cache._memory) == [cache_key("SELECT c"), cache_key("SELECT a")]
+    cache.close()
+    reopened = ResponseCache(path, ttl=100)
+    assert [reopened.get(f"SELECT {name}").data for name in "abc"] == ["a", "b", "c"]
+    reopened.clear()
+    assert reopened.get("SELECT a") is None
+    reopened.close()
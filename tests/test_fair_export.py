@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+import pytest
+
+import natura_2000_query as natura
+from fair_export import SiteExporter, record_site, shard_of
+
+SHARDS = 4
+
+def site(code, species="Lanius collurio"):
+    return {
+        "info": [{"site_code": code, "site_name": f"Site {code}", "country_code": code[:2]}],
+        "habitats": [{"habitat_code": "6510", "habitat_name": "Lowland hay meadows", "cover_ha": 12.5}],
+        "species": [{"species_code": "A338", "species_name": species, "population_type": "r"}],
+    }
+
+class FakeNatura:
+    """Stands in for natura_2000_query: sites held in memory, requests recorded."""
+
+    validate_site_code = staticmethod(natura.validate_site_code)
+
+    def __init__(self, sites):
+        self.sites = sites
+        self.fingerprint = "f1"
+        self.fetched = []
+        self.failing = set()      # codes whose species query fails
+        self.broken = set()       # codes whose fetch raises
+
+    async def get_sites_bundle(self, codes):
+        if self.broken & set(codes):
+            raise RuntimeError("connection reset")
+        self.fetched.extend(codes)
+        bundles = []
+        for code in codes:
+            parts = self.sites.get(code, {"info": [], "habitats": [], "species": []})
+            if code in self.failing:
+                parts = {**parts, "species": None}
+            bundles.append({"@id": f"https://biodiversity.europa.eu/sites/natura2000/{code}", **parts})
+        return bundles
+
+    async def source_fingerprint(self, table):
+        return f"{table}:{self.fingerprint}"
+
+    async def get_all_site_codes(self):
+        return sorted(self.sites)
+
+CODES = ["AT1101112", "AT1201000", "DE1234567", "DE2345678", "FR9301234", "NL2003001", "BE3100001", "SE0110001"]
+
+@pytest.fixture
+def upstream():
+    return FakeNatura({code: site(code) for code in CODES})
+
+def export(upstream, directory, codes=None, force=False):
+    exporter = SiteExporter(upstream, directory, shards=SHARDS, batch_size=3, concurrency=1, processes=0)
+    return asyncio.run(exporter.export(codes, force))
+
+def exported(directory):
+    """Exported documents by site code, read back from every shard."""
+    documents = {}
+    for path in sorted(directory.glob("sites-*.ndjson")):
+        for line in path.read_text(encoding="utf-8").splitlines():
+            code = record_site(line, "jsonld")
+            assert code not in documents and shard_of(code, SHARDS) == int(path.stem.split("-")[1])
+            documents[code] = json.loads(line)
+    return documents
+
+def test_full_export_then_unchanged(upstream, tmp_path):
+    stats = export(upstream, tmp_path)
+    assert (stats["status"], stats["written"], stats["sites"]) == ("completed", len(CODES), len(CODES))
+    documents = exported(tmp_path)
+    assert sorted(documents) == sorted(CODES)
+    assert documents["AT1101112"]["dct:title"] == "Site AT1101112"
+    # Same source fingerprints: nothing is fetched
+    upstream.fetched.clear()
+    assert export(upstream, tmp_path)["status"] == "unchanged"
+    assert upstream.fetched == []
+
+def test_only_changed_sites_are_rewritten(upstream, tmp_path):
+    export(upstream, tmp_path)
+    upstream.fingerprint = "f2"
+    upstream.sites["DE1234567"] = site("DE1234567", species="Lanius minor")
+    stats = export(upstream, tmp_path)
+    assert (stats["written"], stats["unchanged"], stats["shards_rewritten"]) == (1, len(CODES) - 1, 1)
+    organism = exported(tmp_path)["DE1234567"]["schema:about"]["natura:hostsSpecies"][0]
+    assert organism["dwc:taxon"]["dwc:scientificName"] == "Lanius minor"
+
+def test_removed_sites_are_dropped(upstream, tmp_path):
+    export(upstream, tmp_path)
+    del upstream.sites["FR9301234"]
+    upstream.fingerprint = "f2"
+    stats = export(upstream, tmp_path)
+    assert stats["removed"] == 1
+    assert "FR9301234" not in exported(tmp_path)
+    # An explicit list naming a site that is gone from Site_Information removes it too
+    stats = export(upstream, tmp_path, ["NL2003001"])
+    assert stats["unchanged"] == 1
+    del upstream.sites["NL2003001"]
+    stats = export(upstream, tmp_path, ["NL2003001"])
+    assert stats["removed"] == 1
+    assert sorted(exported(tmp_path)) == sorted(set(CODES) - {"FR9301234", "NL2003001"})
+
+def test_failed_sites_keep_their_previous_record(upstream, tmp_path):
+    export(upstream, tmp_path)
+    upstream.fingerprint = "f2"
+    upstream.sites["AT1101112"] = site("AT1101112", species="Lanius minor")
+    upstream.failing.add("AT1101112")
+    stats = export(upstream, tmp_path)
+    assert (stats["status"], stats["failed"]) == ("partial", 1)
+    organism = exported(tmp_path)["AT1101112"]["schema:about"]["natura:hostsSpecies"][0]
+    assert organism["dwc:taxon"]["dwc:scientificName"] == "Lanius collurio"
+    manifest = json.loads((tmp_path / "export.json").read_text())
+    assert manifest["complete"] is False
+    # The next run retries it even though the fingerprints are unchanged
+    upstream.failing.clear()
+    assert export(upstream, tmp_path)["written"] == 1
+
+def test_interrupted_export_resumes_after_finished_shards(upstream, tmp_path):
+    by_shard = {}
+    for code in CODES:
+        by_shard.setdefault(shard_of(code, SHARDS), []).append(code)
+    last = max(by_shard)
+    upstream.broken = set(by_shard[last])
+    with pytest.raises(RuntimeError, match="connection reset"):
+        export(upstream, tmp_path)
+    manifest = json.loads((tmp_path / "export.json").read_text())
+    assert manifest["complete"] is False and last not in manifest["done"]
+
+    upstream.broken.clear()
+    upstream.fetched.clear()
+    stats = export(upstream, tmp_path)
+    assert stats["status"] == "completed"
+    assert stats["resumed"] == len(CODES) - len(by_shard[last])
+    assert sorted(upstream.fetched) == sorted(by_shard[last])
+    assert sorted(exported(tmp_path)) == sorted(CODES)
+
+def test_changed_layout_needs_force(upstream, tmp_path):
+    export(upstream, tmp_path)
+    exporter = SiteExporter(upstream, tmp_path, shards=SHARDS * 2, processes=0)
+    with pytest.raises(ValueError, match="--force"):
+        asyncio.run(exporter.export())
+    stats = asyncio.run(exporter.export(force=True))
+    assert stats["written"] == len(CODES)
+    assert len(list(tmp_path.glob("sites-*.ndjson"))) <= SHARDS * 2
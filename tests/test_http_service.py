@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from http_service import Router, _handle_connection
+
+def router():
+    routes = Router()
+
+    async def echo(params, query, body):
+        return {"body": body}
+    routes.add("/echo", echo, "POST")
+    return routes
+
+async def exchange(raw: bytes, close_write: bool = False) -> bytes:
+    server = await asyncio.start_server(lambda r, w: _handle_connection(router(), r, w), "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(raw)
+        if close_write:
+            writer.write_eof()
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        return response
+    finally:
+        server.close()
+        await server.wait_closed()
+
+def post(length: str, body: bytes = b"") -> bytes:
+    return (f"POST /echo HTTP/1.1\r\nHost: x\r\nConnection: close\r\nContent-Length: {length}\r\n\r\n"
+            .encode("latin-1") + body)
+
+def test_post_body_is_read():
+    response = asyncio.run(exchange(post("9", b'{"a": 1}\n')))
+    assert response.startswith(b"HTTP/1.1 200") and response.endswith(b'{"body": {"a": 1}}')
+
+@pytest.mark.parametrize("length", ["abc", "-5", "1.5"])
+def test_invalid_content_length_is_400(length):
+    response = asyncio.run(exchange(post(length)))
+    assert response.startswith(b"HTTP/1.1 400") and b"Invalid Content-Length" in response
+
+def test_body_cut_short_closes_the_connection():
+    assert asyncio.run(exchange(post("100", b'{"a"'), close_write=True)) == b""
@@ -0,0 +1,78 @@
+import pytest
+
+from name_matcher import (EXACT_CONFIDENCE, FUZZY_PENALTY, HIGHERRANK_CONFIDENCE, MIN_CONFIDENCE,
+                          NameMatcher, canonical_form, levenshtein)
+
+@pytest.fixture
+def matcher():
+    matcher = NameMatcher()
+    for code, name in (("A072", "Pernis apivorus (Linnaeus, 1758)"), ("A338", "Lanius collurio Linnaeus, 1758"),
+                       ("A339", "Lanius minor Gmelin, 1788"), ("1166", "Triturus cristatus (Laurenti, 1768)"),
+                       ("1193", "Bombina variegata (Linnaeus, 1758)"), ("X001", "Apus apus"),
+                       ("X002", "Crex crex")):
+        matcher.add(name, {"natura2000": code})
+    return matcher
+
+@pytest.mark.parametrize("name, expected", [
+    ("Pernis apivorus (Linnaeus, 1758)", "pernis apivorus"),
+    ("Mentha × piperita L.", "mentha piperita"),
+    ("Anacamptis pyramidalis var. tanayensis (Chenevard) Soó", "anacamptis pyramidalis tanayensis"),
+    ("Carabus (Procerus) olympiae Sella, 1855", "carabus olympiae"),
+    ("Aster amellus de Candolle", "aster amellus"),
+    ("PERNIS APIVORUS", "pernis apivorus"),
+])
+def test_canonical_form(name, expected):
+    assert canonical_form(name) == expected
+
+def test_levenshtein_is_bounded():
+    assert levenshtein("pernis apivorus", "pernis apivorus", 2) == 0
+    assert levenshtein("pernis apivorus", "pernis apivoros", 2) == 1
+    assert levenshtein("kitten", "sitting", 3) == 3
+    assert levenshtein("kitten", "sitting", 2) == 3   # max_distance + 1
+
+def test_exact_match(matcher):
+    match = matcher.match("Pernis apivorus")
+    assert (match.match_type, match.confidence, match.payload) == ("EXACT", EXACT_CONFIDENCE, {"natura2000": "A072"})
+
+def test_fuzzy_confidence_drops_per_edit(matcher):
+    one = matcher.match("Pernis apivoros")
+    assert (one.match_type, one.distance, one.confidence) == ("FUZZY", 1, EXACT_CONFIDENCE - FUZZY_PENALTY)
+    two = matcher.match("Pernis apyvoras")
+    assert (two.distance, two.confidence) == (2, EXACT_CONFIDENCE - 2 * FUZZY_PENALTY)
+    assert two.confidence >= MIN_CONFIDENCE
+
+def test_min_confidence_threshold(matcher):
+    assert matcher.match("Pernis apyvoras", min_confidence=EXACT_CONFIDENCE - FUZZY_PENALTY) is None
+    assert matcher.match("Pernis apivoros", min_confidence=EXACT_CONFIDENCE - FUZZY_PENALTY) is not None
+    assert matcher.match("Pernis apivoros", min_confidence=EXACT_CONFIDENCE) is None
+    # Exact matches pass any threshold
+    assert matcher.match("Pernis apivorus", min_confidence=EXACT_CONFIDENCE).match_type == "EXACT"
+
+def test_edit_budget_depends_on_length(matcher):
+    # Three edits exceed the budget of a 15-character name
+    assert matcher.match("Pernys apyvoras") is None
+    # Names shorter than MIN_FUZZY_LENGTH only match exactly
+    assert matcher.match("Crex crex").match_type == "EXACT"
+    assert matcher.match("Crex cres") is not None    # 9 characters: one edit allowed
+    assert matcher.match("Apus") is None
+
+def test_higher_rank_match(matcher):
+    match = matcher.match("Triturus cristatus carnifex")
+    assert (match.match_type, match.confidence, match.payload["natura2000"]) == (
+        "HIGHERRANK", HIGHERRANK_CONFIDENCE, "1166")
+    assert matcher.match("Triturus cristatus carnifex", min_confidence=HIGHERRANK_CONFIDENCE + 1) is None
+
+def test_equally_close_names_do_not_match():
+    matcher = NameMatcher()
+    matcher.add("Lanius collurio")
+    matcher.add("Lanius collurie")
+    assert matcher.match("Lanius collurix") is None
+    # One accepted name among equal candidates wins
+    matcher = NameMatcher()
+    matcher.add("Lanius collurio", {"status": "ACCEPTED"})
+    matcher.add("Lanius collurie", {"status": "SYNONYM"})
+    assert matcher.match("Lanius collurix").name == "Lanius collurio"
+
+def test_unknown_names(matcher):
+    assert matcher.match("Ursus arctos") is None
+    assert matcher.match("") is None
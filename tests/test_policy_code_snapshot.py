@@ -0,0 +1,50 @@
+import pytest
+
+from name_matcher import canonical_form
+from policy_code_snapshot import PolicyCodeSnapshot, write_snapshot
+
+CODES = {
+    "A072": {"scientific_name": "Pernis apivorus", "authorship": "(Linnaeus, 1758)",
+             "eunis_url": "http://eunis.eea.europa.eu/species/1383"},
+    "A338": {"scientific_name": "Lanius collurio", "authorship": "Linnaeus, 1758"},
+    "1083": {"scientific_name": "Lucanus cervus", "authorship": None},
+    "A001": {"scientific_name": "Gavia stellata", "eunis_url": ""},
+}
+
+@pytest.fixture
+def snapshot(tmp_path):
+    path = tmp_path / "codes.bin"
+    write_snapshot(path, CODES, 1700000000.0, lambda name: " ".join(name.lower().split()), canonical_form)
+    return PolicyCodeSnapshot.load(path)
+
+def test_lookup_by_code(snapshot):
+    assert len(snapshot) == 4
+    assert snapshot.timestamp == 1700000000.0
+    assert snapshot.get("A072") == {"natura2000": "A072", "scientific_name": "Pernis apivorus",
+                                    "authorship": "(Linnaeus, 1758)",
+                                    "eunis_url": "http://eunis.eea.europa.eu/species/1383"}
+    # Empty and missing fields read back as None
+    assert snapshot.get("1083")["authorship"] is None
+    assert snapshot.get("A001")["eunis_url"] is None
+
+@pytest.mark.parametrize("code", ["A000", "A0721", "0000", "Z999", ""])
+def test_unknown_codes(snapshot, code):
+    assert snapshot.get(code) is None
+
+def test_lookup_by_name_and_canonical_keys(snapshot):
+    assert snapshot.get_by_name_key("lanius collurio")["natura2000"] == "A338"
+    assert snapshot.get_by_name_key("lanius") is None
+    assert snapshot.get_by_canonical_key("pernis apivorus")["natura2000"] == "A072"
+
+def test_records_are_in_code_order(snapshot):
+    assert [record["natura2000"] for record in snapshot.records()] == ["1083", "A001", "A072", "A338"]
+
+def test_rejects_truncated_or_foreign_files(tmp_path, snapshot):
+    path = tmp_path / "codes.bin"
+    data = path.read_bytes()
+    with pytest.raises(ValueError, match="truncated"):
+        PolicyCodeSnapshot(data[:-1])
+    with pytest.raises(ValueError, match="truncated"):
+        PolicyCodeSnapshot(data[:10])
+    with pytest.raises(ValueError, match="Not a policy code snapshot"):
+        PolicyCodeSnapshot(b"XXXXXXXX" + data[8:])
@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import pytest
+
+import natura_2000_query as natura
+import query_executor
+from eea_response_cache import ResponseCache
+from query_executor import QueryExecutor, site_taxon_rows
+from spatial_index import SpatialIndex
+
+SITE = "AT1101112"
+DOCUMENT = {"queryId": "q1", "filter": {"taxon": {"code2000": "A338"}, "site": {"codeSite": SITE}}}
+
+class Upstream:
+    """Stands in for natura_2000_query and the species resolver, counting calls."""
+
+    validate_site_code = staticmethod(natura.validate_site_code)
+
+    def __init__(self):
+        self.calls = {"site": 0, "taxon": 0}
+        self.site_failed = False
+        self.unavailable = None
+
+    async def get_site_bundle(self, site_code):
+        self.calls["site"] += 1
+        species = None if self.site_failed else [{"species_code": "A338", "species_name": "Lanius collurio"},
+                                                 {"species_code": "A072", "species_name": "Pernis apivorus"}]
+        return {"@id": site_code, "info": [{"site_code": site_code}], "habitats": [], "species": species}
+
+    async def resolve(self, query):
+        self.calls["taxon"] += 1
+        return {"query": query, "scientific_name": "Lanius collurio", "policy_code": "A338",
+                "unavailable_sources": self.unavailable}
+
+@pytest.fixture
+def upstream():
+    return Upstream()
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(tmp_path / "nodes.sqlite", query_executor.NODE_CACHE_TTL)
+    yield cache
+    cache.close()
+
+def execute(upstream, cache, document=DOCUMENT):
+    return asyncio.run(QueryExecutor(upstream, upstream, None, cache).execute(document))
+
+def statuses(response):
+    return {name: entry["status"] for name, entry in response["execution"]["nodes"].items()}
+
+def test_dependent_nodes_and_cache_reuse(upstream, cache):
+    response = execute(upstream, cache)
+    assert response["status"] == "completed"
+    assert response["siteTaxon"] == [{"species_code": "A338", "species_name": "Lanius collurio"}]
+    assert set(response["execution"]["criticalPath"]) <= {"site_taxon", "site", "taxon"}
+    response = execute(upstream, cache)
+    assert statuses(response) == {"taxon": "cached", "site": "cached", "site_taxon": "ok"}
+    assert upstream.calls == {"site": 1, "taxon": 1}
+
+def test_failed_site_queries_are_not_cached(upstream, cache):
+    upstream.site_failed = True
+    response = execute(upstream, cache)
+    assert response["status"] == "partial" and response["site"] is None
+    assert "EEA query failed for the species" in response["execution"]["nodes"]["site"]["error"]
+    upstream.site_failed = False
+    response = execute(upstream, cache)
+    assert statuses(response)["site"] == "ok" and upstream.calls["site"] == 2
+
+def test_incomplete_identities_are_not_cached(upstream, cache):
+    upstream.unavailable = ["gbif"]
+    assert execute(upstream, cache)["taxon"]["unavailable_sources"] == ["gbif"]
+    upstream.unavailable = None
+    assert statuses(execute(upstream, cache))["taxon"] == "ok"
+    assert statuses(execute(upstream, cache))["taxon"] == "cached"
+    assert upstream.calls["taxon"] == 2
+
+def test_site_taxon_rows_match_on_code_or_name():
+    site = {"species": [{"species_code": "A338", "species_name": "Lanius collurio"},
+                        {"species_code": "", "species_name": "Pernis apivorus"}]}
+    assert len(site_taxon_rows(site, {"policy_code": "A338"})) == 1
+    assert site_taxon_rows(site, {"scientific_name": "Pernis Apivorus"})[0]["species_name"] == "Pernis apivorus"
+    assert site_taxon_rows(None, {"policy_code": "A338"}) is None
+
+def test_plan_rejects_documents_without_a_filter(upstream):
+    with pytest.raises(ValueError, match="no filter"):
+        QueryExecutor(upstream).plan({})
+    with pytest.raises(ValueError, match="code2000 or scientificName"):
+        QueryExecutor(upstream).plan({"filter": {"taxon": {"vernacularName": "shrike"}}})
+
+def test_query_command_with_node_cache(tmp_path):
+    with SpatialIndex(tmp_path / "index") as index:
+        index.add_site(SITE, [16.0, 48.0, 16.5, 48.5], name="Wienerwald")
+        index.checkpoint()
+    path = tmp_path / "query.json"
+    path.write_text(json.dumps({"queryId": "q2", "filter": {"spatial": {"geometry": [16.2, 48.2, 17.0, 49.0]}}}))
+    options = {"index": str(tmp_path / "index"), "node-cache": str(tmp_path / "nodes.sqlite")}
+    response = asyncio.run(natura.run_query(str(path), options))
+    assert response["status"] == "completed"
+    assert [site["id"] for site in response["area"]["sites"]] == [SITE]
+    assert (tmp_path / "nodes.sqlite").exists()
@@ -0,0 +1,50 @@
+import csv
+
+import pytest
+
+from record_sinks import CSVSink, open_sink
+
+RECORDS = [{"site": "AT1101112", "count": 1}, {"site": "AT1101113", "count": 2, "remark": "late"}]
+
+def test_csv_header_collects_keys_of_the_first_records(tmp_path):
+    path = tmp_path / "out.csv"
+    with open_sink(str(path)) as sink:
+        for record in RECORDS:
+            sink.write(record)
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert rows == [{"site": "AT1101112", "count": "1", "remark": ""},
+                    {"site": "AT1101113", "count": "2", "remark": "late"}]
+
+def test_csv_rejects_a_key_after_the_header_was_written(tmp_path):
+    sink = CSVSink(str(tmp_path / "out.csv"), header_rows=1)
+    sink.write(RECORDS[0])
+    with pytest.raises(ValueError, match="'remark'"):
+        sink.write(RECORDS[1])
+    sink.close()
+
+def test_parquet_promotes_null_columns_and_rejects_new_ones(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "out.parquet"
+    with open_sink(str(path)) as sink:
+        sink.row_group_size = 2
+        sink.write({"site": "A", "count": 1, "remark": None})
+        sink.write({"site": "B", "remark": None})
+        sink.write({"site": "C", "count": 3, "remark": 7})
+        sink.write({"site": "D", "count": 4, "remark": "late"})
+    table = pq.read_table(path)
+    assert table.num_rows == 4
+    assert str(table.schema.field("remark").type) == "string"
+    assert table.column("count").to_pylist() == [1, None, 3, 4]
+    assert table.column("remark").to_pylist() == [None, None, "7", "late"]
+
+    sink = open_sink(str(tmp_path / "bad.parquet"))
+    sink.row_group_size = 1
+    sink.write({"site": "A", "count": 1})
+    with pytest.raises(ValueError, match="'extra'"):
+        sink.write({"site": "B", "extra": True})
+    sink = open_sink(str(tmp_path / "mixed.parquet"))
+    sink.row_group_size = 1
+    sink.write({"site": "A", "count": 1})
+    with pytest.raises(ValueError, match="do not fit"):
+        sink.write({"site": "B", "count": "many"})
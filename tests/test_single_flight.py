@@ -0,0 +1,101 @@
+import asyncio
+import threading
+
+import pytest
+
+from bmd_common.single_flight import AsyncSingleFlight, SingleFlight
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight("test")
+    calls, release = [], threading.Event()
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", fetch))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while flight.shared < 3:
+        threading.Event().wait(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ["result"] * 4 and len(calls) == 1
+    # Nothing is kept once the call completed
+    assert flight.do("key", lambda: "again") == "again"
+
+def test_errors_reach_every_caller():
+    flight = SingleFlight("test")
+
+    def fail():
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError, match="upstream down"):
+        flight.do("key", fail)
+    assert flight._calls == {}
+
+def test_async_calls_share_one_task():
+    flight = AsyncSingleFlight("test")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", fetch) for _ in range(5)))
+
+    assert asyncio.run(main()) == [1] * 5
+    assert flight.shared == 4 and flight._flights == {}
+
+def test_cancelled_waiter_does_not_cancel_the_others():
+    flight = AsyncSingleFlight("test")
+    finished = []
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        finished.append(1)
+        return "result"
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("key", fetch))
+        second = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == "result"
+    assert finished == [1] and flight._flights == {}
+
+def test_abandoned_call_is_cancelled_and_releases_the_key():
+    flight = AsyncSingleFlight("test")
+    cancelled = []
+
+    async def hang():
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def quick():
+        return "fresh"
+
+    async def main():
+        waiters = asyncio.gather(flight.do("key", hang), flight.do("key", hang))
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(waiters, 0.01)
+        assert flight._flights == {}
+        # The next caller starts a new call instead of joining the hung one
+        result = await flight.do("key", quick)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(main()) == "fresh"
+    assert cancelled == [1]
@@ -0,0 +1,90 @@
+import math
+
+import pytest
+
+from spatial_index import SpatialIndex, geometries_intersect, geometry_parts, time_bound
+
+def square(x, y, size=0.9):
+    return {"type": "Polygon", "coordinates": [[[x, y], [x + size, y], [x + size, y + size],
+                                                [x, y + size], [x, y]]]}
+
+def grid_index(directory=None, **kwargs):
+    index = SpatialIndex(directory, **kwargs)
+    for x in range(10):
+        for y in range(10):
+            index._add("site", f"S{x}{y}", square(x, y), "2010" if x < 5 else "2020", "2019" if x < 5 else None)
+    index.checkpoint()
+    return index
+
+def ids(matches):
+    return sorted(match["id"] for match in matches)
+
+def test_query_matches_brute_force():
+    index = grid_index(node_size=4)
+    assert len(index._levels) > 1
+    triangle = {"type": "Polygon", "coordinates": [[[0.5, 0.5], [7.2, 0.5], [0.5, 7.2], [0.5, 0.5]]]}
+    expected = sorted(f"S{x}{y}" for x in range(10) for y in range(10)
+                      if geometries_intersect(geometry_parts(triangle), geometry_parts(square(x, y))))
+    assert ids(index.intersects(triangle)) == expected
+    # The bbox-only candidates include squares the triangle misses
+    assert set(ids(index.intersects(triangle, exact=False))) > set(expected)
+
+def test_query_document_with_time_filter():
+    index = grid_index(node_size=4)
+    document = {"filter": {"spatial": {"geometry": square(3.5, 2.5, 2.0)},
+                           "temporal": {"from": "2021-01", "to": "2022"}}}
+    # Only the open-ended x >= 5 sites overlap 2021-2022
+    assert ids(index.query(document)["sites"]) == ["S52", "S53", "S54"]
+    document["filter"]["temporal"] = {"from": "2015", "to": "2019-06"}
+    assert ids(index.query(document)["sites"]) == ["S32", "S33", "S34", "S42", "S43", "S44"]
+
+def test_query_by_site_geometry():
+    index = grid_index()
+    result = index.query({"filter": {"site": {"codeSite": "S00"}}})
+    assert ids(result["sites"]) == ["S00"]
+    with pytest.raises(ValueError, match="not in the spatial index"):
+        index.query({"filter": {"site": {"codeSite": "XX"}}})
+
+def test_incremental_updates_survive_reopen(tmp_path):
+    index = grid_index(tmp_path, node_size=4)
+    query = [3.2, 3.2, 3.5, 3.5]
+    assert ids(index.intersects(query)) == ["S33"]
+    # Remove a packed entry, move another into the query area and add items
+    assert index.remove("site", "S33")
+    assert not index.remove("site", "S33")
+    index.add_site("S99", square(3.3, 3.3, 0.1), name="moved")
+    index.add_items({"features": [
+        {"id": "item-1", "collection": "cubes", "bbox": [3.0, 3.0, 4.0, 4.0],
+         "properties": {"datetime": "2020-05-01T00:00:00Z"}},
+        {"id": "item-2", "geometry": {"type": "Point", "coordinates": [8.5, 8.5]},
+         "properties": {"start_datetime": "2020-01-01", "end_datetime": "2020-12-31"}},
+    ]})
+    expected = [("item", "item-1"), ("site", "S99")]
+    assert [(m["kind"], m["id"]) for m in index.intersects(query)] == expected
+    assert index.intersects(query, start="2021", kinds=["site"])[0]["label"] == "moved"
+    assert len(index) == 101
+    index.close()
+
+    # Replayed from the update log
+    with SpatialIndex(tmp_path, node_size=4) as reopened:
+        assert [(m["kind"], m["id"]) for m in reopened.intersects(query)] == expected
+        assert len(reopened) == 101
+        reopened.checkpoint()
+    assert (tmp_path / "updates.ndjson").read_text() == ""
+    # Loaded from the checkpoint alone
+    with SpatialIndex(tmp_path, node_size=4) as reopened:
+        assert [(m["kind"], m["id"]) for m in reopened.intersects(query)] == expected
+
+def test_delta_is_merged_past_the_limit(tmp_path):
+    with SpatialIndex(tmp_path, delta_limit=5) as index:
+        for i in range(7):
+            index.add_site(f"S{i}", [i, 0, i + 0.5, 0.5])
+        assert len(index._delta) < 7
+        assert ids(index.intersects([0, 0, 10, 1])) == [f"S{i}" for i in range(7)]
+
+def test_time_bound_periods():
+    assert time_bound("2015-06") == time_bound("2015-06-01")
+    assert time_bound("2015-06", end=True) == pytest.approx(time_bound("2015-07-01") - 0.001)
+    assert time_bound("2016-02", end=True) == pytest.approx(time_bound("2016-03-01") - 0.001)
+    assert time_bound("2015", end=True) == pytest.approx(time_bound("2016-01-01") - 0.001)
+    assert time_bound(None) == -math.inf and time_bound("..", end=True) == math.inf
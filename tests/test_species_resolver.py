@@ -0,0 +1,44 @@
+import threading
+
+import species_identifier_resolverv2 as species
+
+class Resolver(species.SpeciesResolver):
+    """Resolver with the upstream lookups replaced, recording which chunks were submitted."""
+
+    def __init__(self):
+        super().__init__(policy_cache=None, verbose=False)
+        self.submitted = []
+        self.lock = threading.Lock()
+
+    def _resolve_policy_code(self, query):
+        with self.lock:
+            self.submitted.append(query)
+        return query.lower(), None
+
+    def _query_global_names_batch(self, names):
+        return {name: {"matched": name} for name in names}
+
+    def _query_gbif_and_checklistbank(self, name):
+        return {"usageKey": name}, {}
+
+    def _build_identity(self, query, name, policy_info, gbif_data, clb_data, gnv_data):
+        return query, gbif_data["usageKey"], gnv_data["matched"]
+
+def test_resolve_many_keeps_one_chunk_in_flight_ahead():
+    resolver = Resolver()
+    queries = [f"Q{i}" for i in range(7)]
+    results = resolver.resolve_many(queries, batch_size=3, max_workers=2)
+    seen = []
+    for identity in results:
+        if not seen:
+            # The second chunk is already submitted, the third is not
+            assert resolver.submitted == queries[:6]
+        seen.append(identity)
+    assert sorted(seen) == [(q, q.lower(), q.lower()) for q in queries]
+
+def test_resolve_many_stops_cleanly_when_the_caller_does():
+    resolver = Resolver()
+    results = resolver.resolve_many((f"Q{i}" for i in range(100)), batch_size=10, max_workers=2)
+    assert next(results)[0].startswith("Q")
+    results.close()
+    assert len(resolver.submitted) == 20
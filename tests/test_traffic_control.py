@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+from bmd_common import traffic_control
+from bmd_common.traffic_control import (AdaptiveConcurrency, CircuitBreaker, CircuitOpenError, HostController,
+                                        TokenBucket, retry_after_seconds)
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(traffic_control.time, "monotonic", clock)
+    monkeypatch.setattr(traffic_control.time, "sleep", lambda seconds: None)
+    return clock
+
+class Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = b"{}"
+
+class Session:
+    """Replays a list of statuses (None raises a transport error)."""
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        status = self.statuses.pop(0)
+        if status is None:
+            raise ConnectionError("reset")
+        return Response(status)
+
+class AsyncClient:
+    """Answers with status, or hangs when status is None."""
+
+    def __init__(self, status):
+        self.status = status
+
+    async def request(self, method, url, **kwargs):
+        if self.status is None:
+            await asyncio.sleep(60)
+        return Response(self.status)
+
+def test_token_bucket(clock):
+    bucket = TokenBucket(rate=2.0, burst=2)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.5]
+    clock.now += 1.5
+    assert bucket.reserve() == 0.0
+
+def test_circuit_breaker_opens_and_probes(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    clock.now += 10
+    assert breaker.state == "half-open"
+    assert breaker.allow() and not breaker.allow()    # a single probe
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+def test_adaptive_concurrency_is_aimd():
+    limit = AdaptiveConcurrency(initial=4, minimum=1, maximum=5)
+    limit.on_overload()
+    assert limit.limit == 2
+    for _ in range(20):
+        limit.on_success()
+    assert limit.limit == 5
+    for _ in range(5):
+        limit.on_overload()
+    assert limit.limit == 1
+
+def test_retry_after_seconds():
+    assert retry_after_seconds("3") == 3.0
+    assert retry_after_seconds("-1") == 0.0
+    assert retry_after_seconds("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert retry_after_seconds("soon") is None and retry_after_seconds(None) is None
+
+def test_retries_until_success(clock):
+    controller = HostController("example.org", rate=1000, burst=1000)
+    session = Session([503, None, 200])
+    assert controller.request(session, "GET", "https://example.org/").status_code == 200
+    assert session.calls == 3
+    assert controller.stats["retries"] == 2 and controller.stats["failures"] == 2
+    assert controller.breaker.state == "closed"
+
+def test_throttling_does_not_open_the_circuit(clock):
+    controller = HostController("example.org", rate=1000, burst=1000, failure_threshold=2, max_retries=3)
+    response = controller.request(Session([429, 429, 429, 429]), "GET", "https://example.org/")
+    assert response.status_code == 429                   # last response after the retries
+    assert controller.stats["throttled"] == 4 and controller.breaker.state == "closed"
+
+def test_open_circuit_rejects_requests(clock):
+    controller = HostController("example.org", rate=1000, burst=1000, failure_threshold=2, max_retries=1)
+    assert controller.request(Session([500, 500]), "GET", "https://example.org/").status_code == 500
+    session = Session([200])
+    with pytest.raises(CircuitOpenError):
+        controller.request(session, "GET", "https://example.org/")
+    assert session.calls == 0 and controller.stats["rejected"] == 1
+    clock.now += controller.settings["reset_timeout"]
+    assert controller.request(session, "GET", "https://example.org/").status_code == 200
+
+def test_cancelled_probe_releases_the_half_open_slot():
+    controller = HostController("example.org", rate=1000, burst=1000, failure_threshold=1,
+                                reset_timeout=0.05, max_retries=0)
+    url = "https://example.org/"
+
+    async def main():
+        await controller.request_async(AsyncClient(500), "GET", url)
+        assert controller.breaker.state == "open"
+        await asyncio.sleep(0.05)
+        # The probe hangs and its caller gives up
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(controller.request_async(AsyncClient(None), "GET", url), 0.01)
+        assert controller.breaker.state == "half-open"
+        return await controller.request_async(AsyncClient(200), "GET", url)
+
+    assert asyncio.run(main()).status_code == 200
+    assert controller.breaker.state == "closed"